@@ -13,17 +13,18 @@ if [ -f "$RESOLV_FILE" ]; then
     echo "Backup created at ${RESOLV_FILE}.backup"
 fi
 
-# Overwrite resolv.conf with new content
+# Overwrite resolv.conf with new content, the internal resolver first and the fallback after it if it answers
 echo "fixing DNS so that kublet will run without issues"
-cat <<EOF > "$RESOLV_FILE"
-nameserver 172.100.55.2
-nameserver 8.8.4.4
-search albrightlabs.local
-EOF
+NAMESERVERS="$(python3 "$(dirname "$0")/expiremental/manually/step_1/resolvers.py" 172.100.55.2 8.8.4.4 \
+    --search albrightlabs.local)"
+echo "$NAMESERVERS" > "$RESOLV_FILE"
 
 echo "Updated $RESOLV_FILE with new DNS configuration."
-echo "now reloading the dns"
-sudo systemctl restart systemd-resolved
+# Service restarts and enables are queued and applied once, before the runtime is needed;
+# lookups use the resolv.conf written above in the meantime
+SERVICES="$(dirname "$0")/expiremental/manually/step_1/services.py"
+echo "queueing the dns restart"
+sudo python3 "$SERVICES" restart systemd-resolved
 
 
 # Disable swap (Kubernetes requires swap to be off)
@@ -49,12 +50,9 @@ grep '/swap.img' /etc/fstab
 # echo "Verify the setting .... it should equal 1"
 # cat /proc/sys/net/ipv4/ip_forward
 # sysctl params required by setup, params persist across reboots
-cat <<EOF | sudo tee /etc/sysctl.d/k8s.conf
-net.ipv4.ip_forward = 1
-EOF
-
-# Apply sysctl params without reboot
-sudo sysctl --system
+# Applied without reboot: only values that differ are written, no `sysctl --system` reload
+sudo python3 "$(dirname "$0")/expiremental/manually/step_1/sysctl_manager.py" --file /etc/sysctl.d/k8s.conf \
+    net.ipv4.ip_forward=1
 
 # Verify that net.ipv4.ip_forward is set to 1 with
 sysctl net.ipv4.ip_forward
@@ -89,10 +87,9 @@ sed 's/SystemdCgroup = false/SystemdCgroup = true/' | \
 sed 's/sandbox_image = "registry.k8s.io\/pause:3.6"/sandbox_image = "registry.k8s.io\/pause:3.10"/' | \
 sudo tee /etc/containerd/config.toml
 
-# Now restart containerD to ensure it is working
-sudo systemctl restart containerd
-sudo systemctl status containerd
-sudo systemctl enable containerd
+# Restart containerD for its new configuration, together with the other queued services
+sudo python3 "$SERVICES" restart containerd
+sudo python3 "$SERVICES" enable containerd
 
 
 # # This script checks if /etc/crictl.yaml exists. If it doesn't, the script creates the file with the initial content.
@@ -128,10 +125,15 @@ sudo apt-get update
 K8S_VERSION="1.31.4-1.1"  # most stable kubernetes version that works wirh calico 
 sudo apt-get install -y kubelet=$K8S_VERSION kubeadm=$K8S_VERSION kubectl=$K8S_VERSION
 sudo apt-mark hold kubelet kubeadm kubectl
-sudo systemctl enable --now kubelet
+sudo python3 "$SERVICES" enable kubelet
 
-# We need to restart all services
-sleep 3
+# One `systemctl enable --now containerd kubelet`, then systemd-resolved and containerd restarted once each, in that order
+sudo python3 "$SERVICES" apply
+sudo systemctl status containerd
+
+# Wait for the container runtime to answer CRI calls instead of a fixed sleep
+WAITERS="$(dirname "$0")/expiremental/manually/step_1/waiters.py"
+sudo python3 "$WAITERS" cri --socket /run/containerd/containerd.sock
 echo "you should say yes to restarting all services"
 
 
@@ -162,8 +164,9 @@ sudo chown $(id -u):$(id -g) $HOME/.kube/config
 # 	--discovery-token-ca-cert-hash sha256:fcf0da56bf564a19b7e4bf02fda824c85b5d301cb7c21e0b90c3eca02214a448 
 
 
-#################################### YOu need to Reboot cause nothing really will work on the next steps #################
-# sudo reboot
+# No reboot needed: continue as soon as kubelet and the API server are up
+sudo python3 "$WAITERS" kubelet
+python3 "$WAITERS" apiserver
 
 # # Fixing the kube-system not seeing the needed files
 # sudo kubeadm init phase kubelet-start
@@ -172,8 +175,15 @@ sudo chown $(id -u):$(id -g) $HOME/.kube/config
 # Install Calico
 kubectl apply -f https://docs.projectcalico.org/manifests/calico.yaml
 
-# Restart Kublet to allow Calico to be configured
-sudo systemctl restart kubelet
+# Restart Kublet to allow Calico to be configured, its only restart of the run
+sudo python3 "$SERVICES" restart kubelet
+sudo python3 "$SERVICES" apply
+sudo python3 "$WAITERS" kubelet
+
+# Share one join token with the workers, who fetch it with JOIN_FROM=http://172.100.55.20:8782/ worker-node.sh.
+# It listens on the API server address and stops after 15 minutes (--serve-for). Or join them all from
+# here in parallel instead: join.py workers --concurrency 5
+# sudo python3 "$(dirname "$0")/expiremental/manually/step_1/join.py" serve --port 8782
 
 
 
@@ -2,6 +2,14 @@ import os
 import sys
 import subprocess
 
+# Reuse the CRI-O bundle and package layers from the step_1 scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "manually", "step_1"))
+import crio_build
+import packages
+
+# Manifest path or URL of a bundle made by `crio_build.py build`; installs it instead of building on this node
+CRIO_BUNDLE = os.environ.get("CRIO_BUNDLE")
+
 def check_root():
     if os.geteuid() != 0:
         print("This script must be run as root. Use 'sudo'.")
@@ -90,8 +98,26 @@ def clone_and_build_crio():
         print(f"Error building CRI-O from source: {e}")
         raise
 
+def install_crio_bundle():
+    print("Installing the prebuilt CRI-O bundle instead of building from source...")
+    try:
+        # Only the runtime dependencies, no compiler toolchain on this node
+        transaction = packages.PackageTransaction()
+        transaction.install(*crio_build.RUNTIME_PACKAGES)
+        if not transaction.commit():
+            raise RuntimeError("Failed to install the CRI-O runtime dependencies.")
+        crio_build.install_from(CRIO_BUNDLE)
+        print("CRI-O installed from the bundle.")
+    except Exception as e:
+        print(f"Error installing the CRI-O bundle: {e}")
+        raise
+
 def main():
     try:
+        if CRIO_BUNDLE:
+            install_crio_bundle()
+            print("Control plane setup completed successfully.")
+            return
         update_system_and_install_dependencies()
         ensure_make_installed()
         ensure_go_installed()
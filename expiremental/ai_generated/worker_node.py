@@ -1,4 +1,24 @@
+import os
 import subprocess
+import sys
+
+# Reuse the package layer from the step_1 scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "manually", "step_1"))
+import artifact_cache
+import journal
+import packages
+import prefetch
+import services
+import waiters
+
+# Set to the URL of `artifact_cache.py serve` to install from the fleet's package cache instead of upstream
+PACKAGE_CACHE_URL = os.environ.get("PACKAGE_CACHE_URL")
+
+# Package changes of this run, applied together by apply_package_changes()
+transaction = packages.PackageTransaction()
+
+# Downloads of the queued packages, running while the file level steps execute
+downloads = prefetch.Prefetch()
 
 def run_command(command, error_message):
     try:
@@ -10,14 +30,11 @@ def run_command(command, error_message):
 # Function to update the system and install prerequisites
 def update_system():
     print("Updating system and installing prerequisites...")
-    run_command(
-        "sudo apt-get update",
-        "Failed to update the system."
-    )
-    run_command(
-        "sudo apt-get install -y apt-transport-https ca-certificates curl software-properties-common",
-        "Failed to install prerequisites."
-    )
+    # The prerequisites are needed to add the repositories, so they get their own transaction
+    prerequisites = packages.PackageTransaction()
+    prerequisites.install("apt-transport-https", "ca-certificates", "curl", "software-properties-common")
+    if not prerequisites.commit():
+        raise RuntimeError("Failed to install prerequisites.")
 
 # Function to add the CRI-O repository
 def add_crio_repository():
@@ -41,13 +58,24 @@ def add_crio_repository():
         "Failed to add CRI-O version-specific repository."
     )
 
-# Function to install CRI-O
+# Function to point apt at the fleet's package cache
+def use_package_cache():
+    print("Using the package cache instead of the upstream repositories...")
+    artifact_cache.use_cache(PACKAGE_CACHE_URL)
+
+# Function to queue the CRI-O packages
 def install_crio():
-    print("Installing CRI-O...")
-    run_command("sudo apt-get update", "Failed to update system after adding CRI-O repository.")
-    run_command("sudo apt-get install -y cri-o cri-o-runc", "Failed to install CRI-O.")
-    run_command("sudo systemctl enable crio", "Failed to enable CRI-O service.")
-    run_command("sudo systemctl start crio", "Failed to start CRI-O service.")
+    print("Queueing CRI-O packages...")
+    transaction.install("cri-o", "cri-o-runc")
+
+# Function to start CRI-O once its packages are installed
+def start_crio():
+    print("Starting CRI-O...")
+    # One `systemctl enable --now crio` instead of an enable and a start
+    services.enable("crio")
+    services.apply()
+    # systemctl returns before CRI-O serves CRI calls
+    waiters.wait_for_cri(waiters.CRIO_SOCKET)
 
 # Function to add the Kubernetes repository
 def add_kubernetes_repository():
@@ -61,18 +89,24 @@ def add_kubernetes_repository():
         "Failed to add Kubernetes repository."
     )
 
-# Function to install Kubernetes components
+# Function to queue the Kubernetes components
 def install_kubernetes_components():
-    print("Installing kubeadm, kubectl, and kubelet...")
-    run_command("sudo apt-get update", "Failed to update system after adding Kubernetes repository.")
-    run_command(
-        "sudo apt-get install -y kubeadm kubectl kubelet",
-        "Failed to install Kubernetes components."
-    )
-    run_command(
-        "sudo apt-mark hold kubeadm kubectl kubelet",
-        "Failed to mark Kubernetes components as held."
-    )
+    print("Queueing kubeadm, kubectl, and kubelet...")
+    transaction.install("kubeadm", "kubectl", "kubelet")
+    transaction.hold("kubeadm", "kubectl", "kubelet")
+
+# Function to start downloading the queued packages once the repositories are known
+def prefetch_packages():
+    if not packages.refresh_index():
+        raise RuntimeError("Failed to refresh the package index.")
+    downloads.start(transaction.apt_arguments())
+
+# Function to install everything queued in one apt transaction, unpacking the prefetched packages
+def apply_package_changes():
+    downloads.wait()
+    print("Installing CRI-O, kubeadm, kubectl, and kubelet...")
+    if not transaction.commit(options=downloads.apt_options()):
+        raise RuntimeError("Failed to install CRI-O and Kubernetes components.")
 
 # Function to disable swap
 def disable_swap():
@@ -84,13 +118,26 @@ def disable_swap():
     )
 
 if __name__ == "__main__":
+    if os.geteuid() != 0:
+        print("This script must be run as root. Use 'sudo'.")
+        sys.exit(1)
+    # Steps completed before a failure are journalled; a re-run resumes at the failed step
+    if PACKAGE_CACHE_URL:
+        sources = [use_package_cache]
+    else:
+        sources = [add_crio_repository, add_kubernetes_repository]
+    # These only queue packages and start downloads, they must run again while apply_package_changes has not completed
+    queued = [install_crio, install_kubernetes_components, prefetch_packages]
     try:
-        update_system()
-        add_crio_repository()
-        install_crio()
-        add_kubernetes_repository()
-        install_kubernetes_components()
-        disable_swap()
+        # disable_swap runs while the packages download
+        journal.run_sequence(journal.Journal.for_script(__file__),
+                             [update_system, *sources, *queued, disable_swap, apply_package_changes, start_crio],
+                             always=dict.fromkeys(queued, apply_package_changes))
         print("Worker node setup complete!\nTo join the cluster, run the kubeadm join command provided during control plane initialization.")
     except Exception as e:
         print(f"Setup failed: {e}")
+        print("Run the script again to resume from the failed step.")
+        sys.exit(1)
+    finally:
+        # A step before the install failed; the download would outlive the script
+        downloads.cancel()
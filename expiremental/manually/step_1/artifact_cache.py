@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+
+import argparse
+import functools
+import gzip
+import hashlib
+import http.server
+import itertools
+import os
+import platform
+import re
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from command import run_command
+
+# Configuration
+STORE_DIR = "/var/cache/k8-provisions/debs"  # Content-addressed store, served as a flat apt repository
+CACHE_LIST = "/etc/apt/sources.list.d/k8-provisions-cache.list"  # Apt source pointing nodes at the cache
+CACHE_PREFERENCES = "/etc/apt/preferences.d/k8-provisions-cache"  # Makes apt prefer the cache over upstream
+CACHE_KEYRING = "/etc/apt/keyrings/k8-provisions-cache.gpg"  # Public key the cache's InRelease must be signed with
+CACHE_PIN_PRIORITY = 990  # Above upstream; only safe because apt checks the cache's signature
+SIGNING_HOME = "/var/lib/k8-provisions/cache-gnupg"  # GnuPG home holding the cache host's signing key
+SIGNING_UID = "k8-provisions package cache"
+KEY_FILE = "cache-key.gpg"  # Public signing key, served next to InRelease
+DEFAULT_PORT = 8780
+DOWNLOAD_WORKERS = 4
+
+# Pinned package set per upstream repository; None means the newest version upstream.
+# Dependencies found in the same upstream index (cri-tools, kubernetes-cni, conmon, ...) are fetched as well.
+# The index is only used once its hash matches the InRelease signed with 'key'. The key always
+# comes from the upstream itself, also when --upstream points the URL at a mirror.
+UPSTREAMS = {
+    "kubernetes": {
+        "url": "https://pkgs.k8s.io/core:/stable:/v1.31/deb/",
+        "key": "https://pkgs.k8s.io/core:/stable:/v1.31/deb/Release.key",
+        "release": "InRelease",
+        "index": "Packages",
+        "packages": {"kubelet": "1.31.4-1.1", "kubeadm": "1.31.4-1.1", "kubectl": "1.31.4-1.1"},
+    },
+    "cri-o": {
+        "url": "https://download.opensuse.org/repositories/devel:/kubic:/libcontainers:/stable:/cri-o:/1.28/xUbuntu_22.04/",
+        "key": "https://download.opensuse.org/repositories/devel:/kubic:/libcontainers:/stable:/cri-o:/1.28/xUbuntu_22.04/Release.key",
+        "release": "InRelease",
+        "index": "Packages",
+        "packages": {"cri-o": None},
+    },
+    "libcontainers": {
+        "url": "https://download.opensuse.org/repositories/devel:/kubic:/libcontainers:/stable/xUbuntu_22.04/",
+        "key": "https://download.opensuse.org/repositories/devel:/kubic:/libcontainers:/stable/xUbuntu_22.04/Release.key",
+        "release": "InRelease",
+        "index": "Packages",
+        "packages": {"cri-o-runc": None},
+    },
+    "docker": {
+        "url": "https://download.docker.com/linux/ubuntu/",
+        "key": "https://download.docker.com/linux/ubuntu/gpg",
+        "release": "dists/jammy/InRelease",
+        "index": "dists/jammy/stable/binary-{arch}/Packages",
+        "packages": {"containerd.io": None},
+    },
+}
+
+def dpkg_architecture():
+    """
+    Returns the Debian name of this machine's architecture.
+    """
+    machine = platform.machine()
+    return {"x86_64": "amd64", "aarch64": "arm64", "armv7l": "armhf"}.get(machine, machine)
+
+def _char_order(char):
+    if char is None:
+        return 0
+    if char == "~":
+        return -1
+    if char.isalpha():
+        return ord(char)
+    return ord(char) + 256
+
+def _compare_fragment(a, b):
+    """
+    Compares two upstream versions or revisions the way dpkg does.
+    """
+    while a or b:
+        a_text = re.match(r"\D*", a).group()
+        b_text = re.match(r"\D*", b).group()
+        for x, y in itertools.zip_longest(a_text, b_text):
+            if _char_order(x) != _char_order(y):
+                return -1 if _char_order(x) < _char_order(y) else 1
+        a, b = a[len(a_text):], b[len(b_text):]
+        a_number = re.match(r"\d*", a).group()
+        b_number = re.match(r"\d*", b).group()
+        if int(a_number or 0) != int(b_number or 0):
+            return -1 if int(a_number or 0) < int(b_number or 0) else 1
+        a, b = a[len(a_number):], b[len(b_number):]
+    return 0
+
+def compare_versions(a, b):
+    """
+    Compares two Debian package versions, returns -1, 0 or 1.
+    """
+    def split(version):
+        epoch, _, rest = version.partition(":") if ":" in version else ("0", "", version)
+        upstream, _, revision = rest.rpartition("-") if "-" in rest else (rest, "", "0")
+        return int(epoch), upstream, revision
+
+    a_epoch, a_upstream, a_revision = split(a)
+    b_epoch, b_upstream, b_revision = split(b)
+    if a_epoch != b_epoch:
+        return -1 if a_epoch < b_epoch else 1
+    return _compare_fragment(a_upstream, b_upstream) or _compare_fragment(a_revision, b_revision)
+
+def parse_packages_index(text):
+    """
+    Parses an apt Packages index into a list of (fields, stanza text).
+    """
+    entries = []
+    for stanza in re.split(r"\n\s*\n", text.strip()):
+        fields = {}
+        key = None
+        for line in stanza.splitlines():
+            if line[:1] in (" ", "\t") and key:
+                fields[key] += "\n" + line
+            elif ":" in line:
+                key, value = line.split(":", 1)
+                fields[key] = value.strip()
+        if "Package" in fields:
+            entries.append((fields, stanza.strip()))
+    return entries
+
+def dependency_names(fields):
+    """
+    Returns the alternatives of every Depends/Pre-Depends entry, as lists of package names.
+    """
+    groups = []
+    for field in ("Pre-Depends", "Depends"):
+        for entry in fields.get(field, "").split(","):
+            names = [alternative.strip().split(" ")[0].split(":")[0] for alternative in entry.split("|")]
+            names = [name for name in names if name]
+            if names:
+                groups.append(names)
+    return groups
+
+def fetch_url(url):
+    with urllib.request.urlopen(url, timeout=60) as response:
+        return response.read()
+
+def verify_release(signed, key):
+    """
+    Checks an InRelease file against an (armored or binary) signing key and returns the
+    signed text. Raises ValueError when the signature does not verify.
+    """
+    with tempfile.TemporaryDirectory() as home:
+        with open(os.path.join(home, "key"), "wb") as key_file:
+            key_file.write(key)
+        with open(os.path.join(home, "InRelease"), "wb") as release_file:
+            release_file.write(signed)
+        keyring = os.path.join(home, "keyring.gpg")
+        if not key.startswith(b"-----BEGIN"):
+            os.replace(os.path.join(home, "key"), keyring)
+        elif run_command(["gpg", "--homedir", home, "--batch", "--yes", "--dearmor", "-o", keyring,
+                          os.path.join(home, "key")]) is None:
+            raise ValueError("Could not read the signing key.")
+        if run_command(["gpgv", "--homedir", home, "--keyring", keyring, "--output", os.path.join(home, "Release"),
+                        os.path.join(home, "InRelease")]) is None:
+            raise ValueError("InRelease is not signed by the expected key.")
+        with open(os.path.join(home, "Release"), "r") as release_file:
+            return release_file.read()
+
+def release_hashes(release):
+    """
+    Returns the SHA256 section of a Release file as {path: sha256}.
+    """
+    hashes = {}
+    section = None
+    for line in release.splitlines():
+        if not line[:1].isspace():
+            section = line.split(":", 1)[0]
+        elif section == "SHA256" and len(line.split()) == 3:
+            sha256, _, path = line.split()
+            hashes[path] = sha256
+    return hashes
+
+def fetch_index(upstream, arch):
+    """
+    Downloads an upstream Packages index, preferring the compressed one, and checks it
+    against the upstream's signed InRelease.
+    """
+    release = verify_release(fetch_url(upstream["url"] + upstream["release"]), fetch_url(upstream["key"]))
+    hashes = release_hashes(release)
+    index = upstream["index"].format(arch=arch)
+    # Release lists its files relative to the directory it is in
+    relative = index[len(os.path.dirname(upstream["release"])):].lstrip("/")
+    try:
+        data, name = fetch_url(upstream["url"] + index + ".gz"), relative + ".gz"
+    except Exception:
+        data, name = fetch_url(upstream["url"] + index), relative
+    if hashlib.sha256(data).hexdigest() != hashes.get(name):
+        raise ValueError(f"{upstream['url']}{index} does not match the signed InRelease.")
+    return (gzip.decompress(data) if name.endswith(".gz") else data).decode()
+
+def resolve_packages(entries, wanted, arch):
+    """
+    Picks the stanza of every wanted package, plus the dependencies that live in the same index.
+    'wanted' maps package names to a pinned version or None for the newest.
+    """
+    by_name = {}
+    for fields, stanza in entries:
+        if fields.get("Architecture") in (arch, "all"):
+            by_name.setdefault(fields["Package"], []).append((fields, stanza))
+
+    selected = {}
+    queue = list(wanted.items())
+    while queue:
+        name, version = queue.pop(0)
+        if name in selected:
+            continue
+        candidates = by_name.get(name, [])
+        if version:
+            candidates = [entry for entry in candidates if entry[0]["Version"] == version]
+        if not candidates:
+            raise ValueError(f"{name}{'=' + version if version else ''} is not in the upstream index.")
+        fields, stanza = max(candidates, key=functools.cmp_to_key(lambda x, y: compare_versions(x[0]["Version"], y[0]["Version"])))
+        selected[name] = (fields, stanza)
+        for alternatives in dependency_names(fields):
+            # Anything not found upstream is expected to come from the distribution mirror
+            local = [alternative for alternative in alternatives if alternative in by_name]
+            if local and not any(alternative in selected for alternative in local):
+                queue.append((local[0], None))
+    return list(selected.values())
+
+def store_path(store, sha256):
+    return os.path.join(store, "sha256", sha256 + ".deb")
+
+def store_package(upstream, fields, stanza, store):
+    """
+    Downloads one package into the store unless a file with the same hash is there already.
+    Returns True when it had to be downloaded.
+    """
+    sha256 = fields["SHA256"]
+    path = store_path(store, sha256)
+    if os.path.exists(path):
+        return False
+    data = fetch_url(upstream["url"] + fields["Filename"])
+    if hashlib.sha256(data).hexdigest() != sha256:
+        raise ValueError(f"Checksum mismatch for {fields['Package']} {fields['Version']}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as deb:
+        deb.write(data)
+    os.replace(path + ".tmp", path)
+    # Keep the upstream stanza, pointing at the content-addressed file
+    control = re.sub(r"(?m)^Filename:.*$", f"Filename: sha256/{sha256}.deb", stanza)
+    with open(os.path.join(store, "sha256", sha256 + ".control"), "w") as control_file:
+        control_file.write(control + "\n")
+    return True
+
+def write_repository_index(store):
+    """
+    Writes Packages and Packages.gz for everything in the store.
+    """
+    directory = os.path.join(store, "sha256")
+    stanzas = []
+    for name in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+        if name.endswith(".control"):
+            with open(os.path.join(directory, name), "r") as control_file:
+                stanzas.append(control_file.read().strip())
+    index = "\n\n".join(stanzas) + "\n"
+    with open(os.path.join(store, "Packages"), "w") as packages_file:
+        packages_file.write(index)
+    with gzip.open(os.path.join(store, "Packages.gz"), "wt") as packages_file:
+        packages_file.write(index)
+    return len(stanzas)
+
+def signing_key(home=SIGNING_HOME):
+    """
+    Returns the fingerprint of the cache host's signing key, creating the key on first use.
+    """
+    os.makedirs(home, mode=0o700, exist_ok=True)
+    listing = run_command(["gpg", "--homedir", home, "--batch", "--with-colons", "--list-secret-keys"],
+                          ignore_errors=True)
+    if not listing:
+        if run_command(["gpg", "--homedir", home, "--batch", "--passphrase", "", "--quick-gen-key", SIGNING_UID,
+                        "ed25519", "sign", "never"]) is None:
+            raise RuntimeError("Could not create the package cache signing key.")
+        listing = run_command(["gpg", "--homedir", home, "--batch", "--with-colons", "--list-secret-keys"]) or ""
+    return key_fingerprints(listing)[0]
+
+def key_fingerprints(listing):
+    """
+    Returns the primary key fingerprints of a 'gpg --with-colons' listing.
+    """
+    fingerprints = []
+    primary = False
+    for line in listing.splitlines():
+        fields = line.split(":")
+        if fields[0] in ("pub", "sec", "sub", "ssb"):
+            primary = fields[0] in ("pub", "sec")
+        elif fields[0] == "fpr" and primary:
+            fingerprints.append(fields[9])
+            primary = False
+    return fingerprints
+
+def sign_repository(store, home=SIGNING_HOME):
+    """
+    Writes Release and InRelease for the store's Packages index, signed with the cache host's
+    key, and exports the public key next to them. Returns the key's fingerprint.
+    """
+    fingerprint = signing_key(home)
+    lines = ["Origin: k8-provisions", "Label: k8-provisions package cache",
+             "Date: " + time.strftime("%a, %d %b %Y %H:%M:%S UTC", time.gmtime()), "SHA256:"]
+    for name in ("Packages", "Packages.gz"):
+        with open(os.path.join(store, name), "rb") as index_file:
+            data = index_file.read()
+        lines.append(f" {hashlib.sha256(data).hexdigest()} {len(data)} {name}")
+    with open(os.path.join(store, "Release"), "w") as release_file:
+        release_file.write("\n".join(lines) + "\n")
+    if run_command(["gpg", "--homedir", home, "--batch", "--yes", "--local-user", fingerprint, "--clearsign",
+                    "-o", os.path.join(store, "InRelease"), os.path.join(store, "Release")]) is None:
+        raise RuntimeError("Could not sign the package cache.")
+    if run_command(["gpg", "--homedir", home, "--batch", "--yes", "--export", "-o", os.path.join(store, KEY_FILE),
+                    fingerprint]) is None:
+        raise RuntimeError("Could not export the package cache key.")
+    return fingerprint
+
+def fetch(upstreams=UPSTREAMS, store=STORE_DIR, arch=None):
+    """
+    Fetches every pinned package once into the store and refreshes the repository index.
+    """
+    arch = arch or dpkg_architecture()
+    jobs = []
+    for name, upstream in upstreams.items():
+        print(f"Resolving packages from {name}...")
+        entries = parse_packages_index(fetch_index(upstream, arch))
+        for fields, stanza in resolve_packages(entries, upstream["packages"], arch):
+            jobs.append((upstream, fields, stanza))
+
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+        downloaded = list(pool.map(lambda job: store_package(*job, store), jobs))
+    for (upstream, fields, stanza), fresh in zip(jobs, downloaded):
+        print(f"  {fields['Package']} {fields['Version']}: {'downloaded' if fresh else 'already cached'}")
+    count = write_repository_index(store)
+    fingerprint = sign_repository(store)
+    print(f"Package cache holds {count} package(s) in {store}, signed by {fingerprint}.")
+
+def make_server(store=STORE_DIR, bind="0.0.0.0", port=DEFAULT_PORT):
+    """
+    Returns an HTTP server that serves the store as a flat apt repository.
+    """
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=store)
+    return http.server.ThreadingHTTPServer((bind, port), handler)
+
+def use_cache(url, fingerprint):
+    """
+    Points apt on this node at the package cache and makes it preferred over the upstream repositories.
+    The cache's key is only installed when it has the given fingerprint, so apt rejects an
+    index that was not signed on the cache host.
+    """
+    url = url.rstrip("/") + "/"
+    host = re.sub(r"^\w+://([^/:]+).*$", r"\1", url)
+    fingerprint = fingerprint.replace(" ", "").upper()
+    print(f"Using the package cache at {url}...")
+    key = fetch_url(url + KEY_FILE)
+    with tempfile.TemporaryDirectory() as home:
+        with open(os.path.join(home, KEY_FILE), "wb") as key_file:
+            key_file.write(key)
+        listing = run_command(["gpg", "--homedir", home, "--batch", "--with-colons", "--show-keys",
+                               os.path.join(home, KEY_FILE)]) or ""
+    if key_fingerprints(listing) != [fingerprint]:
+        raise ValueError(f"The key served by {url} is not {fingerprint}.")
+    os.makedirs(os.path.dirname(CACHE_KEYRING), exist_ok=True)
+    with open(CACHE_KEYRING, "wb") as keyring_file:
+        keyring_file.write(key)
+    with open(CACHE_LIST, "w") as source_file:
+        source_file.write(f"deb [signed-by={CACHE_KEYRING}] {url} ./\n")
+    with open(CACHE_PREFERENCES, "w") as preferences_file:
+        preferences_file.write(f"Package: *\nPin: origin \"{host}\"\nPin-Priority: {CACHE_PIN_PRIORITY}\n")
+
+def main():
+    """
+    fetch: fill the store from upstream. serve: serve the store to the fleet. use: point this node at a cache.
+    """
+    parser = argparse.ArgumentParser(description="Local apt cache for the pinned kube and CRI-O packages.")
+    parser.add_argument("action", choices=["fetch", "serve", "use"])
+    parser.add_argument("--store", default=STORE_DIR, help="Content-addressed package store")
+    parser.add_argument("--upstream", action="append", default=[], metavar="NAME=URL",
+                        help="Replace the URL of an upstream repository, e.g. a local mirror")
+    parser.add_argument("--bind", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--url", help="Cache URL for 'use', e.g. http://192.168.1.30:8780/")
+    parser.add_argument("--fingerprint", help="Fingerprint of the cache's signing key for 'use', as printed by 'serve'")
+    args = parser.parse_args()
+
+    if args.action == "fetch":
+        upstreams = {name: dict(upstream) for name, upstream in UPSTREAMS.items()}
+        for override in args.upstream:
+            name, _, url = override.partition("=")
+            upstreams[name]["url"] = url.rstrip("/") + "/"
+        fetch(upstreams, args.store)
+    elif args.action == "serve":
+        write_repository_index(args.store)
+        fingerprint = sign_repository(args.store)
+        print(f"Serving {args.store} on http://{args.bind}:{args.port}/, signed by {fingerprint}")
+        make_server(args.store, args.bind, args.port).serve_forever()
+    else:
+        if not args.url or not args.fingerprint:
+            parser.error("'use' needs --url and --fingerprint")
+        use_cache(args.url, args.fingerprint)
+
+if __name__ == "__main__":
+    main()
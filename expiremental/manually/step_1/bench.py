@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+
+import argparse
+import fcntl
+import http.server
+import json
+import os
+import shlex
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+# Configuration
+BUNDLE_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.join(BUNDLE_DIR, "..", "..")
+SCRIPTS = {
+    "runMe1stOnControlPlane": os.path.join(BUNDLE_DIR, "runMe1stOnControlPlane.py"),
+    "runMeOnWorkerNodesOnly": os.path.join(BUNDLE_DIR, "runMeOnWorkerNodesOnly.py"),
+    "oneNicControlPlane": os.path.join(BUNDLE_DIR, "oneNicControlPlane.py"),
+    "control_python": os.path.join(REPO_DIR, "ai_generated", "control_python.py"),
+    "worker_node": os.path.join(REPO_DIR, "ai_generated", "worker_node.py"),
+    "upgrade": os.path.join(BUNDLE_DIR, "upgrade.py"),
+}
+SCRIPT_ARGUMENTS = {  # Run from the fake root's work directory
+    "upgrade": ["1.31.4-1.1", "--transport", "local", "--inventory", "../inventory", "--max-unavailable", "2"],
+}
+SCHEDULED_SCRIPTS = ["runMe1stOnControlPlane", "runMeOnWorkerNodesOnly", "oneNicControlPlane"]  # Honour PROVISION_JOBS
+BOUND_PATHS = ["/etc", "/var", "/proc/sys", "/proc/swaps"]  # Replaced by the fake root's copies
+
+# Commands replaced by stubs that only log, sleep for their latency and print canned output
+STUB_COMMANDS = [
+    "apt", "apt-get", "apt-key", "apt-mark", "dpkg", "ufw", "iptables-restore", "ip6tables-restore",
+    "sysctl", "hostnamectl", "ip", "kubeadm", "systemctl", "swapoff", "crictl", "ctr", "skopeo",
+    "curl", "gpg", "git", "make", "go", "netplan", "modprobe", "kubectl", "dpkg-query",
+]
+# Commands that are logged and then run for real; they only see the fake /etc and /var
+PASSTHROUGH_COMMANDS = ["sudo", "tee", "sed", "cp", "mv", "rm", "mkdir", "cat", "chmod", "ln"]
+DEFAULT_LATENCIES = {"apt": 0.5, "apt-get": 0.5, "kubeadm": 0.3, "make": 1.0, "git": 0.3, "default": 0.01}
+STUB_OUTPUTS = {  # Longest matching command prefix wins
+    "kubeadm config images list": "registry.k8s.io/kube-apiserver:v1.31.4\nregistry.k8s.io/pause:3.10",
+    "crictl": '{"images": []}',
+    "dpkg --print-architecture": "amd64",
+    "git describe": "v1.31.0",
+}
+
+RUNTIME_SOCKETS = {"crio": "/var/run/crio/crio.sock"}  # Only sockets under the bound /var
+KUBELET_HEALTHZ_PORT = 10248  # Answered once the kubelet stub was (re)started
+
+# Cluster the kubectl, kubeadm, dpkg-query and apt-get stubs simulate for upgrade.py: the
+# installed packages per host (LocalTransport sets PROVISION_HOST) and the kubelet version
+# each node reports after its uncordon. w1 is already upgraded, as after an interrupted run.
+CLUSTER_FILE = "/var/lib/bench-cluster.json"
+CLUSTER = {
+    "packages": {host: {name: "1.31.4-1.1" if host == "w1" else "1.30.0-1.1" for name in ["kubeadm", "kubelet", "kubectl"]}
+                 for host in ["cp1", "w1", "w2", "w3"]},
+    "nodes": {host: "v1.31.4" if host == "w1" else "v1.30.0" for host in ["cp1", "w1", "w2", "w3"]},
+    "cordoned": [],
+}
+INVENTORY = "[k8s-master]\ncp1\n\n[k8s-workers]\nw1\nw2\nw3\n"
+
+# Network the scripts see through netinspect: three adapters, two default routes to remove
+NETWORK_SNAPSHOT = {
+    "interfaces": [{"name": name, "index": index, "up": True} for index, name in enumerate(["ens34", "ens35", "ens36"], 2)],
+    "addresses": [{"interface": "ens34", "family": 4, "address": "10.0.0.10", "prefix": 24}],
+    "routes": [{"destination": "0.0.0.0", "prefix": 0, "gateway": gateway, "interface": interface, "metric": 100}
+               for interface, gateway in [("ens35", "192.168.79.1"), ("ens36", "192.168.69.1")]],
+}
+
+# Files a freshly installed node starts with
+SEED_FILES = {
+    "etc/hostname": "ubuntu\n",
+    "etc/hosts": "127.0.0.1 localhost\n",
+    "etc/resolv.conf": "nameserver 127.0.0.53\n",
+    "etc/fstab": "UUID=0000 / ext4 defaults 0 1\n/swap.img none swap sw 0 0\n",
+    "etc/sysctl.d/99-sysctl.conf": "",
+    "etc/ufw/ufw.conf": "ENABLED=no\n",
+    "etc/default/ufw": "IPV6=yes\n",
+    "etc/ufw/user.rules": "*filter\n### RULES ###\n\n### END RULES ###\nCOMMIT\n",
+    "etc/ufw/user6.rules": "*filter\n### RULES ###\n\n### END RULES ###\nCOMMIT\n",
+    "etc/apt/sources.list": "deb http://archive.ubuntu.com/ubuntu jammy main\n",
+    "etc/apt/sources.list.d/.keep": "",
+    "etc/netplan/.keep": "",
+    "var/lib/dpkg/status": "",
+    "proc/sys/net/ipv6/conf/all/disable_ipv6": "0\n",
+    "proc/sys/net/ipv6/conf/default/disable_ipv6": "0\n",
+    "proc/sys/net/ipv4/ip_forward": "0\n",
+    "proc/swaps": "Filename\tType\tSize\tUsed\tPriority\n/swap.img\tfile\t2097148\t0\t-2\n",
+    "network.json": json.dumps(NETWORK_SNAPSHOT),
+    CLUSTER_FILE.lstrip("/"): json.dumps(CLUSTER),
+    "inventory": INVENTORY,
+}
+
+def serve_socket(path):
+    """
+    Stands in for a started container runtime: a detached child listening on its CRI socket
+    until the sandbox goes away.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        os.remove(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    if os.fork() == 0:
+        os.setsid()
+        # Let go of the caller's pipes, or it would wait for this child to exit
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+        while True:
+            server.accept()[0].close()
+    server.close()
+
+def serve_healthz(port=KUBELET_HEALTHZ_PORT):
+    """
+    Stands in for a started kubelet: a detached child answering every GET with 200.
+    """
+    class HealthzHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(b"ok")
+
+        def log_message(self, *args):
+            pass
+
+    try:
+        server = http.server.HTTPServer(("127.0.0.1", port), HealthzHandler)
+    except OSError:
+        return  # Already answering, started for another simulated host
+    if os.fork() == 0:
+        os.setsid()
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+        server.serve_forever()
+    server.server_close()
+
+def simulate_cluster(name, args):
+    """
+    Updates and answers from CLUSTER_FILE for the commands upgrade.py runs. Returns the
+    output of the command, or None when the command is not part of the simulation.
+    """
+    host = os.environ.get("PROVISION_HOST", "cp1")
+    with open(CLUSTER_FILE, "r+") as cluster_file:
+        fcntl.flock(cluster_file, fcntl.LOCK_EX)
+        cluster = json.load(cluster_file)
+        before = json.dumps(cluster)
+        output = None
+        packages = cluster["packages"].setdefault(host, {})
+        if name == "dpkg-query" and args[:1] == ["-W"]:
+            output = packages.get(args[-1], "")
+        elif name == "apt-get" and "install" in args:
+            for argument in args:
+                package, _, version = argument.partition("=")
+                if version and package in packages:
+                    packages[package] = version
+            output = ""
+        elif name == "kubectl":
+            args = args[2:] if args[:1] == ["--kubeconfig"] else args
+            if args[:2] == ["get", "node"]:
+                output = cluster["nodes"].get(args[2], "")
+            elif args[:2] == ["get", "nodes"]:
+                output = json.dumps({"items": [{"metadata": {"name": node}, "status": {"conditions": [
+                    {"type": "Ready", "status": "True"}]}} for node in cluster["nodes"]]})
+            elif args[:1] in (["cordon"], ["drain"]):
+                cluster["cordoned"] = sorted(set(cluster["cordoned"]) | {args[1]})
+                output = ""
+            elif args[:1] == ["uncordon"]:
+                # Each simulated node reports the kubelet installed for the host of the same name
+                cluster["cordoned"].remove(args[1])
+                kubelet = cluster["packages"].get(args[1], {}).get("kubelet", "")
+                cluster["nodes"][args[1]] = "v" + kubelet.split("-")[0]
+                output = ""
+        if json.dumps(cluster) != before:
+            cluster_file.seek(0)
+            cluster_file.truncate()
+            json.dump(cluster, cluster_file)
+    return output
+
+def stub_main():
+    """
+    Entry point of every stub binary: logs the call, waits for the configured latency,
+    then prints the canned output or runs the real command.
+    """
+    name = os.path.basename(sys.argv[0])
+    with open(os.environ["BENCH_CONFIG"], "r") as config_file:
+        config = json.load(config_file)
+    entry = {"command": name, "args": sys.argv[1:], "start": time.time()}
+    with open(os.environ["BENCH_LOG"], "a") as log_file:
+        log_file.write(json.dumps(entry) + "\n")
+
+    latencies = config["latencies"]
+    time.sleep(latencies.get(name, latencies["default"]))
+    if name == "sudo":
+        os.execvp(sys.argv[1], sys.argv[1:])
+    if name in config["real"]:
+        os.execv(config["real"][name], [name] + sys.argv[1:])
+    if name == "git" and sys.argv[1:2] == ["clone"]:
+        os.makedirs(os.path.basename(sys.argv[-1]).removesuffix(".git"), exist_ok=True)
+    if name == "systemctl" and (sys.argv[1:2] in (["start"], ["restart"]) or sys.argv[1:3] == ["enable", "--now"]):
+        for unit in sys.argv[2:]:
+            if unit in RUNTIME_SOCKETS:
+                serve_socket(RUNTIME_SOCKETS[unit])
+            elif unit == "kubelet":
+                serve_healthz()
+    if name in ("kubectl", "dpkg-query", "apt-get") and os.path.exists(CLUSTER_FILE):
+        output = simulate_cluster(name, sys.argv[1:])
+        if output is not None:
+            if output:
+                print(output)
+            return
+
+    command = " ".join([name] + sys.argv[1:])
+    matches = [prefix for prefix in config["outputs"] if command.startswith(prefix)]
+    if matches:
+        print(config["outputs"][max(matches, key=len)])
+
+def make_root(latencies):
+    """
+    Creates a fake system root with the seed files, the stub binaries and their config.
+    """
+    root = tempfile.mkdtemp(prefix="provision-bench-")
+    for relative, content in SEED_FILES.items():
+        path = os.path.join(root, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as seed_file:
+            seed_file.write(content)
+    os.makedirs(os.path.join(root, "work"))
+
+    stubs = os.path.join(root, "stubs")
+    os.makedirs(stubs)
+    stub = os.path.join(stubs, "_stub")
+    with open(stub, "w") as stub_file:
+        stub_file.write(f"#!{sys.executable}\nimport sys\nsys.path.insert(0, {BUNDLE_DIR!r})\n"
+                        "import bench\nbench.stub_main()\n")
+    os.chmod(stub, 0o755)
+    for name in STUB_COMMANDS + PASSTHROUGH_COMMANDS:
+        os.symlink("_stub", os.path.join(stubs, name))
+
+    real = {name: shutil.which(name) for name in PASSTHROUGH_COMMANDS if name != "sudo"}
+    missing = [name for name, path in real.items() if path is None]
+    if missing:
+        raise RuntimeError(f"Not found on this machine: {', '.join(missing)}")
+    with open(os.path.join(root, "stubs.json"), "w") as config_file:
+        json.dump({"latencies": latencies, "outputs": STUB_OUTPUTS, "real": real}, config_file)
+
+    # Every python started in the sandbox, fleet's per-host ones included, sees the recorded network
+    site = os.path.join(root, "python")
+    os.makedirs(site)
+    with open(os.path.join(site, "sitecustomize.py"), "w") as site_file:
+        site_file.write(f"import sys\nsys.path.insert(0, {BUNDLE_DIR!r})\n"
+                        f"import bench\nbench.use_recorded_network({os.path.join(root, 'network.json')!r})\n")
+    return root
+
+def use_recorded_network(path):
+    """
+    Makes netinspect.snapshot() return the snapshot recorded at 'path' instead of reading
+    the sandbox's empty network namespace.
+    """
+    import netinspect  # Only here, so the stubs do not pay for it
+    netinspect.snapshot = lambda: netinspect.load(path)
+
+def snapshot(root):
+    """
+    Returns {path: (size, mtime)} of every file under the fake root except the harness's own.
+    """
+    files = {}
+    for directory, dirnames, filenames in os.walk(root):
+        if directory == root:
+            dirnames[:] = [name for name in dirnames if name != "stubs"]
+            filenames = [name for name in filenames if name not in ("stubs.json", "stub.log", "pids")]
+        for name in filenames:
+            path = os.path.join(directory, name)
+            stat = os.lstat(path)
+            files[path] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+def bytes_written(before, after):
+    """
+    Sums the sizes of the files that were created or changed.
+    """
+    return sum(size for path, (size, mtime) in after.items() if before.get(path) != (size, mtime))
+
+def sandbox_command(root, command):
+    """
+    Wraps a command so it runs in new mount, PID and network namespaces with the fake root
+    bound over /etc, /var, /proc/sys and /proc/swaps; probes of real servers fail at once. The PID of a last probe process tells how
+    many processes were created in the namespace.
+    """
+    # PATH only holds the stubs inside the sandbox, so the tools used here are called by full path
+    sh, mount, unshare, ip = (shutil.which(name) for name in ("sh", "mount", "unshare", "ip"))
+    mounts = " && ".join(f"{mount} --bind {shlex.quote(root + path)} {path}" for path in BOUND_PATHS)
+    # Loopback is down in a new network namespace; the kubelet healthz stub listens on it
+    script = (f"{mounts} && {ip} link set lo up && cd {shlex.quote(os.path.join(root, 'work'))} || exit 99\n"
+              f"{shlex.join(command)}\nrc=$?\n{sh} -c 'echo $$' > {shlex.quote(os.path.join(root, 'pids'))}\nexit $rc\n")
+    return [unshare, "--user", "--map-root-user", "--mount", "--pid", "--net", "--fork", "--mount-proc", sh, "-c", script]
+
+def sandbox_env(root, jobs):
+    env = {
+        "PATH": os.path.join(root, "stubs"),
+        "HOME": os.path.join(root, "work"),
+        "PYTHONDONTWRITEBYTECODE": "1",
+        "BENCH_CONFIG": os.path.join(root, "stubs.json"),
+        "BENCH_LOG": os.path.join(root, "stub.log"),
+        "PROVISION_WAIT_TIMEOUT": "1",  # The real clock may not be synchronised; do not wait for it
+        "PYTHONPATH": os.path.join(root, "python"),  # Holds the sitecustomize that fakes the network
+    }
+    if jobs:
+        env["PROVISION_JOBS"] = str(jobs)
+    return env
+
+def run_sandboxed(root, command, jobs=None, timeout=None):
+    """
+    Runs a command in the sandbox. Returns (returncode, output, wall seconds, last pid).
+    """
+    started = time.monotonic()
+    result = subprocess.run(sandbox_command(root, command), env=sandbox_env(root, jobs), stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, text=True, timeout=timeout)
+    wall = time.monotonic() - started
+    with open(os.path.join(root, "pids"), "r") as pids_file:
+        last_pid = int(pids_file.read())
+    return result.returncode, result.stdout, wall, last_pid
+
+def bench_script(name, latencies, jobs=None, timeout=None, keep=False):
+    """
+    Runs one script against a fresh fake root and measures it.
+    """
+    root = make_root(latencies)
+    try:
+        # The same wrapper around 'true' tells how many processes the harness itself costs
+        _, _, _, baseline_pid = run_sandboxed(root, ["true"])
+        before = snapshot(root)
+        command = [sys.executable, SCRIPTS[name], *SCRIPT_ARGUMENTS.get(name, [])]
+        returncode, output, wall, last_pid = run_sandboxed(root, command, jobs, timeout)
+        after = snapshot(root)
+        commands = []
+        if os.path.exists(os.path.join(root, "stub.log")):
+            with open(os.path.join(root, "stub.log"), "r") as log_file:
+                commands = [json.loads(line)["command"] for line in log_file]
+        return {"script": name, "mode": "sequential" if jobs == 1 else "parallel" if name in SCHEDULED_SCRIPTS else "-",
+                "returncode": returncode, "wall": wall, "forks": last_pid - baseline_pid + 1,
+                "commands": len(commands), "bytes_written": bytes_written(before, after), "output": output,
+                "root": root if keep else None}
+    finally:
+        if not keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+def run_benchmarks(names, latencies, repeat=1, timeout=None, keep=False):
+    """
+    Benchmarks every script, the scheduled ones both sequentially and in parallel.
+    Keeps the run with the median wall time of each script and mode.
+    """
+    results = []
+    for name in names:
+        for jobs in ([1, None] if name in SCHEDULED_SCRIPTS else [None]):
+            runs = sorted((bench_script(name, latencies, jobs, timeout, keep) for _ in range(repeat)), key=lambda r: r["wall"])
+            result = runs[len(runs) // 2]
+            result["walls"] = [run["wall"] for run in runs]
+            results.append(result)
+    return results
+
+def print_results(results, baseline=None):
+    """
+    Prints one line per script and mode, with the wall time change against a baseline run.
+    """
+    previous = {(r["script"], r["mode"]): r for r in baseline or []}
+    print(f"\n{'script':<24} {'mode':<11} {'wall':>8} {'forks':>6} {'cmds':>5} {'written':>9}  rc  change")
+    for result in results:
+        change = ""
+        before = previous.get((result["script"], result["mode"]))
+        if before:
+            change = f"{(result['wall'] - before['wall']) / before['wall'] * 100:+.0f}%"
+        print(f"{result['script']:<24} {result['mode']:<11} {result['wall']:7.2f}s {result['forks']:>6} "
+              f"{result['commands']:>5} {result['bytes_written']:>8}B {result['returncode']:>3}  {change}")
+    for result in results:
+        if result["root"]:
+            print(f"Fake root of {result['script']} ({result['mode']}) kept at {result['root']}")
+
+def regressions(results, baseline, tolerance):
+    """
+    Returns the results whose wall time grew more than 'tolerance' (0.2 = 20%) over the baseline.
+    """
+    previous = {(r["script"], r["mode"]): r for r in baseline}
+    return [r for r in results if (r["script"], r["mode"]) in previous
+            and r["wall"] > previous[(r["script"], r["mode"])]["wall"] * (1 + tolerance)]
+
+def parse_latency(value):
+    name, _, seconds = value.partition("=")
+    return name, float(seconds)
+
+def main():
+    """
+    Benchmarks the provisioning scripts against a throw-away fake root, no VM needed.
+    """
+    parser = argparse.ArgumentParser(description="Measure wall time, forks and bytes written of the provisioning scripts.")
+    parser.add_argument("scripts", nargs="*", help=f"Scripts to run (default: all of {', '.join(SCRIPTS)})")
+    parser.add_argument("--latency", action="append", type=parse_latency, default=[], metavar="COMMAND=SECONDS",
+                        help="Latency of a stub command, 'default' for all others")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per script, the median is reported")
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds before a script run is aborted")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare with results saved earlier and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed wall time growth over the baseline")
+    parser.add_argument("--keep", action="store_true", help="Keep the fake roots for inspection")
+    parser.add_argument("--verbose", action="store_true", help="Print the output of every script")
+    args = parser.parse_args()
+
+    unknown = set(args.scripts) - set(SCRIPTS)
+    if unknown:
+        print(f"Unknown script(s): {', '.join(sorted(unknown))}")
+        sys.exit(1)
+    if not shutil.which("unshare"):
+        print("The benchmark needs 'unshare' (util-linux) and user namespaces.")
+        sys.exit(1)
+    latencies = dict(DEFAULT_LATENCIES)
+    latencies.update(args.latency)
+    results = run_benchmarks(args.scripts or list(SCRIPTS), latencies, max(1, args.repeat), args.timeout, args.keep)
+
+    if args.verbose:
+        for result in results:
+            print(f"\n--- {result['script']} ({result['mode']}) ---\n{result['output'].strip()}")
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r") as baseline_file:
+            baseline = json.load(baseline_file)
+    print_results(results, baseline)
+    if args.save:
+        with open(args.save, "w") as save_file:
+            json.dump([{key: value for key, value in r.items() if key != "output"} for r in results], save_file, indent=2)
+    if baseline:
+        slower = regressions(results, baseline, args.tolerance)
+        for result in slower:
+            print(f"Regression: {result['script']} ({result['mode']}) is more than {args.tolerance:.0%} slower.")
+        if slower:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
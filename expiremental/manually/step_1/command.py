@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import collections
+import subprocess
+
+import tracing
+
+# Configuration
+STREAM_KEEP_LINES = 50  # Last lines of a streamed command kept for its error report
+
+def print_line(command, line):
+    """
+    Default sink of a streamed command: one console line, prefixed with the program name
+    so that steps running at the same time stay readable.
+    """
+    print(f"  [{command[0]}] {line}", flush=True)
+
+def run_command(command, ignore_errors=False, stream=False, on_line=None, keep_lines=STREAM_KEEP_LINES, env=None):
+    """
+    Runs a shell command and returns its output.
+    Handles errors if the command fails.
+    Every call is recorded as a tracing span with its exit code and output size.
+
+    With stream=True stdout and stderr are read line by line as the command runs and handed
+    to on_line(line) (printed by default), so long commands show progress and memory stays
+    flat. Only the last 'keep_lines' lines are kept; they are returned and shown on failure.
+    'env' replaces the environment of the command.
+    """
+    if stream:
+        on_line = on_line or (lambda line: print_line(command, line))
+        return stream_command(command, ignore_errors, on_line, keep_lines, env)
+    with tracing.span(" ".join(command), "command") as span:
+        try:
+            result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True,
+                                    env=env)
+            span.update(exit_code=0, output_bytes=len(result.stdout) + len(result.stderr))
+            return result.stdout.strip()
+        except subprocess.CalledProcessError as e:
+            span.update(exit_code=e.returncode, output_bytes=len(e.stdout or "") + len(e.stderr or ""),
+                        stderr=(e.stderr or "").strip()[-500:])
+            if not ignore_errors:
+                print(f"Error running command '{' '.join(command)}': {e.stderr.strip()}")
+            return None
+
+def stream_command(command, ignore_errors, on_line, keep_lines, env=None):
+    """
+    Streaming half of run_command().
+    """
+    last_lines = collections.deque(maxlen=keep_lines)
+    output_bytes = 0
+    with tracing.span(" ".join(command), "command", streamed=True) as span:
+        with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                              errors="replace", bufsize=1, env=env) as process:
+            for line in process.stdout:
+                output_bytes += len(line)
+                line = line.rstrip("\n")
+                last_lines.append(line)
+                on_line(line)
+        span.update(exit_code=process.returncode, output_bytes=output_bytes)
+        output = "\n".join(last_lines).strip()
+        if process.returncode != 0:
+            span["stderr"] = output[-500:]
+            if not ignore_errors:
+                print(f"Error running command '{' '.join(command)}' (exit {process.returncode}), last lines:\n{output}")
+            return None
+        return output
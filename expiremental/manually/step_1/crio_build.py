@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import fleet
+import packages
+from artifact_cache import dpkg_architecture, fetch_url, make_server
+from command import run_command
+
+# Configuration
+CRIO_REPOSITORY = "https://github.com/cri-o/cri-o.git"
+BUILD_ROOT = "/var/cache/k8-provisions/crio-build"  # Source checkout plus Go module and build caches, kept between builds
+ARTIFACT_DIR = "/var/cache/k8-provisions/crio-artifacts"  # One bundle and manifest per tag, commit and architecture
+INSTALLED_MANIFEST = os.path.join(packages.STATE_DIR, "crio-bundle.json")  # Manifest of the bundle installed on a node
+INSTALL_TARGETS = ["install.bin", "install.config", "install.systemd"]  # Parts of `make install` that end up in the bundle
+INSTALL_PREFIX = "/usr/local"  # Same prefix `sudo make install` uses
+DEFAULT_PORT = 8781
+# Runtime libraries and helpers the crio binary needs, by their names in the stock Ubuntu archive
+# (containers-common and cri-o-runc only exist in the kubic repo); the build toolchain stays on the build host
+RUNTIME_PACKAGES = ["conmon", "golang-github-containers-common", "runc", "libgpgme11", "libseccomp2"]
+
+def remote_tags(repository=CRIO_REPOSITORY):
+    """
+    Returns {tag: commit} of the released versions in the repository, without cloning it.
+    """
+    output = run_command(["git", "ls-remote", "--tags", repository])
+    if output is None:
+        raise RuntimeError(f"Could not list the tags of {repository}.")
+    tags = {}
+    for line in output.splitlines():
+        commit, ref = line.split()
+        match = re.fullmatch(r"refs/tags/(v\d+\.\d+\.\d+)(\^\{\})?", ref)
+        # Annotated tags list the tag object and, with ^{}, the commit it points to
+        if match and (match.group(2) or match.group(1) not in tags):
+            tags[match.group(1)] = commit
+    return tags
+
+def latest_tag(tags):
+    return max(tags, key=lambda tag: tuple(int(part) for part in tag[1:].split(".")))
+
+def artifact_key(tag, commit, arch):
+    return f"cri-o-{tag}-{commit[:12]}-{arch}"
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as bundle_file:
+        for chunk in iter(lambda: bundle_file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_manifest(path):
+    try:
+        with open(path, "r") as manifest_file:
+            return json.load(manifest_file)
+    except FileNotFoundError:
+        return None
+
+def checkout(tag, commit, source_dir):
+    """
+    Fetches just the tag into the persistent checkout and resets the tree to its commit.
+    """
+    if not os.path.isdir(os.path.join(source_dir, ".git")):
+        os.makedirs(source_dir, exist_ok=True)
+        if run_command(["git", "-C", source_dir, "init", "-q"]) is None:
+            raise RuntimeError(f"Could not create {source_dir}.")
+        run_command(["git", "-C", source_dir, "remote", "add", "origin", CRIO_REPOSITORY])
+    steps = [
+        ["git", "-C", source_dir, "fetch", "--depth", "1", "origin", f"refs/tags/{tag}:refs/tags/{tag}"],
+        ["git", "-C", source_dir, "checkout", "--force", "--detach", commit],
+        ["git", "-C", source_dir, "clean", "-fdxq"],
+    ]
+    for command in steps:
+        if run_command(command, stream=True) is None:
+            raise RuntimeError(f"Could not check out {tag} ({commit}).")
+
+def build_environment(build_root):
+    """
+    Go settings that keep downloaded modules and compiled packages between builds.
+    """
+    return dict(os.environ, GOMODCACHE=os.path.join(build_root, "gomod"), GOCACHE=os.path.join(build_root, "gocache"))
+
+def pack(staging, bundle):
+    """
+    Writes the staged tree as a tar.gz with stable ordering and ownership.
+    """
+    def normalise(info):
+        info.uid = info.gid = 0
+        info.uname = info.gname = "root"
+        return info
+
+    with tarfile.open(bundle, "w:gz") as archive:
+        for directory, dirnames, filenames in os.walk(staging):
+            dirnames.sort()
+            for name in sorted(filenames):
+                path = os.path.join(directory, name)
+                archive.add(path, arcname=os.path.relpath(path, staging), filter=normalise)
+
+def build(tag=None, build_root=BUILD_ROOT, artifact_dir=ARTIFACT_DIR):
+    """
+    Builds a CRI-O tag (the latest release by default) once and publishes it as a checksummed
+    bundle. Returns the path of its manifest; an existing bundle for the same key is reused.
+    """
+    tags = remote_tags()
+    tag = tag or latest_tag(tags)
+    if tag not in tags:
+        raise RuntimeError(f"CRI-O has no tag {tag}.")
+    key = artifact_key(tag, tags[tag], dpkg_architecture())
+    manifest_path = os.path.join(artifact_dir, key + ".json")
+    manifest = load_manifest(manifest_path)
+    if manifest and os.path.exists(os.path.join(artifact_dir, manifest["bundle"])) \
+            and file_sha256(os.path.join(artifact_dir, manifest["bundle"])) == manifest["sha256"]:
+        print(f"{key} is already built.")
+        return manifest_path
+
+    print(f"Building {key}...")
+    source_dir = os.path.join(build_root, "src")
+    checkout(tag, tags[tag], source_dir)
+    env = build_environment(build_root)
+    staging = tempfile.mkdtemp(prefix="crio-staging-")
+    try:
+        make = ["make", "-C", source_dir]
+        if run_command(make + [f"-j{os.cpu_count() or 1}"], stream=True, env=env) is None:
+            raise RuntimeError(f"Building {key} failed.")
+        if run_command(make + INSTALL_TARGETS + [f"DESTDIR={staging}", f"PREFIX={INSTALL_PREFIX}"],
+                       stream=True, env=env) is None:
+            raise RuntimeError(f"Staging {key} failed.")
+        os.makedirs(artifact_dir, exist_ok=True)
+        bundle = key + ".tar.gz"
+        pack(staging, os.path.join(artifact_dir, bundle + ".tmp"))
+        os.replace(os.path.join(artifact_dir, bundle + ".tmp"), os.path.join(artifact_dir, bundle))
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    sha256 = file_sha256(os.path.join(artifact_dir, bundle))
+    manifest = {"key": key, "tag": tag, "commit": tags[tag], "arch": dpkg_architecture(),
+                "bundle": bundle, "sha256": sha256, "built": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+    with open(os.path.join(artifact_dir, bundle + ".sha256"), "w") as checksum_file:
+        checksum_file.write(f"{sha256}  {bundle}\n")
+    with open(manifest_path + ".tmp", "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    print(f"Published {bundle} ({sha256}).")
+    return manifest_path
+
+def installed_key():
+    manifest = load_manifest(INSTALLED_MANIFEST)
+    return manifest["key"] if manifest else None
+
+def print_installed():
+    """
+    Runs on a node: prints the key of the installed bundle as JSON.
+    """
+    print(json.dumps(installed_key()))
+
+def safe_members(archive):
+    for member in archive.getmembers():
+        if member.name.startswith("/") or ".." in member.name.split("/") or not (member.isfile() or member.isdir()):
+            raise RuntimeError(f"Refusing to extract {member.name} from the bundle.")
+        yield member
+
+def install_bundle(bundle, manifest, root="/"):
+    """
+    Runs on a node: verifies the bundle against its manifest and unpacks it into the system.
+    Does nothing when the same bundle is installed already. Returns True if it installed.
+    """
+    if installed_key() == manifest["key"]:
+        print(f"{manifest['key']} is already installed.")
+        return False
+    if file_sha256(bundle) != manifest["sha256"]:
+        raise RuntimeError(f"{bundle} does not match the checksum of {manifest['key']}.")
+    print(f"Installing {manifest['key']}...")
+    with tarfile.open(bundle, "r:gz") as archive:
+        archive.extractall(root, members=safe_members(archive))
+    if run_command(["systemctl", "daemon-reload"]) is None:
+        raise RuntimeError(f"systemctl daemon-reload failed after installing {manifest['key']}.")
+    os.makedirs(os.path.dirname(INSTALLED_MANIFEST), exist_ok=True)
+    with open(INSTALLED_MANIFEST, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    return True
+
+def install_from(source):
+    """
+    Installs the bundle a manifest describes. 'source' is a manifest path or URL; the bundle
+    is expected next to it.
+    """
+    if re.match(r"^https?://", source):
+        manifest = json.loads(fetch_url(source))
+        with tempfile.NamedTemporaryFile(suffix=".tar.gz") as bundle_file:
+            bundle_file.write(fetch_url(source.rsplit("/", 1)[0] + "/" + manifest["bundle"]))
+            bundle_file.flush()
+            return install_bundle(bundle_file.name, manifest)
+    manifest = load_manifest(source)
+    if manifest is None:
+        raise RuntimeError(f"No CRI-O manifest at {source}.")
+    return install_bundle(os.path.join(os.path.dirname(source), manifest["bundle"]), manifest)
+
+def distribute_to_host(host, manifest, transport, artifact_dir=ARTIFACT_DIR):
+    """
+    Copies the bundle to a host and installs it there unless it is installed already.
+    Returns True when the host was changed.
+    """
+    transport.prepare(host)
+    try:
+        returncode, output = transport.run(host, "import crio_build\ncrio_build.print_installed()")
+        if returncode != 0:
+            raise RuntimeError(output.strip())
+        if json.loads(output.strip().splitlines()[-1]) == manifest["key"]:
+            return False
+        transport.put(host, os.path.join(artifact_dir, manifest["bundle"]), manifest["bundle"])
+        returncode, output = transport.run(host, f"import crio_build\ncrio_build.install_bundle({manifest['bundle']!r}, {manifest!r})")
+        if returncode != 0:
+            raise RuntimeError(output.strip())
+        return True
+    finally:
+        transport.cleanup(host)
+
+def distribute(hosts, manifest_path, transport, concurrency=fleet.DEFAULT_CONCURRENCY):
+    """
+    Installs a built bundle on all hosts in parallel.
+    """
+    manifest = load_manifest(manifest_path)
+    if manifest is None:
+        raise RuntimeError(f"No CRI-O manifest at {manifest_path}. Run 'crio_build.py build' first.")
+
+    def run(host):
+        try:
+            changed = distribute_to_host(host, manifest, transport, os.path.dirname(manifest_path))
+            fleet.log(host["name"], f"installed {manifest['key']}" if changed else "already installed, skipped")
+            return True
+        except Exception as e:
+            fleet.log(host["name"], f"CRI-O install failed: {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        return all(pool.map(run, hosts))
+
+def newest_manifest(artifact_dir=ARTIFACT_DIR):
+    manifests = [os.path.join(artifact_dir, name) for name in os.listdir(artifact_dir) if name.endswith(".json")]
+    if not manifests:
+        raise RuntimeError(f"No CRI-O bundle in {artifact_dir}. Run 'crio_build.py build' first.")
+    return max(manifests, key=os.path.getmtime)
+
+def main():
+    """
+    build: compile a tag once. serve: serve the bundles. distribute: install on a group. install: install here.
+    """
+    parser = argparse.ArgumentParser(description="Build CRI-O once and install the same bundle on every node.")
+    parser.add_argument("action", choices=["build", "serve", "distribute", "install"])
+    parser.add_argument("--tag", help="CRI-O tag to build, e.g. v1.31.3 (default: latest release)")
+    parser.add_argument("--manifest", help="Manifest path or URL for 'install' and 'distribute' (default: newest build)")
+    parser.add_argument("--build-root", default=BUILD_ROOT)
+    parser.add_argument("--artifact-dir", default=ARTIFACT_DIR)
+    parser.add_argument("--bind", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--inventory", default=fleet.DEFAULT_INVENTORY)
+    parser.add_argument("--group", default="k8s-workers")
+    parser.add_argument("--concurrency", type=int, default=fleet.DEFAULT_CONCURRENCY)
+    parser.add_argument("--user", default=fleet.DEFAULT_USER)
+    parser.add_argument("--key-file", default=fleet.DEFAULT_KEY_FILE)
+    args = parser.parse_args()
+
+    try:
+        if args.action == "build":
+            build(args.tag, args.build_root, args.artifact_dir)
+        elif args.action == "serve":
+            print(f"Serving {args.artifact_dir} on http://{args.bind}:{args.port}/")
+            make_server(args.artifact_dir, args.bind, args.port).serve_forever()
+        elif args.action == "install":
+            install_from(args.manifest or newest_manifest(args.artifact_dir))
+        else:
+            hosts = fleet.parse_inventory(args.inventory).get(args.group, [])
+            transport = fleet.SshTransport(user=args.user, key_file=args.key_file)
+            if not distribute(hosts, args.manifest or newest_manifest(args.artifact_dir), transport, args.concurrency):
+                sys.exit(1)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
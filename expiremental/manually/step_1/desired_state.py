@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+
+# Cheap readers for the state the provisioning steps converge. They only read files
+# wherever possible so the check phase of a converged node costs next to nothing.
+
+def fingerprint(*parts):
+    """
+    Hashes any JSON-serialisable values into a short stable fingerprint.
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+def read_file(path):
+    """
+    Returns the content of a file, or None if it does not exist.
+    """
+    try:
+        with open(path, "r") as state_file:
+            return state_file.read()
+    except FileNotFoundError:
+        return None
+
+def file_sha256(path):
+    """
+    Returns the sha256 of a file, or None if it does not exist.
+    """
+    try:
+        with open(path, "rb") as state_file:
+            return hashlib.sha256(state_file.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+def file_has_lines(path, lines):
+    """
+    True when every line is present in the file, ignoring surrounding whitespace.
+    """
+    present = {line.strip() for line in (read_file(path) or "").splitlines()}
+    return all(line.strip() in present for line in lines)
+
+def sysctl_value(key):
+    """
+    Reads a kernel setting straight from /proc/sys, e.g. "net.ipv4.ip_forward".
+    Returns None if the key does not exist.
+    """
+    value = read_file(os.path.join("/proc/sys", key.replace(".", "/")))
+    return None if value is None else " ".join(value.split())
+
+def swap_active():
+    """
+    True when any swap device or file is in use.
+    """
+    return len((read_file("/proc/swaps") or "").strip().splitlines()) > 1
+
+def fstab_swap_entries(fstab="/etc/fstab"):
+    """
+    Returns the active (not commented out) swap lines of fstab.
+    """
+    return [line for line in (read_file(fstab) or "").splitlines()
+            if "swap" in line and not line.lstrip().startswith("#")]
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+
+# Configuration
+DPKG_STATUS = "/var/lib/dpkg/status"  # dpkg's database of installed packages
+CONTAINERD_SOCKET = "/run/containerd/containerd.sock"  # CRI socket of containerd
+CRIO_SOCKET = "/var/run/crio/crio.sock"  # CRI socket of CRI-O
+
+class Discovery:
+    """
+    Answers "is X installed, which version, where is it" from one scan of PATH and one
+    parse of the dpkg status file, without spawning a process. The status file is parsed
+    again when its mtime changes, PATH is scanned again when it or the mtime of one of its
+    directories changes, so binaries installed without dpkg show up too.
+    """
+
+    def __init__(self, status_file=DPKG_STATUS, path=None):
+        self.status_file = status_file
+        self.path = path
+        self.mtime = None
+        self.path_key = None
+        self.installed = {}
+        self.binaries = {}
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        mtime = modified(self.status_file)
+        path = self.path if self.path is not None else os.environ.get("PATH", "")
+        path_key = (path, [modified(directory or ".") for directory in path.split(os.pathsep)])
+        with self.lock:
+            if mtime != self.mtime:
+                self.installed = parse_dpkg_status(self.status_file) if mtime else {}
+                self.mtime = mtime
+            if path_key != self.path_key:
+                self.binaries = scan_path(path)
+                self.path_key = path_key
+
+    def which(self, name):
+        """
+        Returns the full path of an executable on PATH, or None.
+        """
+        self.refresh()
+        return self.binaries.get(name)
+
+    def version(self, package):
+        """
+        Returns the installed version of a package, or None if it is not installed.
+        """
+        self.refresh()
+        entry = self.installed.get(package)
+        return entry["version"] if entry else None
+
+    def is_installed(self, package):
+        return self.version(package) is not None
+
+    def packages(self):
+        """
+        Returns {package: {"version": ..., "architecture": ...}} for every installed package.
+        """
+        self.refresh()
+        return dict(self.installed)
+
+def modified(path):
+    """
+    mtime of a file or directory in nanoseconds, 0 when it does not exist.
+    """
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+def parse_dpkg_status(status_file):
+    """
+    Parses the dpkg status file into {package: {"version", "architecture"}}, keeping
+    only packages that are fully installed.
+    """
+    installed = {}
+    with open(status_file, "r", errors="replace") as status:
+        fields = {}
+        for line in status.read().split("\n") + [""]:
+            if not line.strip():
+                if fields.get("Status", "").endswith(" installed") and "Package" in fields:
+                    installed[fields["Package"]] = {"version": fields.get("Version"),
+                                                    "architecture": fields.get("Architecture")}
+                fields = {}
+            elif not line[0].isspace() and ":" in line:
+                key, value = line.split(":", 1)
+                fields[key] = value.strip()
+    return installed
+
+def scan_path(path):
+    """
+    Maps every executable name on PATH to its full path, earlier directories win.
+    """
+    binaries = {}
+    for directory in path.split(os.pathsep):
+        try:
+            entries = os.scandir(directory or ".")
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.name not in binaries and entry.is_file() and os.access(entry.path, os.X_OK):
+                    binaries[entry.name] = entry.path
+    return binaries
+
+# Shared index for the step scripts
+index = Discovery()
+
+def which(name):
+    return index.which(name)
+
+def package_version(package):
+    return index.version(package)
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import socket
+import stat
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# This file also runs on the nodes on its own, as the code of node_code(); only the
+# fleet side needs the rest of the bundle.
+try:
+    import fleet
+except ImportError:
+    fleet = None
+
+# Configuration
+CACHE_DIR = "/var/cache/k8-provisions/facts"  # One JSON file per host
+DEFAULT_TTL = 600  # Seconds cached facts are used without asking the host again
+DEFAULT_CONCURRENCY = 20  # Hosts asked at the same time
+FACTS_MARKER = "@@facts@@ "  # Prefix of the line a node prints its facts on
+KUBE_PACKAGES = ["kubeadm", "kubelet", "kubectl", "cri-o", "containerd", "containerd.io"]
+KUBE_MODULES = ["overlay", "br_netfilter"]
+KUBE_PORTS = [2379, 2380, 6443, 10250, 10257, 10259]  # Taken by the cluster once it runs
+RUNTIME_SOCKETS = {"containerd": "/run/containerd/containerd.sock", "crio": "/var/run/crio/crio.sock"}
+DISK_PATHS = ["/", "/var/lib"]
+MIN_FREE_GB = 10  # Below this preflight reports the disk
+
+def read(path):
+    try:
+        with open(path) as fact_file:
+            return fact_file.read()
+    except OSError:
+        return ""
+
+def listening_ports():
+    """
+    TCP ports in LISTEN state, from /proc/net/tcp and tcp6.
+    """
+    ports = set()
+    for path in ("/proc/net/tcp", "/proc/net/tcp6"):
+        for line in read(path).splitlines()[1:]:
+            fields = line.split()
+            if len(fields) > 3 and fields[3] == "0A":
+                ports.add(int(fields[1].rsplit(":", 1)[1], 16))
+    return sorted(ports)
+
+def package_versions(names=KUBE_PACKAGES, status_file="/var/lib/dpkg/status"):
+    """
+    Installed versions of the packages, read from dpkg's status file.
+    """
+    versions = {}
+    for stanza in read(status_file).split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in stanza.splitlines() if ": " in line and not line.startswith(" "))
+        if fields.get("Package") in names and fields.get("Status") == "install ok installed":
+            versions[fields["Package"]] = fields.get("Version")
+    return versions
+
+def running_runtimes():
+    runtimes = []
+    for name, path in RUNTIME_SOCKETS.items():
+        try:
+            if stat.S_ISSOCK(os.stat(path).st_mode):
+                runtimes.append(name)
+        except OSError:
+            pass
+    return runtimes
+
+def free_gb(path):
+    try:
+        usage = os.statvfs(path)
+    except OSError:
+        return None
+    return round(usage.f_bavail * usage.f_frsize / 1024**3, 1)
+
+def collect():
+    """
+    Gathers the node's facts from /proc, /sys and dpkg's status file, without running
+    any command.
+    """
+    swaps = read("/proc/swaps").strip().splitlines()[1:]
+    fstab_swaps = [line for line in read("/etc/fstab").splitlines() if "swap" in line and not line.lstrip().startswith("#")]
+    return {
+        "hostname": socket.gethostname(),
+        "kernel": os.uname().release,
+        "swap": {"active": len(swaps), "fstab": len(fstab_swaps)},
+        "ipv6_disabled": read("/proc/sys/net/ipv6/conf/all/disable_ipv6").strip() == "1",
+        "ip_forward": read("/proc/sys/net/ipv4/ip_forward").strip() == "1",
+        "modules": {name: os.path.isdir(f"/sys/module/{name}") for name in KUBE_MODULES},
+        "ports": listening_ports(),
+        "packages": package_versions(),
+        "runtimes": running_runtimes(),
+        "free_gb": {path: free_gb(path) for path in DISK_PATHS},
+    }
+
+def emit():
+    print(FACTS_MARKER + json.dumps(collect()), flush=True)
+
+def node_code():
+    """
+    Python code that prints the facts of the node it runs on. It carries this whole file,
+    so the host needs neither the bundle nor a second round trip.
+    """
+    with open(os.path.abspath(__file__)) as source_file:
+        source = source_file.read()
+    return (f"import types\nfacts = types.ModuleType('facts')\nfacts.__file__ = 'facts.py'\n"
+            f"exec({source!r}, facts.__dict__)\nfacts.emit()\n")
+
+def cache_path(name, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, name.replace("/", "_") + ".json")
+
+def cached(name, ttl=DEFAULT_TTL, cache_dir=CACHE_DIR):
+    """
+    Returns the cached facts of a host while they are younger than ttl, else None.
+    """
+    try:
+        with open(cache_path(name, cache_dir)) as cache_file:
+            entry = json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+    return entry["facts"] if time.time() - entry["collected"] < ttl else None
+
+def store(name, host_facts, cache_dir=CACHE_DIR):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(name, cache_dir)
+    with open(path + ".tmp", "w") as cache_file:
+        json.dump({"collected": time.time(), "facts": host_facts}, cache_file)
+    os.replace(path + ".tmp", path)
+
+def parse_output(output):
+    for line in output.splitlines():
+        if line.startswith(FACTS_MARKER):
+            return json.loads(line[len(FACTS_MARKER):])
+    return None
+
+def gather(hosts, transport, ttl=DEFAULT_TTL, refresh=False, concurrency=DEFAULT_CONCURRENCY, cache_dir=CACHE_DIR):
+    """
+    Returns {host name: facts}, from the cache where it is fresh and otherwise with one
+    round trip per host, all hosts at the same time. Unreachable hosts get {"error": ...}.
+    """
+    code = node_code()
+
+    def host_facts(host):
+        name = host["name"]
+        if not refresh:
+            found = cached(name, ttl, cache_dir)
+            if found is not None:
+                return found
+        try:
+            returncode, output = transport.run_once(host, code)
+        except Exception as e:
+            return {"error": str(e)}
+        found = parse_output(output) if returncode == 0 else None
+        if found is None:
+            return {"error": output.strip().splitlines()[-1] if output.strip() else f"exit code {returncode}"}
+        store(name, found, cache_dir)
+        return found
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(hosts) or 1))) as pool:
+        return dict(zip((host["name"] for host in hosts), pool.map(host_facts, hosts)))
+
+def problems(host_facts):
+    """
+    What would stop kubeadm on this host, from its facts alone.
+    """
+    if "error" in host_facts:
+        return [f"unreachable: {host_facts['error']}"]
+    found = []
+    if host_facts["swap"]["active"] or host_facts["swap"]["fstab"]:
+        found.append("swap is enabled")
+    if not host_facts["ip_forward"]:
+        found.append("net.ipv4.ip_forward is 0")
+    found += [f"module {name} not loaded" for name, loaded in host_facts["modules"].items() if not loaded]
+    found += [f"only {free} GB free on {path}" for path, free in host_facts["free_gb"].items()
+              if free is not None and free < MIN_FREE_GB]
+    if not host_facts["runtimes"]:
+        found.append("no container runtime socket")
+    if "kubelet" not in host_facts["packages"]:
+        busy = sorted(set(host_facts["ports"]) & set(KUBE_PORTS))
+        if busy:
+            found.append(f"port(s) {', '.join(map(str, busy))} already in use")
+    return found
+
+def print_facts(all_facts):
+    print(f"{'host':<20} {'swap':<5} {'ipv6':<5} {'runtime':<11} {'kubelet':<12} {'free /':>7}")
+    for name, host_facts in all_facts.items():
+        if "error" in host_facts:
+            print(f"{name:<20} unreachable: {host_facts['error']}")
+            continue
+        swap = "on" if host_facts["swap"]["active"] else "off"
+        ipv6 = "off" if host_facts["ipv6_disabled"] else "on"
+        runtime = ",".join(host_facts["runtimes"]) or "-"
+        kubelet = host_facts["packages"].get("kubelet") or "-"
+        print(f"{name:<20} {swap:<5} {ipv6:<5} {runtime:<11} {kubelet:<12} {host_facts['free_gb']['/']:>6}G")
+
+def main():
+    """
+    Gathers and shows the facts of the fleet: facts.py gather | facts.py check | facts.py local
+    """
+    parser = argparse.ArgumentParser(description="Gather a compact fact set from every node, cached with a TTL.")
+    parser.add_argument("action", choices=["gather", "check", "local"], nargs="?", default="gather")
+    parser.add_argument("--inventory", default=fleet.DEFAULT_INVENTORY if fleet else None)
+    parser.add_argument("--group", help="Inventory group (default: every host)")
+    parser.add_argument("--ttl", type=float, default=DEFAULT_TTL, help="Seconds cached facts stay valid")
+    parser.add_argument("--refresh", action="store_true", help="Ignore the cache")
+    parser.add_argument("--transport", choices=["ssh", "local"], default="ssh")
+    parser.add_argument("--user", default=fleet.DEFAULT_USER if fleet else None)
+    parser.add_argument("--key-file", default=fleet.DEFAULT_KEY_FILE if fleet else None)
+    parser.add_argument("--json", action="store_true", help="Print the facts as JSON")
+    args = parser.parse_args()
+
+    if args.action == "local":
+        print(json.dumps(collect(), indent=2))
+        return
+    inventory = fleet.parse_inventory(args.inventory)
+    groups = [args.group] if args.group else list(inventory)
+    hosts = list({host["name"]: host for group in groups for host in inventory.get(group, [])}.values())
+    if not hosts:
+        print(f"No hosts found in {args.inventory}.")
+        sys.exit(1)
+    if args.transport == "local":
+        transport = fleet.LocalTransport()
+    else:
+        transport = fleet.SshTransport(user=args.user, key_file=args.key_file)
+
+    all_facts = gather(hosts, transport, args.ttl, args.refresh)
+    if args.json:
+        print(json.dumps(all_facts, indent=2))
+    elif args.action == "gather":
+        print_facts(all_facts)
+    if args.action == "check":
+        failed = False
+        for name, host_facts in all_facts.items():
+            found = problems(host_facts)
+            failed = failed or bool(found)
+            print(f"{name}: {'; '.join(found) if found else 'ok'}")
+        if failed:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# Standalone on purpose: the ansible playbooks copy this single file to the nodes.
+
+# Configuration
+UFW_CONF = "/etc/ufw/ufw.conf"
+UFW_DEFAULTS = "/etc/default/ufw"
+RULE_FILES = {
+    "v4": {"path": "/etc/ufw/user.rules", "chain": "ufw-user-input", "any": "0.0.0.0/0", "restore": "iptables-restore"},
+    "v6": {"path": "/etc/ufw/user6.rules", "chain": "ufw6-user-input", "any": "::/0", "restore": "ip6tables-restore"},
+}
+
+# The single table of TCP ports each node role opens
+PORT_PROFILES = {
+    "control-plane": [
+        "22",          # ssh, keeps fleet.py and ansible connected once ufw is enabled
+        "6443",        # Kubernetes API server
+        "8080",        # API group list
+        "2379:2380",   # etcd server client API
+        "10250",       # Kubelet API
+        "10251",       # kube-scheduler
+        "10252",       # kube-controller-manager
+        "10255",       # Read-only Kubelet API
+        "30000:32767", # NodePort Services
+    ],
+    "worker": [
+        "22",          # ssh, keeps fleet.py and ansible connected once ufw is enabled
+        "6443",        # Kubernetes API server
+        "2379:2380",   # etcd server client API
+        "10250",       # Kubelet API
+        "10251",       # kube-scheduler
+        "10252",       # kube-controller-manager
+        "10255",       # Read-only Kubelet API
+        "30000:32767", # NodePort Services
+    ],
+}
+
+def read_file(path):
+    try:
+        with open(path, "r") as rules_file:
+            return rules_file.read()
+    except FileNotFoundError:
+        return None
+
+def ufw_enabled():
+    """
+    True when ufw is configured to be active.
+    """
+    return re.search(r"(?m)^ENABLED=yes\s*$", read_file(UFW_CONF) or "") is not None
+
+def ipv6_managed():
+    """
+    True when ufw also manages ip6tables (IPV6=yes in /etc/default/ufw).
+    """
+    return re.search(r"(?m)^IPV6=yes\s*$", read_file(UFW_DEFAULTS) or "") is not None
+
+def families():
+    return ["v4", "v6"] if ipv6_managed() else ["v4"]
+
+def allowed_ports(family="v4", protocol="tcp"):
+    """
+    Returns the ports and port ranges ("6443", "30000:32767") ufw allows for a protocol,
+    read from the tuple comments ufw keeps in its rules file.
+    """
+    ports = set()
+    rules = read_file(RULE_FILES[family]["path"]) or ""
+    for match in re.finditer(r"(?m)^### tuple ### allow (\w+) (\S+) ", rules):
+        if match.group(1) in (protocol, "any"):
+            ports.add(match.group(2))
+    return ports
+
+def missing_by_family(profile):
+    """
+    Returns {family: ports of the profile not allowed yet}, in profile order.
+    """
+    missing = {}
+    for family in families():
+        allowed = allowed_ports(family)
+        missing[family] = [port for port in PORT_PROFILES[profile] if port not in allowed]
+    return missing
+
+def missing_ports(profile):
+    """
+    Returns the ports of a profile that at least one address family does not allow yet.
+    """
+    return combined(profile, missing_by_family(profile))
+
+def combined(profile, missing):
+    return [port for port in PORT_PROFILES[profile] if any(port in ports for ports in missing.values())]
+
+def rule_lines(family, port):
+    """
+    Builds the iptables rule ufw itself would write for 'ufw allow <port>/tcp'.
+    """
+    chain = RULE_FILES[family]["chain"]
+    if ":" in port:
+        return f"-A {chain} -p tcp -m multiport --dports {port} -j ACCEPT"
+    return f"-A {chain} -p tcp --dport {port} -j ACCEPT"
+
+def persist_rules(family, ports):
+    """
+    Adds the rules to ufw's rules file in one atomic write, so 'ufw status' and later
+    reloads know about them.
+    """
+    settings = RULE_FILES[family]
+    rules = read_file(settings["path"])
+    if rules is None or "### END RULES ###" not in rules:
+        raise RuntimeError(f"{settings['path']} not found or not written by ufw. Is ufw installed?")
+    blocks = ""
+    for port in ports:
+        blocks += f"\n### tuple ### allow tcp {port} {settings['any']} any {settings['any']} in\n{rule_lines(family, port)}\n"
+    rules = rules.replace("\n### END RULES ###", blocks + "\n### END RULES ###", 1)
+    temp_file = settings["path"] + ".tmp"
+    with open(temp_file, "w") as rules_file:
+        rules_file.write(rules)
+    os.chmod(temp_file, 0o640)
+    os.replace(temp_file, settings["path"])
+
+def apply_live(family, ports):
+    """
+    Loads the new rules into the running firewall as one iptables-restore transaction,
+    without flushing or reloading anything that is already there.
+    """
+    batch = "*filter\n" + "".join(rule_lines(family, port) + "\n" for port in ports) + "COMMIT\n"
+    result = subprocess.run([RULE_FILES[family]["restore"], "--noflush"], input=batch,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{RULE_FILES[family]['restore']} failed: {result.stderr.strip()}")
+
+def apply_profile(profile):
+    """
+    Makes ufw allow every port of a profile, touching only what is missing.
+    Ports opened by hand are left alone. Returns True on success.
+    """
+    missing = missing_by_family(profile)
+    opening = combined(profile, missing)
+    enabled = ufw_enabled()
+    if not opening and enabled:
+        print(f"Firewall already allows every {profile} port.")
+        return True
+
+    try:
+        for family, ports in missing.items():
+            if ports:
+                persist_rules(family, ports)
+        if enabled:
+            print(f"Opening {', '.join(opening)} in one batch...")
+            for family, ports in missing.items():
+                if ports:
+                    apply_live(family, ports)
+        else:
+            print("Enabling the firewall with the Kubernetes ports already in place...")
+            result = subprocess.run(["ufw", "--force", "enable"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"ufw enable failed: {result.stderr.strip()}")
+    except RuntimeError as e:
+        print(f"Failed to configure the firewall: {e}")
+        return False
+    return True
+
+def main():
+    """
+    Opens the ports of a node role: firewall.py --profile worker
+    """
+    parser = argparse.ArgumentParser(description="Apply a Kubernetes port profile to ufw in one batch.")
+    parser.add_argument("--profile", choices=sorted(PORT_PROFILES), required=True)
+    args = parser.parse_args()
+    if os.geteuid() != 0:
+        print("This script must be run as root. Please try again with 'sudo'.")
+        sys.exit(1)
+    if not apply_profile(args.profile):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+
+import argparse
+import ast
+import collections
+import io
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import command
+import node
+import scheduler
+import tracing
+
+# Configuration
+BUNDLE_DIR = os.path.dirname(os.path.abspath(__file__))  # This directory is shipped to every node
+DEFAULT_INVENTORY = os.path.join(BUNDLE_DIR, "..", "..", "ansible", "inventory")
+REMOTE_BUNDLE_DIR = "/tmp/k8-provisions"  # Where the bundle is unpacked on each node
+DEFAULT_KEY_FILE = "~/.ssh/kube_rsa"  # Same key the ansible playbooks use
+DEFAULT_USER = "kube"  # User created by ansible/users.yml
+DEFAULT_CONCURRENCY = 10  # Nodes provisioned at the same time
+GROUP_ROLES = {  # Node role of each inventory group, see node.ROLE_DEFAULTS
+    "k8s-master": "control-plane",
+    "k8s-workers": "worker",
+}
+
+_print_lock = threading.Lock()
+
+def log(host, message):
+    """
+    Prints a line prefixed with the host so parallel output stays readable.
+    """
+    with _print_lock:
+        print(f"[{host}] {message}", flush=True)
+
+def parse_value(value):
+    """
+    Turns an inventory value into a python value when it looks like one ("['ens34']", "3").
+    Anything else stays a string.
+    """
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return value
+
+def parse_inventory(path):
+    """
+    Parses an Ansible INI inventory into {group: [host, ...]}.
+    Each host is a dict with its name, its ansible_* connection settings and the
+    remaining host vars, which are used to override the step module's configuration
+    (for example 'hostname=worker-node-02').
+    """
+    groups = {}
+    group = "ungrouped"
+    with open(path, "r") as inventory:
+        for line in inventory:
+            line = line.strip()
+            if not line or line.startswith(("#", ";")):
+                continue
+            if line.startswith("[") and line.endswith("]"):
+                group = line[1:-1]
+                continue
+            if ":" in group:
+                # [group:vars] and [group:children] sections are not used by the fleet driver
+                continue
+            fields = shlex.split(line, comments=True)
+            host = {"name": fields[0], "connection": {}, "overrides": {}}
+            for field in fields[1:]:
+                if "=" not in field:
+                    continue
+                key, value = field.split("=", 1)
+                if key.startswith("ansible_"):
+                    host["connection"][key] = value
+                else:
+                    host["overrides"][key] = parse_value(value)
+            groups.setdefault(group, []).append(host)
+    return groups
+
+def node_spec(host, role):
+    """
+    The node spec of a host: the group's role and the host vars, which may name another role.
+    """
+    return dict({"role": role}, **host["overrides"])
+
+def step_code(spec, step):
+    """
+    Builds the python snippet that converges one step of node.py configured with the host's spec.
+    """
+    lines = ["import node", "import scheduler", "import tracing", f"node.apply_spec({spec!r})"]
+    # The node's spans come back on one marked line of the output
+    lines += ["try:", f"    scheduler.converge_named(node.STEPS, {step!r})", "finally:", "    tracing.emit()"]
+    return "\n".join(lines)
+
+def run_streamed(command_line, timeout=None, on_line=None, **popen_arguments):
+    """
+    Runs a local command, handing each output line to on_line() as it arrives.
+    Keeps the last lines only. Returns (returncode, output); raises TimeoutExpired.
+    """
+    last_lines = collections.deque(maxlen=command.STREAM_KEEP_LINES)
+    with subprocess.Popen(command_line, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                          errors="replace", **popen_arguments) as process:
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            process.kill()
+
+        timer = threading.Timer(timeout, kill) if timeout else None
+        if timer:
+            timer.start()
+        try:
+            for line in process.stdout:
+                last_lines.append(line)
+                if on_line and not line.startswith(tracing.EMIT_MARKER):
+                    on_line(line.rstrip("\n"))
+            process.wait()
+        finally:
+            if timer:
+                timer.cancel()
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(command_line, timeout)
+    return process.returncode, "".join(last_lines)
+
+def bundle_archive():
+    """
+    Packs the python files of this directory into an in-memory tar.gz for shipping to nodes.
+    """
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for name in sorted(os.listdir(BUNDLE_DIR)):
+            if name.endswith(".py"):
+                archive.add(os.path.join(BUNDLE_DIR, name), arcname=name)
+    return buffer.getvalue()
+
+class LocalTransport:
+    """
+    Runs every step in its own python subprocess on this machine, as if it were each host.
+    Only the working directory is a throwaway one: the steps change this machine for real,
+    so use it inside bench.py's namespace sandbox or on a scratch VM. PROVISION_HOST tells
+    the subprocess which host it stands in for.
+    """
+
+    def __init__(self, python=sys.executable, env=None):
+        self.python = python
+        self.env = env or {}
+        self.sandboxes = {}
+
+    def prepare(self, host):
+        self.sandboxes[host["name"]] = tempfile.mkdtemp(prefix="k8-provisions-")
+
+    def run(self, host, code, timeout=None, on_line=None):
+        env = dict(os.environ, **self.env)
+        env["PROVISION_HOST"] = host["name"]  # Tells simulated commands, e.g. bench.py's stubs, which host they stand in for
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [BUNDLE_DIR, env.get("PYTHONPATH")]))
+        return run_streamed([self.python, "-u", "-c", code], timeout, on_line, cwd=self.sandboxes[host["name"]], env=env)
+
+    def run_once(self, host, code, timeout=None):
+        """
+        Runs self-contained code that needs none of the bundle.
+        """
+        self.prepare(host)
+        try:
+            return self.run(host, code, timeout)
+        finally:
+            self.cleanup(host)
+
+    def put(self, host, local_path, name):
+        shutil.copyfile(local_path, os.path.join(self.sandboxes[host["name"]], name))
+
+    def cleanup(self, host):
+        shutil.rmtree(self.sandboxes.pop(host["name"]), ignore_errors=True)
+
+class SshTransport:
+    """
+    Ships this directory to each node over ssh once, then runs every step there with sudo.
+    """
+
+    def __init__(self, user=DEFAULT_USER, key_file=DEFAULT_KEY_FILE, python="python3"):
+        self.user = user
+        self.key_file = os.path.expanduser(key_file) if key_file else None
+        self.python = python
+        self.archive = bundle_archive()
+
+    def ssh_command(self, host, remote_command):
+        connection = host["connection"]
+        address = connection.get("ansible_host", host["name"])
+        user = connection.get("ansible_user", self.user)
+        command = ["ssh", "-o", "BatchMode=yes", "-o", "StrictHostKeyChecking=accept-new"]
+        key_file = connection.get("ansible_ssh_private_key_file", self.key_file)
+        if key_file:
+            command += ["-i", os.path.expanduser(key_file)]
+        if "ansible_port" in connection:
+            command += ["-p", connection["ansible_port"]]
+        return command + [f"{user}@{address}" if user else address, remote_command]
+
+    def prepare(self, host):
+        remote = shlex.quote(REMOTE_BUNDLE_DIR)
+        subprocess.run(self.ssh_command(host, f"rm -rf {remote} && mkdir -p {remote} && tar -xzf - -C {remote}"),
+                       input=self.archive, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+
+    def run(self, host, code, timeout=None, on_line=None):
+        remote_command = f"cd {shlex.quote(REMOTE_BUNDLE_DIR)} && sudo {self.python} -u -c {shlex.quote(code)}"
+        return run_streamed(self.ssh_command(host, remote_command), timeout, on_line)
+
+    def run_once(self, host, code, timeout=None):
+        """
+        Runs self-contained code that needs none of the bundle in a single ssh round trip.
+        """
+        return run_streamed(self.ssh_command(host, f"sudo {self.python} -c {shlex.quote(code)}"), timeout)
+
+    def put(self, host, local_path, name):
+        """
+        Copies a file into the bundle directory on the node, where steps can open it by name.
+        """
+        remote_path = shlex.quote(f"{REMOTE_BUNDLE_DIR}/{name}")
+        with open(local_path, "rb") as local_file:
+            subprocess.run(self.ssh_command(host, f"cat > {remote_path}"), stdin=local_file,
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+
+    def cleanup(self, host):
+        pass
+
+class StepFailed(Exception):
+    pass
+
+def provision_host(host, role, steps, transport, step_timeout=None, follow=False):
+    """
+    Runs the given steps on one host, each as soon as the steps it needs are done.
+    No new step starts after one fails. Returns a result dict for the summary.
+    With follow=True every output line of a step is logged as soon as the node prints it.
+    """
+    name = host["name"]
+    result = {"host": name, "status": "ok", "failed_step": None, "steps": [], "output": ""}
+
+    def run_remote(spec):
+        step = scheduler.step_name(spec)
+        log(name, f"{step} ...")
+        step_started = time.monotonic()
+        on_line = (lambda line: log(name, f"{step}: {line}")) if follow else None
+        try:
+            returncode, output = transport.run(host, step_code(node_spec(host, role), step), step_timeout, on_line)
+        except subprocess.TimeoutExpired as e:
+            returncode, output = None, f"Timed out after {e.timeout}s"
+        output, spans = tracing.collect(output)
+        for span in spans:
+            span["host"] = name
+        tracing.add(spans)
+        duration = time.monotonic() - step_started
+        result["steps"].append({"step": step, "returncode": returncode, "duration": duration})
+        if returncode != 0:
+            log(name, f"{step} failed ({duration:.1f}s)")
+            result["failed_step"] = step
+            result["output"] = output
+            raise StepFailed(step)
+        log(name, f"{step} done ({duration:.1f}s)")
+
+    started = time.monotonic()
+    try:
+        transport.prepare(host)
+        outcome = scheduler.run_steps(steps, run=run_remote)
+        if "failed" in outcome.values():
+            result["status"] = "failed"
+    except Exception as e:
+        result["status"] = "failed"
+        result["output"] = str(e)
+    finally:
+        transport.cleanup(host)
+    result["duration"] = time.monotonic() - started
+    return result
+
+def run_fleet(hosts, role, steps, transport, concurrency=DEFAULT_CONCURRENCY, step_timeout=None, follow=False):
+    """
+    Provisions all hosts at once, at most 'concurrency' of them at a time.
+    Results come back in inventory order.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = [pool.submit(provision_host, host, role, steps, transport, step_timeout, follow)
+                   for host in hosts]
+        return [future.result() for future in futures]
+
+def print_summary(results):
+    """
+    Prints one line per host and the output of every failed step.
+    """
+    print("\nFleet summary:")
+    for result in results:
+        detail = f"failed at {result['failed_step']}" if result["failed_step"] else result["status"]
+        print(f"  {result['host']:<20} {detail:<40} {result['duration']:.1f}s")
+    for result in results:
+        if result["status"] != "ok":
+            print(f"\n--- {result['host']} ---\n{result['output'].strip()}")
+
+def node_steps(names=None):
+    """
+    Returns the steps node.py declares, optionally only the named ones.
+    """
+    steps = node.STEPS
+    return scheduler.select_steps(steps, names) if names else steps
+
+def main():
+    """
+    Provisions every host of an inventory group in parallel.
+    """
+    parser = argparse.ArgumentParser(description="Run the provisioning steps on every node of an inventory group.")
+    parser.add_argument("--inventory", default=DEFAULT_INVENTORY, help="Ansible INI inventory file")
+    parser.add_argument("--group", default="k8s-workers", help="Inventory group to provision")
+    parser.add_argument("--role", choices=list(node.ROLE_DEFAULTS), help="Node role (defaults to the one matching the group)")
+    parser.add_argument("--steps", help="Comma separated step names (defaults to all of node.py's STEPS)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Nodes provisioned at the same time")
+    parser.add_argument("--step-timeout", type=float, help="Seconds before a step is considered hung")
+    parser.add_argument("--transport", choices=["ssh", "local"], default="ssh")
+    parser.add_argument("--user", default=DEFAULT_USER, help="ssh user")
+    parser.add_argument("--key-file", default=DEFAULT_KEY_FILE, help="ssh private key")
+    parser.add_argument("--follow", action="store_true", help="Print the output of every step live, line by line")
+    parser.add_argument("--trace", help="Write the spans of every node to this .jsonl file and a Chrome trace next to it")
+    args = parser.parse_args()
+
+    hosts = parse_inventory(args.inventory).get(args.group)
+    if not hosts:
+        print(f"No hosts found in group [{args.group}] of {args.inventory}.")
+        sys.exit(1)
+    role = args.role or GROUP_ROLES.get(args.group)
+    if not role:
+        print(f"No role known for group [{args.group}]. Use --role.")
+        sys.exit(1)
+    steps = node_steps(args.steps.split(",") if args.steps else None)
+
+    if args.transport == "local":
+        transport = LocalTransport()
+    else:
+        transport = SshTransport(user=args.user, key_file=args.key_file)
+
+    print(f"Provisioning {len(hosts)} host(s) from [{args.group}] as {role}, {args.concurrency} at a time...")
+    results = run_fleet(hosts, role, steps, transport, args.concurrency, args.step_timeout, args.follow)
+    print_summary(results)
+    tracing.print_summary()
+    if args.trace:
+        tracing.write_jsonl(args.trace)
+        tracing.write_chrome(args.trace.rsplit(".", 1)[0] + ".trace.json")
+        print(f"\nTrace written to {args.trace}.")
+    if any(result["status"] != "ok" for result in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+
+from artifact_cache import dpkg_architecture
+from command import run_command
+from discovery import CONTAINERD_SOCKET, CRIO_SOCKET
+
+# Configuration
+KUBERNETES_VERSION = "v1.31.4"  # Matches K8S_VERSION in the shell scripts
+CACHE_DIR = "/var/cache/k8-provisions/images"  # One tarball per image digest plus index.json
+
+def resolve_images(kubernetes_version=KUBERNETES_VERSION):
+    """
+    Lists the control-plane and pause images kubeadm needs for the given version
+    (None for the version of the installed kubeadm).
+    """
+    command = ["kubeadm", "config", "images", "list"]
+    if kubernetes_version:
+        command += ["--kubernetes-version", kubernetes_version]
+    output = run_command(command)
+    if output is None:
+        raise RuntimeError(f"Could not list the images of Kubernetes {kubernetes_version}.")
+    return output.split()
+
+def runtime_endpoint():
+    """
+    Returns the CRI socket of the runtime installed on this node.
+    """
+    for socket_path in (CONTAINERD_SOCKET, CRIO_SOCKET):
+        if os.path.exists(socket_path):
+            return socket_path
+    raise RuntimeError("No containerd or CRI-O socket found.")
+
+def local_images():
+    """
+    Returns {image reference: digest} for the images the runtime already holds.
+    """
+    output = run_command(["crictl", "--runtime-endpoint", "unix://" + runtime_endpoint(), "images", "-o", "json"])
+    images = {}
+    for image in json.loads(output or "{}").get("images", []):
+        digests = [repo_digest.split("@", 1)[1] for repo_digest in image.get("repoDigests") or []]
+        for tag in image.get("repoTags") or []:
+            images[tag] = digests[0] if digests else None
+    return images
+
+def images_present(images):
+    """
+    True when the runtime already holds every one of the images.
+    """
+    try:
+        present = local_images()
+    except (RuntimeError, OSError, ValueError):
+        return False
+    return all(image in present for image in images)
+
+def load_index(cache_dir=CACHE_DIR):
+    path = os.path.join(cache_dir, "index.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as index_file:
+        return json.load(index_file)
+
+def archive_name(digest):
+    return digest.replace(":", "-") + ".tar"
+
+def export_images(images, cache_dir=CACHE_DIR):
+    """
+    Pulls every image once on this host with containerd and exports it to the cache,
+    keyed by digest. Images whose digest is already cached are not exported again.
+    """
+    platform = f"linux/{dpkg_architecture()}"
+    os.makedirs(cache_dir, exist_ok=True)
+    index = load_index(cache_dir)
+    for image in images:
+        print(f"Caching {image}...")
+        if run_command(["ctr", "-n", "k8s.io", "images", "pull", "--platform", platform, image], stream=True) is None:
+            raise RuntimeError(f"Failed to pull {image}.")
+        listing = run_command(["ctr", "-n", "k8s.io", "images", "ls", f"name=={image}"]) or ""
+        rows = [line.split() for line in listing.splitlines()[1:] if line.strip()]
+        if not rows:
+            raise RuntimeError(f"Could not find the digest of {image}.")
+        digest = rows[0][2]
+        path = os.path.join(cache_dir, archive_name(digest))
+        if not os.path.exists(path):
+            if run_command(["ctr", "-n", "k8s.io", "images", "export", "--platform", platform, path + ".tmp", image]) is None:
+                raise RuntimeError(f"Failed to export {image}.")
+            os.replace(path + ".tmp", path)
+        index[image] = digest
+    with open(os.path.join(cache_dir, "index.json"), "w") as index_file:
+        json.dump(index, index_file, indent=2, sort_keys=True)
+    print(f"Image cache holds {len(index)} image(s) in {cache_dir}.")
+    return index
+
+def print_missing(index):
+    """
+    Runs on a node: prints, as JSON, the images of the index whose digest the runtime does not hold.
+    """
+    present = local_images()
+    missing = [image for image, digest in sorted(index.items()) if present.get(image) != digest]
+    print(json.dumps(missing))
+
+def import_archives(archives):
+    """
+    Runs on a node: imports [(image, archive path), ...] into the local runtime.
+    """
+    endpoint = runtime_endpoint()
+    for image, archive in archives:
+        print(f"Importing {image}...")
+        if endpoint == CONTAINERD_SOCKET:
+            command = ["ctr", "-n", "k8s.io", "images", "import", archive]
+        else:
+            command = ["skopeo", "copy", f"oci-archive:{archive}", f"containers-storage:{image}"]
+        if run_command(command) is None:
+            sys.exit(1)
+        os.remove(archive)
+
+def main():
+    """
+    export: pull and cache the images on this host. image_distribution.py imports them on the nodes.
+    """
+    parser = argparse.ArgumentParser(description="Shared image cache for the kubeadm images.")
+    parser.add_argument("action", choices=["export"])
+    parser.add_argument("--kubernetes-version", default=KUBERNETES_VERSION)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    args = parser.parse_args()
+
+    export_images(resolve_images(args.kubernetes_version), args.cache_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import fleet
+import image_cache
+
+def distribute_to_host(host, index, transport, cache_dir=image_cache.CACHE_DIR):
+    """
+    Copies the images a host is missing and imports them there. Returns the number imported.
+    """
+    transport.prepare(host)
+    try:
+        returncode, output = transport.run(host, f"import image_cache\nimage_cache.print_missing({index!r})")
+        if returncode != 0:
+            raise RuntimeError(output.strip())
+        missing = json.loads(output.strip().splitlines()[-1])
+        archives = []
+        for image in missing:
+            name = image_cache.archive_name(index[image])
+            transport.put(host, os.path.join(cache_dir, name), name)
+            archives.append((image, name))
+        if archives:
+            returncode, output = transport.run(host, f"import image_cache\nimage_cache.import_archives({archives!r})")
+            if returncode != 0:
+                raise RuntimeError(output.strip())
+        return len(archives)
+    finally:
+        transport.cleanup(host)
+
+def distribute(hosts, transport, cache_dir=image_cache.CACHE_DIR, concurrency=fleet.DEFAULT_CONCURRENCY):
+    """
+    Imports the cached images on all hosts in parallel. Hosts that hold every digest already are skipped.
+    """
+    index = image_cache.load_index(cache_dir)
+    if not index:
+        raise RuntimeError(f"The image cache in {cache_dir} is empty. Run 'image_cache.py export' first.")
+
+    def run(host):
+        try:
+            count = distribute_to_host(host, index, transport, cache_dir)
+            fleet.log(host["name"], f"imported {count} image(s)" if count else "all images present, skipped")
+            return True
+        except Exception as e:
+            fleet.log(host["name"], f"image import failed: {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        return all(pool.map(run, hosts))
+
+def main():
+    """
+    Imports the images cached by `image_cache.py export` on every node of a group.
+    """
+    parser = argparse.ArgumentParser(description="Import the cached kubeadm images on the nodes of a group.")
+    parser.add_argument("--cache-dir", default=image_cache.CACHE_DIR)
+    parser.add_argument("--inventory", default=fleet.DEFAULT_INVENTORY)
+    parser.add_argument("--group", default="k8s-workers")
+    parser.add_argument("--concurrency", type=int, default=fleet.DEFAULT_CONCURRENCY)
+    parser.add_argument("--user", default=fleet.DEFAULT_USER)
+    parser.add_argument("--key-file", default=fleet.DEFAULT_KEY_FILE)
+    args = parser.parse_args()
+
+    hosts = fleet.parse_inventory(args.inventory).get(args.group, [])
+    transport = fleet.SshTransport(user=args.user, key_file=args.key_file)
+    if not distribute(hosts, transport, args.cache_dir, args.concurrency):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+import argparse
+import http.server
+import json
+import os
+import shlex
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import desired_state
+import fleet
+import packages
+import waiters
+from command import run_command
+
+# Configuration
+BUNDLE_FILE = os.path.join(packages.STATE_DIR, "join.json")  # Join bundle of the control plane, reused until it expires
+ADMIN_CONF = "/etc/kubernetes/admin.conf"
+KUBELET_CONF = "/etc/kubernetes/kubelet.conf"  # Exists once a node has joined
+DEFAULT_TTL = 2 * 3600  # Seconds a join token stays valid
+TTL_MARGIN = 600  # A bundle expiring sooner than this is replaced instead of handed out
+DEFAULT_PORT = 8782
+SERVE_TIME = 900  # Seconds `join.py serve` hands the bundle out before it stops
+DEFAULT_JOIN_CONCURRENCY = 5  # Workers running kubeadm join at the same time
+READY_TIMEOUT = 600  # Seconds the joined nodes get to become Ready
+READY_POLL = 5.0  # Longest pause between two `kubectl get nodes` while waiting
+
+_bundle_lock = threading.Lock()
+
+def parse_join_command(line, ttl):
+    """
+    Turns the output of `kubeadm token create --print-join-command` into a join bundle.
+    """
+    arguments = shlex.split(line)
+    if arguments[:2] != ["kubeadm", "join"] or "--token" not in arguments:
+        raise RuntimeError(f"Unexpected join command: {line}")
+    hashes = [arguments[index + 1] for index, argument in enumerate(arguments)
+              if argument == "--discovery-token-ca-cert-hash"]
+    return {"endpoint": arguments[2], "token": arguments[arguments.index("--token") + 1],
+            "ca_cert_hashes": hashes, "expires": int(time.time()) + ttl}
+
+def create_bundle(ttl=DEFAULT_TTL):
+    """
+    Creates one token on the control plane and returns it with the endpoint and CA hashes.
+    """
+    output = run_command(["kubeadm", "token", "create", "--ttl", f"{ttl}s", "--print-join-command",
+                          "--description", "k8-provisions worker join"])
+    if output is None:
+        raise RuntimeError("kubeadm token create failed.")
+    return parse_join_command(output.strip().splitlines()[-1], ttl)
+
+def save_bundle(bundle, path=BUNDLE_FILE):
+    """
+    Writes the bundle readable by root only, it holds a bootstrap token.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(os.open(path + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as bundle_file:
+        json.dump(bundle, bundle_file)
+    os.replace(path + ".tmp", path)
+
+def current_bundle(ttl=DEFAULT_TTL, path=BUNDLE_FILE):
+    """
+    Returns the saved bundle while it is valid for at least TTL_MARGIN more seconds,
+    otherwise creates and saves a new one. All workers of a run share one token.
+    """
+    with _bundle_lock:
+        content = desired_state.read_file(path)
+        bundle = json.loads(content) if content else None
+        if bundle and bundle["expires"] - time.time() > TTL_MARGIN:
+            return bundle
+        print("Creating a join token...")
+        bundle = create_bundle(ttl)
+        save_bundle(bundle, path)
+        return bundle
+
+def join_arguments(bundle):
+    arguments = ["kubeadm", "join", bundle["endpoint"], "--token", bundle["token"]]
+    for ca_hash in bundle["ca_cert_hashes"]:
+        arguments += ["--discovery-token-ca-cert-hash", ca_hash]
+    return arguments
+
+def fetch_bundle(source):
+    """
+    Reads a bundle from a URL served by `join.py serve` or from a shared file.
+    """
+    if source.startswith(("http://", "https://")):
+        with urllib.request.urlopen(source, timeout=30) as response:
+            return json.load(response)
+    with open(source) as bundle_file:
+        return json.load(bundle_file)
+
+def endpoint_address(bundle):
+    """
+    The address of the API server in a bundle: 172.100.55.20:6443 -> 172.100.55.20.
+    """
+    return bundle["endpoint"].rsplit(":", 1)[0].strip("[]")
+
+def make_server(ttl=DEFAULT_TTL, bind="127.0.0.1", port=DEFAULT_PORT):
+    """
+    Returns an HTTP server answering every GET with the current bundle as JSON.
+    """
+    class BundleHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            try:
+                body = json.dumps(current_bundle(ttl)).encode()
+            except RuntimeError as e:
+                self.send_error(503, str(e))
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return http.server.ThreadingHTTPServer((bind, port), BundleHandler)
+
+def serve(ttl=DEFAULT_TTL, bind=None, port=DEFAULT_PORT, serve_time=SERVE_TIME):
+    """
+    Hands the bundle out for serve_time seconds, on the cluster address unless bind is
+    given: the bootstrap token goes to whoever asks, so only the cluster network should
+    reach it, and only while the workers join.
+    """
+    bind = bind or endpoint_address(current_bundle(ttl))
+    server = make_server(ttl, bind, port)
+    timer = threading.Timer(serve_time, server.shutdown)
+    timer.start()
+    print(f"Serving the join bundle on http://{bind}:{port}/ for {serve_time:g}s")
+    try:
+        server.serve_forever()
+    finally:
+        timer.cancel()
+        server.server_close()
+
+def join(bundle):
+    """
+    Joins this node with the bundle and waits for kubelet. A node that already joined is left alone.
+    Returns True when the node joined now.
+    """
+    if os.path.exists(KUBELET_CONF):
+        print(f"{KUBELET_CONF} exists, this node already joined. Skipping.")
+        return False
+    if bundle["expires"] < time.time():
+        raise RuntimeError("The join token has expired. Fetch a new bundle.")
+    print(f"Joining the cluster at {bundle['endpoint']}...")
+    if run_command(join_arguments(bundle), stream=True) is None:
+        raise RuntimeError("kubeadm join failed.")
+    waiters.wait_for_kubelet()
+    return True
+
+def node_name(host):
+    return host["overrides"].get("hostname", host["name"])
+
+def ready_nodes(kubeconfig=ADMIN_CONF):
+    """
+    Names of the Ready nodes, from one `kubectl get nodes` call.
+    """
+    output = run_command(["kubectl", "--kubeconfig", kubeconfig, "get", "nodes", "-o", "json"], ignore_errors=True)
+    if output is None:
+        return set()
+    return {node["metadata"]["name"] for node in json.loads(output)["items"]
+            if any(condition["type"] == "Ready" and condition["status"] == "True"
+                   for condition in node["status"].get("conditions", []))}
+
+def wait_until_ready(names, timeout=READY_TIMEOUT, kubeconfig=ADMIN_CONF):
+    """
+    Waits for all the nodes at once, polling the node list instead of each node.
+    """
+    names = set(names)
+    if names:
+        waiters.wait_for(lambda: names <= ready_nodes(kubeconfig), f"Node(s) {', '.join(sorted(names))}",
+                         timeout, max_delay=READY_POLL)
+
+def join_workers(hosts, transport, bundle, concurrency=DEFAULT_JOIN_CONCURRENCY, ready_timeout=READY_TIMEOUT):
+    """
+    Joins the hosts in parallel with one shared bundle, at most 'concurrency' running
+    kubeadm join at a time so the API server is not swamped, then waits until every
+    joined node is Ready. Returns {host name: "joined" | "already joined" | error}.
+    """
+    admission = threading.Semaphore(max(1, concurrency))
+
+    def join_host(host):
+        transport.prepare(host)
+        try:
+            with admission:
+                fleet.log(host["name"], "joining ...")
+                returncode, output = transport.run(host, f"import join\nprint(join.join({bundle!r}))")
+            if returncode != 0:
+                fleet.log(host["name"], "join failed")
+                return output.strip().splitlines()[-1] if output.strip() else f"exit code {returncode}"
+            joined = output.strip().splitlines()[-1] == "True"
+            fleet.log(host["name"], "joined" if joined else "already joined")
+            return "joined" if joined else "already joined"
+        finally:
+            transport.cleanup(host)
+
+    with ThreadPoolExecutor(max_workers=max(1, len(hosts))) as pool:
+        results = dict(zip((host["name"] for host in hosts), pool.map(join_host, hosts)))
+    joined = [node_name(host) for host in hosts if results[host["name"]] == "joined"]
+    wait_until_ready(joined, ready_timeout)
+    return results
+
+def main():
+    """
+    On the control plane:  join.py token | join.py serve | join.py write FILE | join.py workers
+    On a worker:           join.py join --from http://172.100.55.20:8782/
+    """
+    parser = argparse.ArgumentParser(description="Share one join token and join the workers in parallel.")
+    parser.add_argument("action", choices=["token", "serve", "write", "join", "workers", "wait"])
+    parser.add_argument("names", nargs="*", help="File for 'write', node names for 'wait'")
+    parser.add_argument("--ttl", type=int, default=DEFAULT_TTL, help="Token lifetime in seconds")
+    parser.add_argument("--from", dest="source", help="Bundle URL or file for 'join'")
+    parser.add_argument("--bind", help="Address 'serve' listens on, the API server address by default")
+    parser.add_argument("--serve-for", type=float, default=SERVE_TIME, help="Seconds 'serve' runs")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--inventory", default=fleet.DEFAULT_INVENTORY)
+    parser.add_argument("--group", default="k8s-workers")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_JOIN_CONCURRENCY)
+    parser.add_argument("--timeout", type=float, default=READY_TIMEOUT, help="Seconds to wait for Ready nodes")
+    parser.add_argument("--user", default=fleet.DEFAULT_USER)
+    parser.add_argument("--key-file", default=fleet.DEFAULT_KEY_FILE)
+    args = parser.parse_args()
+
+    try:
+        if args.action == "token":
+            print(shlex.join(join_arguments(current_bundle(args.ttl))))
+        elif args.action == "serve":
+            serve(args.ttl, args.bind, args.port, args.serve_for)
+        elif args.action == "write":
+            if len(args.names) != 1:
+                parser.error("write needs one file")
+            save_bundle(current_bundle(args.ttl), args.names[0])
+        elif args.action == "join":
+            if not args.source:
+                parser.error("join needs --from")
+            join(fetch_bundle(args.source))
+        elif args.action == "wait":
+            wait_until_ready(args.names, args.timeout)
+        else:
+            hosts = fleet.parse_inventory(args.inventory).get(args.group, [])
+            transport = fleet.SshTransport(user=args.user, key_file=args.key_file)
+            results = join_workers(hosts, transport, current_bundle(args.ttl), args.concurrency, args.timeout)
+            if any(result not in ("joined", "already joined") for result in results.values()):
+                sys.exit(1)
+    except (RuntimeError, TimeoutError, OSError) as e:
+        print(e)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+
+import desired_state
+import packages
+
+# Configuration
+JOURNAL_DIR = os.path.join(packages.STATE_DIR, "journal")  # One journal per script
+
+def code_digest(func):
+    """
+    Hashes what a function does: its bytecode, constants and the names it uses.
+    """
+    code = func.__code__
+    return hashlib.sha256(code.co_code + repr((code.co_consts, code.co_names)).encode()).hexdigest()
+
+def plain(value):
+    try:
+        json.dumps(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+def module_config(func):
+    """
+    The plain values (strings, numbers, lists of them, ...) defined at the top of the
+    function's module, i.e. the configuration section of the script.
+    """
+    module = sys.modules.get(func.__module__)
+    values = vars(module) if module else {}
+    return {name: value for name, value in values.items() if not name.startswith("_") and plain(value)}
+
+def step_fingerprint(func, upstream=()):
+    """
+    Fingerprint of a step's inputs: its code, its script's configuration and the fingerprints
+    of the steps it builds on. Changing any of them makes the step run again.
+    """
+    return desired_state.fingerprint(func.__module__, func.__qualname__, code_digest(func),
+                                     module_config(func), sorted(upstream))
+
+class Journal:
+    """
+    Remembers, on the node, which steps of an interrupted run completed and with which
+    inputs. A re-run skips those and resumes at the first incomplete or changed step.
+    The journal is removed once a run completes, later runs rely on the step checks again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        content = desired_state.read_file(path)
+        try:
+            self.entries = json.loads(content) if content else {}
+        except ValueError:
+            # Cut short by a crash or power loss while it was written
+            print(f"The journal {path} is damaged. Ignoring it and starting over.")
+            self.entries = {}
+
+    @classmethod
+    def for_script(cls, script):
+        """
+        Journal of a script, by file name. PROVISION_RESUME=0 discards it and starts over.
+        """
+        name = os.path.splitext(os.path.basename(script))[0]
+        journal = cls(os.path.join(JOURNAL_DIR, name + ".json"))
+        if os.environ.get("PROVISION_RESUME", "1") == "0":
+            journal.clear()
+        return journal
+
+    def completed(self, name, fingerprint):
+        with self.lock:
+            entry = self.entries.get(name)
+            return entry is not None and entry["fingerprint"] == fingerprint
+
+    def record(self, name, fingerprint):
+        with self.lock:
+            self.entries[name] = {"fingerprint": fingerprint, "completed": time.strftime("%Y-%m-%dT%H:%M:%S")}
+            self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".tmp", "w") as journal_file:
+            json.dump(self.entries, journal_file, indent=2, sort_keys=True)
+        os.replace(self.path + ".tmp", self.path)
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def run(self, name, fingerprint, func):
+        """
+        Calls func() unless the step completed with the same fingerprint before; records it
+        when it returns. Returns True if the step ran.
+        """
+        if self.completed(name, fingerprint):
+            print(f"{name}: completed in the interrupted run. Skipping.")
+            return False
+        func()
+        self.record(name, fingerprint)
+        return True
+
+def run_sequence(journal, funcs, always=None):
+    """
+    Runs functions one after the other through the journal. Each step's fingerprint includes
+    the previous one's, so a changed step also re-runs everything after it. 'always' maps
+    functions that only prepare in-memory state to the later step using it; they run on
+    every attempt where that step is still to run, and not once it completed.
+    The journal is cleared when the last step returns.
+    """
+    always = always or {}
+    fingerprints, previous = {}, []
+    for func in funcs:
+        fingerprints[func] = step_fingerprint(func, previous)
+        previous = [fingerprints[func]]
+    for func in funcs:
+        if func in always:
+            if not journal.completed(always[func].__name__, fingerprints[always[func]]):
+                func()
+        else:
+            journal.run(func.__name__, fingerprints[func], func)
+    journal.clear()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+import argparse
+import collections
+import json
+import os
+import socket
+import struct
+import tempfile
+
+from command import run_command
+
+# Configuration
+PROC_ROUTE = "/proc/net/route"  # IPv4 routing table, the nodes disable IPv6
+
+# netlink constants from linux/netlink.h and linux/rtnetlink.h
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+RTM_NEWADDR = 20
+RTM_GETADDR = 22
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+NLMSG_HEADER = struct.Struct("=IHHII")  # length, type, flags, sequence, port
+IFADDRMSG = struct.Struct("=BBBBI")  # family, prefix length, flags, scope, interface index
+RTATTR = struct.Struct("=HH")  # length, type
+
+# What the node's network looks like at one moment
+Interface = collections.namedtuple("Interface", ["name", "index", "up"])
+Address = collections.namedtuple("Address", ["interface", "family", "address", "prefix"])  # family 4 or 6
+Route = collections.namedtuple("Route", ["destination", "prefix", "gateway", "interface", "metric"])
+Snapshot = collections.namedtuple("Snapshot", ["interfaces", "addresses", "routes"])
+
+def align(length):
+    return (length + 3) & ~3
+
+def parse_addresses(data, names):
+    """
+    Turns RTM_NEWADDR messages into Address tuples. Returns (addresses, done).
+    """
+    addresses = []
+    offset = 0
+    while offset + NLMSG_HEADER.size <= len(data):
+        length, message_type, _, _, _ = NLMSG_HEADER.unpack_from(data, offset)
+        if message_type == NLMSG_DONE:
+            return addresses, True
+        if message_type == NLMSG_ERROR:
+            error = -struct.unpack_from("=i", data, offset + NLMSG_HEADER.size)[0]
+            raise OSError(error, os.strerror(error))
+        if message_type == RTM_NEWADDR:
+            family, prefix, _, _, index = IFADDRMSG.unpack_from(data, offset + NLMSG_HEADER.size)
+            attributes = {}
+            position = offset + NLMSG_HEADER.size + IFADDRMSG.size
+            while position + RTATTR.size <= offset + length:
+                attribute_length, attribute_type = RTATTR.unpack_from(data, position)
+                if attribute_length < RTATTR.size:
+                    break
+                attributes[attribute_type] = data[position + RTATTR.size:position + attribute_length]
+                position += align(attribute_length)
+            # On point-to-point links IFA_ADDRESS is the peer, IFA_LOCAL our own address
+            raw = attributes.get(IFA_LOCAL, attributes.get(IFA_ADDRESS))
+            if raw is not None and family in (socket.AF_INET, socket.AF_INET6):
+                addresses.append(Address(names.get(index, str(index)), 4 if family == socket.AF_INET else 6,
+                                         socket.inet_ntop(family, raw), prefix))
+        offset += align(length)
+    return addresses, False
+
+def read_addresses(names):
+    """
+    Dumps every address of every interface with one netlink request.
+    """
+    with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE) as netlink:
+        netlink.bind((0, 0))
+        request = IFADDRMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+        netlink.send(NLMSG_HEADER.pack(NLMSG_HEADER.size + len(request), RTM_GETADDR,
+                                       NLM_F_REQUEST | NLM_F_DUMP, 1, 0) + request)
+        addresses = []
+        done = False
+        while not done:
+            found, done = parse_addresses(netlink.recv(65536), names)
+            addresses += found
+    return addresses
+
+def hex_address(value):
+    return socket.inet_ntoa(struct.pack("<I", int(value, 16)))
+
+def parse_routes(content):
+    """
+    Parses /proc/net/route into Route tuples.
+    """
+    routes = []
+    for line in content.splitlines()[1:]:
+        fields = line.split()
+        if len(fields) < 8:
+            continue
+        interface, destination, gateway, _, _, _, metric, mask = fields[:8]
+        routes.append(Route(hex_address(destination), bin(int(mask, 16)).count("1"),
+                            hex_address(gateway) if int(gateway, 16) else None, interface, int(metric)))
+    return routes
+
+def interface_up(name):
+    try:
+        with open(f"/sys/class/net/{name}/operstate") as state_file:
+            return state_file.read().strip() in ("up", "unknown")
+    except OSError:
+        return False
+
+def snapshot():
+    """
+    Reads interfaces, addresses and routes once, without forking.
+    """
+    names = dict(socket.if_nameindex())
+    interfaces = [Interface(name, index, interface_up(name)) for index, name in sorted(names.items())]
+    with open(PROC_ROUTE) as route_file:
+        routes = parse_routes(route_file.read())
+    return Snapshot(interfaces, read_addresses(names), routes)
+
+def addresses_of(current, interface, family=4):
+    return [address.address for address in current.addresses if address.interface == interface and address.family == family]
+
+def default_routes(current):
+    return [route for route in current.routes if route.destination == "0.0.0.0" and route.prefix == 0]
+
+def missing_interfaces(current, names):
+    present = {interface.name for interface in current.interfaces}
+    return [name for name in names if name not in present]
+
+def to_json(current):
+    return json.dumps({field: [item._asdict() for item in getattr(current, field)] for field in Snapshot._fields}, indent=2)
+
+def from_json(content):
+    data = json.loads(content)
+    return Snapshot([Interface(**item) for item in data["interfaces"]],
+                    [Address(**item) for item in data["addresses"]],
+                    [Route(**item) for item in data["routes"]])
+
+def record(path, current=None):
+    """
+    Saves a snapshot, by default of the live network, for tests and for later comparison.
+    """
+    with open(path, "w") as snapshot_file:
+        snapshot_file.write(to_json(current or snapshot()))
+
+def load(path):
+    with open(path) as snapshot_file:
+        return from_json(snapshot_file.read())
+
+def default_route_removals(current, routes_to_remove):
+    """
+    Plans the removal of the default routes given as {interface: gateway}, only those
+    present in the snapshot. Returns `ip -batch` lines.
+    """
+    present = {(route.interface, route.gateway) for route in default_routes(current)}
+    return [f"route del default via {gateway} dev {interface}"
+            for interface, gateway in routes_to_remove.items() if (interface, gateway) in present]
+
+def apply_batch(lines):
+    """
+    Applies all route changes with a single `ip -batch` call. Returns True when nothing
+    needed to change or every line succeeded.
+    """
+    if not lines:
+        return True
+    with tempfile.NamedTemporaryFile("w", suffix=".ip") as batch:
+        batch.write("\n".join(lines) + "\n")
+        batch.flush()
+        return run_command(["ip", "-batch", batch.name]) is not None
+
+def main():
+    """
+    Shows or records the node's network: netinspect.py show | netinspect.py record snapshot.json
+    """
+    parser = argparse.ArgumentParser(description="Read interfaces, addresses and routes in one pass.")
+    parser.add_argument("action", choices=["show", "record"])
+    parser.add_argument("path", nargs="?", help="File to record the snapshot to")
+    args = parser.parse_args()
+    current = snapshot()
+    if args.action == "record":
+        if not args.path:
+            parser.error("record needs a path")
+        record(args.path, current)
+        print(f"Recorded {len(current.interfaces)} interfaces, {len(current.addresses)} addresses "
+              f"and {len(current.routes)} routes to {args.path}")
+        return
+    for interface in current.interfaces:
+        addresses = ", ".join(f"{address.address}/{address.prefix}" for address in current.addresses
+                              if address.interface == interface.name)
+        print(f"{interface.name:<12} {'up' if interface.up else 'down':<5} {addresses}")
+    for route in current.routes:
+        via = f" via {route.gateway}" if route.gateway else ""
+        print(f"{route.destination}/{route.prefix}{via} dev {route.interface} metric {route.metric}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+
+import desired_state
+from command import run_command
+
+# Configuration
+CONFIG_FILE = "/etc/netplan/01-netcfg.yaml"
+RENDERER = "networkd"
+FILE_MODE = 0o600  # netplan warns about world readable configuration
+
+# Per adapter spec, dhcp4 or addresses is required, the rest is optional:
+#   dhcp4          True for DHCP; never assumed, an adapter is not switched to DHCP implicitly
+#   addresses      ["172.100.55.20/24"]
+#   gateway        default gateway of a static adapter
+#   routes         [{"to": "10.0.0.0/8", "via": "172.100.55.1"}]
+#   nameservers    ["172.100.55.2"]
+#   default_route  False to ignore the default route DHCP offers on this adapter
+
+def yaml_list(values):
+    return "[" + ", ".join(str(value) for value in values) + "]"
+
+def render_adapter(name, spec):
+    addresses = spec.get("addresses", [])
+    if not addresses and "dhcp4" not in spec:
+        raise ValueError(f"Adapter {name} needs addresses or dhcp4")
+    lines = [f"    {name}:", f"      dhcp4: {'true' if spec.get('dhcp4') else 'false'}"]
+    if spec.get("default_route", True) is False:
+        lines += ["      dhcp4-overrides:", "        use-routes: false"]
+    if addresses:
+        lines.append(f"      addresses: {yaml_list(addresses)}")
+    routes = list(spec.get("routes", []))
+    if spec.get("gateway"):
+        routes.insert(0, {"to": "default", "via": spec["gateway"]})
+    if routes:
+        lines.append("      routes:")
+        for route in routes:
+            lines += [f"        - to: {route['to']}", f"          via: {route['via']}"]
+    if spec.get("nameservers"):
+        lines += ["      nameservers:", f"        addresses: {yaml_list(spec['nameservers'])}"]
+    return lines
+
+def render(adapters, renderer=RENDERER):
+    """
+    Renders netplan YAML for {adapter: spec}. The output only depends on the spec, so it
+    can be compared byte for byte with the file on disk.
+    """
+    lines = ["# Written by netplan.py, local edits are overwritten", "network:", "  version: 2",
+             f"  renderer: {renderer}", "  ethernets:"]
+    for name, spec in adapters.items():
+        lines += render_adapter(name, spec)
+    return "\n".join(lines) + "\n"
+
+def configured(adapters, path=CONFIG_FILE):
+    return desired_state.read_file(path) == render(adapters)
+
+def write(path, content):
+    temp_file = path + ".tmp"
+    with open(os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, FILE_MODE), "w") as netplan_file:
+        netplan_file.write(content)
+    os.replace(temp_file, path)
+
+def converge(adapters, path=CONFIG_FILE):
+    """
+    Writes the rendered configuration and runs `netplan apply`, only when the content changed:
+    every apply bounces the links. A configuration netplan rejects is rolled back before
+    anything is applied. Returns True when the network was reconfigured.
+    """
+    content = render(adapters)
+    previous = desired_state.read_file(path)
+    if previous == content:
+        print(f"{path} is up to date. Not running netplan apply.")
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write(path, content)
+    if run_command(["netplan", "generate"]) is None:
+        if previous is None:
+            os.remove(path)
+        else:
+            write(path, previous)
+        raise RuntimeError(f"netplan rejected the rendered {path}, kept the previous configuration.")
+    if run_command(["netplan", "apply"]) is None:
+        raise RuntimeError("netplan apply failed.")
+    print(f"Applied {path}.")
+    return True
+
+def parse_adapter(text):
+    """
+    Parses an adapter given on the command line: NAME:OPTION,... where an option is an
+    address in CIDR form, via=GATEWAY, dns=SERVER, dhcp or no-default-route. An address or
+    dhcp is required.
+    """
+    name, _, options = text.partition(":")
+    spec = {}
+    for option in filter(None, options.split(",")):
+        if option == "dhcp":
+            spec["dhcp4"] = True
+        elif option == "no-default-route":
+            spec["default_route"] = False
+        elif option.startswith("via="):
+            spec["gateway"] = option[4:]
+        elif option.startswith("dns="):
+            spec.setdefault("nameservers", []).append(option[4:])
+        elif "/" in option:
+            spec.setdefault("addresses", []).append(option)
+        else:
+            raise ValueError(f"Unknown option {option!r} for adapter {name}")
+    if "addresses" not in spec and "dhcp4" not in spec:
+        raise ValueError(f"Adapter {name} needs an address or dhcp")
+    return name, spec
+
+def main():
+    """
+    Renders and applies the netplan file when it changed:
+    netplan.py ens34:172.100.55.20/24,via=172.100.55.1 ens35:dhcp,no-default-route
+    netplan.py --spec adapters.json --dry-run
+    """
+    parser = argparse.ArgumentParser(description="Render netplan configuration and apply it only when it changed.")
+    parser.add_argument("adapters", nargs="*", help="NAME:OPTION,...")
+    parser.add_argument("--spec", help="JSON file with {adapter: spec}")
+    parser.add_argument("--file", default=CONFIG_FILE)
+    parser.add_argument("--dry-run", action="store_true", help="Print the rendered file and whether it differs")
+    args = parser.parse_args()
+    adapters = {}
+    if args.spec:
+        with open(args.spec) as spec_file:
+            adapters.update(json.load(spec_file))
+    try:
+        adapters.update(parse_adapter(text) for text in args.adapters)
+    except ValueError as e:
+        parser.error(str(e))
+    if not adapters:
+        parser.error("no adapters given")
+    if args.dry_run:
+        try:
+            sys.stdout.write(render(adapters))
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"# {args.file} {'is up to date' if configured(adapters, args.file) else 'would change'}")
+        return
+    if os.geteuid() != 0:
+        print("This script must be run as root. Please try again with 'sudo'.")
+        sys.exit(1)
+    try:
+        converge(adapters, args.file)
+    except (RuntimeError, ValueError) as e:
+        print(e)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
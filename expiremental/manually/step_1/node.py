@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import shutil
+import sys
+from datetime import datetime
+
+import desired_state
+import discovery
+import firewall
+import image_cache
+import journal
+import netplan
+import netinspect
+import ntp_probe
+import packages
+import resolvers
+import scheduler
+import services
+import sysctl_manager
+import tracing
+import waiters
+from command import run_command
+
+# Configuration
+role = "control-plane"  # control-plane or worker; apply_spec() sets the role's defaults from ROLE_DEFAULTS
+adapters = ["ens34", "ens35", "ens36"]  # Network adapters of the node, the first one carries the node address
+config_file = "/etc/netplan/01-netcfg.yaml"  # Path to the netplan configuration file
+adapter_settings = {}  # netplan spec per adapter to manage, e.g. {"ens34": {"addresses": ["172.100.55.20/24"], "gateway": "172.100.55.1"}}; empty leaves netplan alone
+hostname = "k8-controlplane"  # Hostname of the node
+routes_to_remove = {
+    "ens35": "192.168.79.1",
+    "ens36": "192.168.69.1"
+}
+nameserver = "172.100.55.2"  # Desired nameserver for DNS resolution
+fallback_nameservers = []  # Public resolvers after the nameserver, ranked by measured latency, e.g. ["8.8.4.4"]
+dns_cache = False  # True: resolve through a local systemd-resolved cache forwarding to the ranked resolvers
+kubernetes_tools = ["kubeadm", "kubectl", "kubelet"]  # Packages removed before a fresh install
+kubernetes_directories = ["/etc/kubernetes", "/var/lib/kubelet"]  # State left behind by a previous install
+sysctl_conf = "/etc/sysctl.d/99-sysctl.conf"  # Drop-in holding the IPv6 settings
+ipv6_config = [
+    "net.ipv6.conf.all.disable_ipv6 = 1",
+    "net.ipv6.conf.default.disable_ipv6 = 1"
+]
+firewall_profile = "control-plane"  # Port profile from firewall.PORT_PROFILES
+ntp = False  # True: install ntp and write the fastest of the servers below to ntp_conf
+ntp_conf = "/etc/ntp.conf"
+ntp_servers = [
+    "0.pool.ntp.org", "1.pool.ntp.org", "2.pool.ntp.org", "3.pool.ntp.org",
+    "time.google.com", "time.cloudflare.com", "time.apple.com", "time.windows.com",
+]
+ntp_inhouse_servers = []  # Own NTP servers, ranked together with the public ones
+ntp_server_count = 4  # Fastest servers written to ntp_conf
+
+# What differs between the roles; anything else comes from the node spec
+ROLE_DEFAULTS = {
+    "control-plane": {"hostname": "k8-controlplane", "firewall_profile": "control-plane"},
+    "worker": {"hostname": "worker-node-01", "firewall_profile": "worker"},
+}
+
+def remove_kubernetes_tools():
+    """
+    Checks for and removes existing Kubernetes tools (kubeadm, kubectl, kubelet).
+    """
+    print("Checking and removing existing Kubernetes tools if found...")
+    transaction = packages.PackageTransaction()
+    for tool in kubernetes_tools:
+        tool_path = discovery.which(tool)
+        if tool_path:
+            print(f"{tool} found at {tool_path}. Removing...")
+            transaction.purge(tool)
+        else:
+            print(f"{tool} not found. Assuming it has already been removed.")
+
+    # One purge and one autoremove for all the tools found
+    removed = ", ".join(sorted(transaction.purges))
+    if removed and transaction.commit():
+        print(f"{removed} and related dependencies have been removed.")
+
+    # Remove Kubernetes-related directories
+    for directory in kubernetes_directories:
+        if os.path.exists(directory):
+            print(f"Removing directory: {directory}")
+            run_command(["rm", "-rf", directory])
+
+    print("Kubernetes tools and related components cleaned up.")
+
+def kubernetes_tools_removed():
+    """
+    Checks that no Kubernetes tool or leftover directory is present.
+    """
+    if any(discovery.which(tool) for tool in kubernetes_tools):
+        return False
+    return not any(os.path.exists(directory) for directory in kubernetes_directories)
+
+def configure_dns():
+    """
+    Configures DNS to use the nameserver, then the fastest reachable fallback nameservers.
+    """
+    if fallback_nameservers:
+        print(f"Ranking fallback nameservers {', '.join(fallback_nameservers)}...")
+    servers = resolvers.order(nameserver, fallback_nameservers)
+    if dns_cache:
+        resolvers.configure_cache(servers)
+        print(f"DNS cached locally, forwarding to {', '.join(servers)}.")
+    else:
+        resolvers.write_resolv_conf(servers)
+        print(f"Nameservers set to {', '.join(servers[:resolvers.MAX_NAMESERVERS])}.")
+    print("DNS configured successfully.")
+
+def dns_configured():
+    """
+    Checks that DNS already uses the nameserver first and nothing but the fallbacks after it.
+    """
+    candidates = [nameserver] + fallback_nameservers
+    if dns_cache:
+        return resolvers.cache_configured(candidates)
+    configured = resolvers.configured_nameservers()
+    return configured[:1] == [nameserver] and set(configured) <= set(candidates)
+
+def disable_ipv6():
+    """
+    Disables IPv6 permanently.
+    """
+    print("Disabling IPv6 permanently...")
+
+    # Only the keys that differ are written to /proc/sys, no `sysctl --system` reload
+    if not sysctl_manager.converge(sysctl_conf, sysctl_manager.parse_settings(ipv6_config)):
+        raise RuntimeError("Could not disable IPv6.")
+    print("IPv6 successfully disabled.")
+
+def ipv6_disabled():
+    """
+    Checks that the IPv6 settings are both persisted and active.
+    """
+    return sysctl_manager.converged(sysctl_conf, sysctl_manager.parse_settings(ipv6_config))
+
+def disable_swap():
+    """
+    Disables swap memory to comply with Kubernetes requirements.
+    """
+    print("Disabling swap...")
+    run_command(['swapoff', '-a'])
+    with open("/etc/fstab", "r+") as fstab:
+        lines = fstab.readlines()
+        fstab.seek(0)
+        for line in lines:
+            if "swap" not in line:
+                fstab.write(line)
+        fstab.truncate()
+    print("Swap has been disabled.")
+
+def swap_disabled():
+    """
+    Checks that no swap is active and none is configured in fstab.
+    """
+    return not desired_state.swap_active() and not desired_state.fstab_swap_entries()
+
+def hosts_entries(current):
+    """
+    /etc/hosts lines for the hostname: 127.0.1.1 and the first IPv4 address of the primary adapter.
+    """
+    primary = netinspect.addresses_of(current, adapters[0])[:1]
+    return [f"{address} {hostname}" for address in ["127.0.1.1", *primary]]
+
+def set_hostname():
+    """
+    Sets the hostname of the machine and adds it to /etc/hosts.
+    """
+    print(f"Setting hostname to {hostname}...")
+    run_command(['hostnamectl', 'set-hostname', hostname])
+    current = netinspect.snapshot()
+    missing = netinspect.missing_interfaces(current, adapters)
+    if missing:
+        print(f"Adapters not found on this node: {', '.join(missing)}")
+    entries = [entry for entry in hosts_entries(current) if not desired_state.file_has_lines("/etc/hosts", [entry])]
+    if entries:
+        with open("/etc/hosts", "a") as hosts_file:
+            hosts_file.write("".join(f"{entry}\n" for entry in entries))
+    print(f"Hostname set to {hostname}")
+
+def hostname_set():
+    """
+    Checks the hostname and its /etc/hosts entries.
+    """
+    current = (desired_state.read_file("/etc/hostname") or "").strip()
+    return current == hostname and desired_state.file_has_lines("/etc/hosts", hosts_entries(netinspect.snapshot()))
+
+def update_system():
+    """
+    Updates all system packages to the latest versions.
+    """
+    print("Updating system packages...")
+    if not packages.refresh_index():
+        raise RuntimeError("Could not refresh the package index.")
+    if run_command(['apt', 'upgrade', '-y'], stream=True) is None:
+        raise RuntimeError("apt upgrade failed.")
+    print("System packages have been updated.")
+
+def system_up_to_date(refresh=False):
+    """
+    Checks that apt has nothing to upgrade against the index already on the node;
+    update_system refreshes it. refresh=True refreshes it first if it is due.
+    """
+    if refresh and not packages.refresh_index():
+        return False
+    simulation = run_command(['apt-get', '-s', 'upgrade'])
+    return simulation is not None and not any(line.startswith("Inst ") for line in simulation.splitlines())
+
+def configure_firewall():
+    """
+    Configures the UFW firewall to allow necessary Kubernetes ports.
+    """
+    print("Configuring firewall for Kubernetes ports...")
+    # Only the missing ports are added, in one batch and without reloading ufw
+    if not firewall.apply_profile(firewall_profile):
+        raise RuntimeError("Could not configure the firewall.")
+    print("Firewall configured for Kubernetes ports.")
+
+def firewall_configured():
+    """
+    Checks that ufw is enabled and already allows every Kubernetes port.
+    """
+    return firewall.ufw_enabled() and not firewall.missing_ports(firewall_profile)
+
+def netplan_adapters():
+    """
+    netplan spec of the adapters adapter_settings names, and only those: an adapter is never
+    switched to DHCP or a new address on its own, netplan.render() wants dhcp4 or addresses.
+    Adapters in routes_to_remove keep their default route out of the file, so it does not
+    come back on renewal; without settings they are left to remove_default_routes.
+    """
+    spec = {}
+    for adapter, settings in adapter_settings.items():
+        spec[adapter] = dict(settings)
+        if adapter in routes_to_remove:
+            spec[adapter]["default_route"] = False
+    return spec
+
+def configure_network():
+    """
+    Writes the netplan configuration of the adapters in adapter_settings and applies it if it changed.
+    """
+    spec = netplan_adapters()
+    if not spec:
+        print("No adapter_settings in the node spec. Leaving the network configuration alone.")
+        return
+    print(f"Configuring {', '.join(spec)} in {config_file}...")
+    netplan.converge(spec, config_file)
+
+def network_configured():
+    """
+    Checks that nothing is to be configured or the netplan file matches the rendered configuration.
+    """
+    spec = netplan_adapters()
+    return not spec or netplan.configured(spec, config_file)
+
+def remove_default_routes():
+    """
+    Removes specific default routes as required for Kubernetes network setup.
+    """
+    print("Removing specific default routes...")
+    # One read of the routing table, then every deletion in a single `ip -batch` call
+    removals = netinspect.default_route_removals(netinspect.snapshot(), routes_to_remove)
+    if not removals:
+        print("None of the default routes to remove is present. Skipping.")
+    elif netinspect.apply_batch(removals):
+        for line in removals:
+            print(f"Removed {line[len('route del '):]}")
+    else:
+        raise RuntimeError("Could not remove the default routes.")
+
+def default_routes_removed():
+    """
+    Checks that none of the default routes to remove is present.
+    """
+    return not netinspect.default_route_removals(netinspect.snapshot(), routes_to_remove)
+
+def ntp_config(servers):
+    return "\n".join(["# NTP configuration generated by script"] + [f"server {host} iburst" for host in servers]) + "\n"
+
+def configure_ntp():
+    """
+    Installs ntp and points it at the fastest reachable servers. A restart is queued only
+    when ntp.conf changed; start_services() applies it.
+    """
+    print("Configuring NTP...")
+    transaction = packages.PackageTransaction()
+    transaction.install("ntp")
+    if not transaction.commit():
+        raise RuntimeError("Failed to install NTP.")
+    # Probe every candidate at once and keep only the fastest reachable ones
+    content = ntp_config(ntp_probe.best_servers(ntp_inhouse_servers + ntp_servers, ntp_server_count))
+    if desired_state.read_file(ntp_conf) != content:
+        if os.path.exists(ntp_conf):
+            shutil.copy2(ntp_conf, f"{ntp_conf}.bak_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}")
+        with open(ntp_conf + ".tmp", "w") as ntp_file:
+            ntp_file.write(content)
+        os.replace(ntp_conf + ".tmp", ntp_conf)
+        services.restart("ntp")
+    services.enable("ntp")
+
+def ntp_configured():
+    """
+    Checks that ntp is not wanted, or installed with only known servers in ntp_conf.
+    """
+    if not ntp:
+        return True
+    configured = [line.split()[1] for line in (desired_state.read_file(ntp_conf) or "").splitlines()
+                  if line.startswith("server ") and len(line.split()) > 1]
+    return bool(discovery.which("ntpd")) and bool(configured) and set(configured) <= set(ntp_inhouse_servers + ntp_servers)
+
+def verify_kubeadm_preflight():
+    """
+    Verifies kubeadm preflight checks.
+    """
+    print("Running kubeadm preflight checks...")
+    if discovery.which("kubeadm"):
+        # Images imported from the shared image cache do not need to come from the registry again
+        images = run_command(['kubeadm', 'config', 'images', 'list'], ignore_errors=True)
+        if images and image_cache.images_present(images.split()):
+            print("Preflight checks passed. All images are already present.")
+            return
+        result = run_command(['kubeadm', 'config', 'images', 'pull'], ignore_errors=True, stream=True)
+        if result is not None:
+            print("Preflight checks passed. Images pulled successfully.")
+        else:
+            print("Preflight checks failed. Verify kubeadm readiness.")
+    else:
+        print("kubeadm is not installed. Skipping preflight checks.")
+
+def start_services():
+    """
+    Applies the service restarts and enables the other steps queued, each unit at most once.
+    """
+    changed = services.apply()
+    if "ntp" in changed:
+        # systemctl returns before the clock is synchronised; etcd and certificates need it to be
+        try:
+            waiters.wait_for_ntp_sync()
+        except TimeoutError as e:
+            print(f"{e} Continuing, the clock may still be converging.")
+
+# What each step needs and provides; main() and fleet.py start every step as soon as its
+# needs are met and skip it when its check says the node is already converged.
+# apt only waits for DNS; the sysctl and route changes run alongside it.
+STEPS = [
+    scheduler.step(update_system, needs=["dns"], provides=["packages-updated"],
+                   locks=[scheduler.DPKG_LOCK], check=system_up_to_date),  # Update system packages
+    scheduler.step(remove_kubernetes_tools, provides=["kube-tools-removed"],
+                   locks=[scheduler.DPKG_LOCK], check=kubernetes_tools_removed),  # Remove existing Kubernetes tools if found
+    scheduler.step(configure_dns, provides=["dns"], check=dns_configured),  # Configure DNS
+    scheduler.step(disable_ipv6, provides=["ipv6-disabled"], check=ipv6_disabled),  # Disable IPv6 permanently
+    scheduler.step(set_hostname, provides=["hostname"], check=hostname_set),  # Set system hostname
+    scheduler.step(disable_swap, provides=["swap-disabled"], check=swap_disabled),  # Disable swap
+    scheduler.step(configure_firewall, provides=["firewall"], check=firewall_configured),  # Setup firewall
+    scheduler.step(configure_network, provides=["network"], check=network_configured),  # Write and apply the netplan file
+    scheduler.step(remove_default_routes, needs=["network"], provides=["routes"],
+                   check=default_routes_removed),  # Remove specified default routes
+    scheduler.step(configure_ntp, needs=["dns"], provides=["ntp"],
+                   locks=[scheduler.DPKG_LOCK], check=ntp_configured),  # Install NTP with the fastest servers, if ntp is set
+    scheduler.step(verify_kubeadm_preflight,
+                   needs=["packages-updated", "kube-tools-removed", "hostname", "swap-disabled", "firewall"],
+                   provides=["preflight"]),  # Run kubeadm preflight checks
+    scheduler.step(start_services, needs=["dns", "ntp"], provides=["services"],
+                   check=services.nothing_pending),  # Restart and enable the services the steps above changed
+]
+
+def apply_spec(spec):
+    """
+    Configures this module for one node from its spec, e.g. {"role": "worker", "hostname": "worker-node-02"}.
+    The role's defaults come first, every other key replaces the configuration value of the same name.
+    """
+    settings = dict(spec)
+    node_role = settings.pop("role", role)
+    if node_role not in ROLE_DEFAULTS:
+        raise ValueError(f"Unknown role {node_role!r}, expected one of {', '.join(ROLE_DEFAULTS)}")
+    settings = dict(ROLE_DEFAULTS[node_role], **settings)
+    unknown = [key for key in settings if key.startswith("_") or key.isupper() or key not in journal.module_config(apply_spec)]
+    if unknown:
+        raise ValueError(f"Unknown setting(s): {', '.join(sorted(unknown))}")
+    globals().update(settings, role=node_role)
+
+def load_spec(path):
+    with open(path, "r") as spec_file:
+        return json.load(spec_file)
+
+def main():
+    """
+    Main function to setup the machine for Kubernetes: node.py --role worker [--spec node.json]
+    """
+    parser = argparse.ArgumentParser(description="Prepare this machine as a Kubernetes node.")
+    parser.add_argument("--role", choices=list(ROLE_DEFAULTS), help=f"Node role (default: {role})")
+    parser.add_argument("--spec", help="JSON node spec, e.g. {\"role\": \"worker\", \"hostname\": \"worker-node-02\"}")
+    args = parser.parse_args()
+    if args.spec or args.role:
+        spec = load_spec(args.spec) if args.spec else {}
+        if args.role:
+            spec["role"] = args.role
+        apply_spec(spec)
+
+    if os.geteuid() != 0:
+        print("This script must be run as root. Please try again with 'sudo'.")
+        return
+
+    # A re-run after a failure resumes where this one stopped, see journal.py. The journal is
+    # named after the script that was started, so each wrapper and its spec keeps its own
+    results = scheduler.run_steps(STEPS, step_journal=journal.Journal.for_script(sys.argv[0]))
+    tracing.print_summary()
+    if "failed" in results.values():
+        exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+import argparse
+import collections
+import socket
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Configuration
+NTP_PORT = 123
+PROBE_TIMEOUT = 1.0  # Seconds to wait for a server's answer
+DEFAULT_COUNT = 4  # Servers written to ntp.conf
+NTP_EPOCH_OFFSET = 2208988800  # Seconds from 1900-01-01 (NTP) to 1970-01-01 (Unix)
+
+# A server that answered: round trip in seconds, stratum and clock offset against this node
+NtpResult = collections.namedtuple("NtpResult", ["host", "address", "rtt", "stratum", "offset"])
+
+def to_ntp(timestamp):
+    seconds = int(timestamp) + NTP_EPOCH_OFFSET
+    return struct.pack("!II", seconds, int((timestamp % 1) * 2**32))
+
+def from_ntp(data):
+    seconds, fraction = struct.unpack("!II", data)
+    return seconds - NTP_EPOCH_OFFSET + fraction / 2**32
+
+def query(host, port=NTP_PORT, timeout=PROBE_TIMEOUT):
+    """
+    Sends one SNTP client request and returns an NtpResult, or None when the server does
+    not answer, answers garbage or is not synchronised itself (stratum 0 or 16).
+    """
+    try:
+        family, _, _, _, address = socket.getaddrinfo(host, port, type=socket.SOCK_DGRAM)[0]
+    except socket.gaierror:
+        return None
+    client = socket.socket(family, socket.SOCK_DGRAM)
+    client.settimeout(timeout)
+    try:
+        sent_at = time.time()
+        started = time.monotonic()
+        # LI 0, version 4, mode 3 (client); our send time goes into the transmit timestamp
+        client.sendto(b"\x23" + b"\0" * 39 + to_ntp(sent_at), address)
+        while True:
+            data, sender = client.recvfrom(512)
+            if sender[:2] == address[:2]:
+                break
+        rtt = time.monotonic() - started
+    except OSError:
+        return None
+    finally:
+        client.close()
+
+    if len(data) < 48 or data[0] & 0x07 != 4:
+        return None
+    stratum = data[1]
+    if stratum == 0 or stratum >= 16:
+        return None
+    received, transmitted = from_ntp(data[32:40]), from_ntp(data[40:48])
+    offset = ((received - sent_at) + (transmitted - (sent_at + rtt))) / 2
+    return NtpResult(host, address[0], rtt, stratum, offset)
+
+def probe(hosts, port=NTP_PORT, timeout=PROBE_TIMEOUT):
+    """
+    Queries all hosts at the same time. Returns the ones that answered, fastest first,
+    lower stratum first among equally fast ones.
+    """
+    hosts = list(dict.fromkeys(hosts))
+    if not hosts:
+        return []
+    with ThreadPoolExecutor(max_workers=len(hosts)) as pool:
+        results = pool.map(lambda host: query(host, port, timeout), hosts)
+        answered = [result for result in results if result]
+    return sorted(answered, key=lambda result: (round(result.rtt, 3), result.stratum))
+
+def best_servers(candidates, count=DEFAULT_COUNT, port=NTP_PORT, timeout=PROBE_TIMEOUT):
+    """
+    Returns the 'count' fastest reachable hosts. When none answers, the first 'count'
+    candidates are returned so ntp.conf never ends up without servers.
+    """
+    ranked = probe(candidates, port, timeout)
+    for result in ranked:
+        print(f"  {result.host:<24} {result.rtt * 1000:7.1f} ms  stratum {result.stratum}")
+    if not ranked:
+        print("No NTP server answered. Keeping the first of the configured servers.")
+        return list(dict.fromkeys(candidates))[:count]
+    dropped = len(set(candidates)) - len(ranked)
+    if dropped:
+        print(f"Dropped {dropped} unreachable server(s).")
+    return [result.host for result in ranked[:count]]
+
+def main():
+    """
+    Ranks NTP servers by round trip: ntp_probe.py 0.pool.ntp.org time.google.com ...
+    """
+    parser = argparse.ArgumentParser(description="Query NTP servers in parallel and rank them by latency.")
+    parser.add_argument("servers", nargs="+")
+    parser.add_argument("--count", type=int, default=DEFAULT_COUNT)
+    parser.add_argument("--port", type=int, default=NTP_PORT)
+    parser.add_argument("--timeout", type=float, default=PROBE_TIMEOUT)
+    args = parser.parse_args()
+    for host in best_servers(args.servers, args.count, args.port, args.timeout):
+        print(f"server {host} iburst")
+
+if __name__ == "__main__":
+    main()
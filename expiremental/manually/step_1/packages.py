@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+import hashlib
+import os
+import time
+
+from command import run_command
+
+# Configuration
+APT_SOURCES = ["/etc/apt/sources.list", "/etc/apt/sources.list.d"]  # Files that decide what apt-get update fetches
+STATE_DIR = "/var/lib/k8-provisions"  # Bookkeeping kept between runs
+INDEX_STAMP = os.path.join(STATE_DIR, "apt-sources.sha256")  # Fingerprint of the sources at the last refresh
+INDEX_MAX_AGE = 6 * 3600  # Refresh anyway once the index is this old (seconds)
+
+def sources_fingerprint():
+    """
+    Hashes the names and contents of all apt source files.
+    """
+    digest = hashlib.sha256()
+    for source in APT_SOURCES:
+        if os.path.isdir(source):
+            paths = [os.path.join(source, name) for name in sorted(os.listdir(source))
+                     if name.endswith((".list", ".sources"))]
+        else:
+            paths = [source]
+        for path in paths:
+            if os.path.isfile(path):
+                digest.update(path.encode() + b"\0")
+                with open(path, "rb") as source_file:
+                    digest.update(source_file.read() + b"\0")
+    return digest.hexdigest()
+
+def refresh_index(force=False):
+    """
+    Runs apt-get update, but only when the source lists changed since the last refresh
+    or the index got older than INDEX_MAX_AGE. Returns False if apt-get update failed.
+    """
+    fingerprint = sources_fingerprint()
+    if not force and os.path.exists(INDEX_STAMP):
+        with open(INDEX_STAMP, "r") as stamp:
+            unchanged = stamp.read().strip() == fingerprint
+        if unchanged and time.time() - os.path.getmtime(INDEX_STAMP) < INDEX_MAX_AGE:
+            print("Package sources unchanged since the last refresh. Skipping apt-get update.")
+            return True
+
+    print("Refreshing the package index...")
+    if run_command(["apt-get", "update"], stream=True) is None:
+        return False
+    os.makedirs(STATE_DIR, exist_ok=True)
+    with open(INDEX_STAMP, "w") as stamp:
+        stamp.write(fingerprint + "\n")
+    return True
+
+class PackageTransaction:
+    """
+    Collects the installs, purges and holds a run asks for and applies them together:
+    one apt-get call for all installs and purges (with a single autoremove) and one apt-mark call for the holds.
+    """
+
+    def __init__(self):
+        self.installs = {}  # package -> pinned version or None
+        self.purges = set()
+        self.holds = set()
+
+    def install(self, *packages):
+        """
+        Queues packages for installation, "name" or "name=version".
+        """
+        for package in packages:
+            name, _, version = package.partition("=")
+            self.installs[name] = version or None
+            self.purges.discard(name)
+
+    def purge(self, *packages):
+        """
+        Queues packages for removal together with their configuration.
+        """
+        for package in packages:
+            self.installs.pop(package, None)
+            self.holds.discard(package)
+            self.purges.add(package)
+
+    def hold(self, *packages):
+        """
+        Queues packages to be held at their installed version.
+        """
+        self.holds.update(packages)
+
+    def empty(self):
+        return not (self.installs or self.purges or self.holds)
+
+    def apt_arguments(self):
+        """
+        Builds the package arguments of the apt-get call, purges are marked with apt's '_' suffix.
+        """
+        arguments = [f"{name}={version}" if version else name for name, version in sorted(self.installs.items())]
+        return arguments + [f"{name}_" for name in sorted(self.purges)]
+
+    def describe(self):
+        """
+        The queued changes for the log, one operation per group: "install a b=1.0, purge c".
+        """
+        installs = [f"{name}={version}" if version else name for name, version in sorted(self.installs.items())]
+        parts = [f"install {' '.join(installs)}" if installs else "", f"purge {' '.join(sorted(self.purges))}" if self.purges else ""]
+        return ", ".join(part for part in parts if part)
+
+    def commit(self, options=(), allow_held=False):
+        """
+        Applies everything queued so far. 'options' go to apt-get, e.g. prefetch.apt_options().
+        Held packages stay where they are unless allow_held is set, as for an upgrade.
+        Returns False if apt failed.
+        """
+        if self.empty():
+            return True
+        if self.installs and not refresh_index():
+            return False
+
+        if self.installs or self.purges:
+            print(f"Applying package changes: {self.describe()}")
+            command = ["apt-get", "install" if self.installs else "purge", "-y", "--auto-remove", *options]
+            if self.installs:
+                if allow_held:
+                    command.append("--allow-change-held-packages")
+                arguments = self.apt_arguments()
+            else:
+                arguments = sorted(self.purges)
+            if run_command(command + arguments, stream=True) is None:
+                return False
+
+        if self.holds:
+            if run_command(["apt-mark", "hold"] + sorted(self.holds)) is None:
+                return False
+
+        self.installs.clear()
+        self.purges.clear()
+        self.holds.clear()
+        return True
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+
+import argparse
+import functools
+import inspect
+import json
+import os
+import statistics
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import desired_state
+import facts
+import fleet
+import node
+import scheduler
+import tracing
+
+# Configuration
+PLAN_MARKER = "@@plan@@ "  # Prefix of the line a node prints its plan on
+UNKNOWN_DURATION = 10.0  # Seconds assumed for a step that never ran in the history
+HISTORY_ENV = "PROVISION_HISTORY"  # Default trace files, separated by os.pathsep
+
+def step_history(paths):
+    """
+    Median duration of every step in earlier traces (tracing.py JSONL files), separately
+    for runs that applied the step and runs where its check skipped it.
+    Returns {step: {"run": seconds, "skip": seconds}}.
+    """
+    samples = {}
+    for path in paths:
+        for span in tracing.read_jsonl(path):
+            if span["kind"] == "step":
+                key = "skip" if span.get("skipped") else "run"
+                samples.setdefault(span["name"], {}).setdefault(key, []).append(span["duration"])
+    return {name: {key: statistics.median(values) for key, values in kinds.items()} for name, kinds in samples.items()}
+
+def read_only(check):
+    """
+    The check without side effects: a check taking refresh= only compares against what is
+    already on the node, e.g. the package index, instead of refreshing it.
+    """
+    if "refresh" in inspect.signature(check).parameters:
+        return functools.partial(check, refresh=False)
+    return check
+
+def decide(steps):
+    """
+    Runs every step's check read-only, without changing anything. Returns {step: "run" | "skip"}.
+    A check that fails counts as "run".
+    """
+    decisions = {}
+    for spec in steps:
+        try:
+            skip = bool(spec.check and read_only(spec.check)())
+        except Exception:
+            skip = False
+        decisions[scheduler.step_name(spec)] = "skip" if skip else "run"
+    return decisions
+
+def emit(spec):
+    """
+    Node side of a fleet plan: prints the decisions for the node's spec and the node's facts
+    on one marked line, so the facts cache is refreshed by the same round trip.
+    """
+    node.apply_spec(spec)
+    print(PLAN_MARKER + json.dumps({"decisions": decide(node.STEPS), "facts": facts.collect()}), flush=True)
+
+def duration(name, decision, history):
+    """
+    Predicted seconds of a step. Returns (seconds, known); a skip without history costs nothing.
+    """
+    known = history.get(name, {})
+    if decision in known:
+        return known[decision], True
+    if decision == "skip":
+        return 0.0, False
+    return known.get("run", UNKNOWN_DURATION), "run" in known
+
+def simulate(steps, durations, max_workers=None):
+    """
+    Replays run_steps() with the given durations: every step starts as soon as its needs
+    are provided and its locks are free, in declaration order. Returns ({step: (start, finish)},
+    critical path), the path being the chain of steps that each waited for the previous one.
+    """
+    max_workers = max_workers or scheduler.default_workers() or len(steps) or 1
+    providers = {name: scheduler.step_name(spec) for spec in steps for name in spec.provides}
+    times, waited_for, last_holder = {}, {}, {}
+    provided, held = set(), set()
+    pending, running = list(steps), {}
+    now = 0.0
+    while pending or running:
+        for spec in list(pending):
+            if len(running) >= max_workers:
+                break
+            if set(spec.needs) <= provided and not held & set(spec.locks):
+                name = scheduler.step_name(spec)
+                pending.remove(spec)
+                held.update(spec.locks)
+                blockers = [providers[need] for need in spec.needs] + [last_holder[lock] for lock in spec.locks if lock in last_holder]
+                waited_for[name] = max(blockers, key=lambda blocker: times[blocker][1], default=None)
+                times[name] = (now, now + durations[name])
+                running[name] = spec
+        if not running:
+            break
+        name = min(running, key=lambda running_name: times[running_name][1])
+        spec = running.pop(name)
+        now = times[name][1]
+        held.difference_update(spec.locks)
+        provided.update(spec.provides)
+        for lock in spec.locks:
+            last_holder[lock] = name
+
+    path = []
+    current = max(times, key=lambda step: times[step][1], default=None)
+    while current is not None:
+        path.insert(0, current)
+        current = waited_for[current]
+    return times, path
+
+def predict(steps, decisions, history):
+    """
+    Returns (predicted wall seconds, {step: (start, finish)}, critical path, steps without history).
+    """
+    durations, unknown = {}, []
+    for spec in steps:
+        name = scheduler.step_name(spec)
+        durations[name], known = duration(name, decisions[name], history)
+        if not known and decisions[name] == "run":
+            unknown.append(name)
+    times, path = simulate(steps, durations)
+    wall = max((finish for _, finish in times.values()), default=0.0)
+    return wall, times, path, unknown
+
+def print_plan(title, steps, decisions, history, host_facts=None):
+    """
+    Prints what would run on one node, and what its facts say would stop kubeadm, and
+    returns the predicted wall time.
+    """
+    wall, times, path, unknown = predict(steps, decisions, history)
+    print(f"\n{title}: {sum(decision == 'run' for decision in decisions.values())} of {len(steps)} steps run, "
+          f"about {wall:.1f}s")
+    for spec in steps:
+        name = scheduler.step_name(spec)
+        start, finish = times[name]
+        marker = "*" if name in path else " "
+        guess = "  (no history)" if name in unknown else ""
+        print(f"  {marker} {decisions[name]:<4}  {name:<28} {start:7.1f}s -> {finish:7.1f}s{guess}")
+    for problem in facts.problems(host_facts) if host_facts else []:
+        print(f"    preflight: {problem}")
+    return wall
+
+def fleet_wall(walls, concurrency):
+    """
+    Wall time of the whole fleet when hosts take the next free slot in inventory order.
+    """
+    slots = [0.0] * max(1, min(concurrency, len(walls) or 1))
+    for wall in walls:
+        slot = slots.index(min(slots))
+        slots[slot] += wall
+    return max(slots)
+
+def plan_cache_name(host, spec):
+    """
+    Cache entry of a host's decisions, next to its facts; a different spec is a different entry.
+    """
+    return f"{host['name']}.plan-{desired_state.fingerprint(spec)[:12]}"
+
+def gather_plans(hosts, role, transport, ttl=facts.DEFAULT_TTL, refresh=False,
+                 concurrency=fleet.DEFAULT_CONCURRENCY, cache_dir=facts.CACHE_DIR):
+    """
+    Returns {host name: (decisions, facts)} or {host name: error text}. Hosts whose facts and
+    decisions are both in the facts cache and younger than ttl are planned from the cache;
+    the others get one round trip that brings back both and refreshes the cache.
+    """
+    names = {scheduler.step_name(spec) for spec in node.STEPS}
+
+    def plan_host(host):
+        spec = fleet.node_spec(host, role)
+        host_facts = None if refresh else facts.cached(host["name"], ttl, cache_dir)
+        decisions = None if refresh else facts.cached(plan_cache_name(host, spec), ttl, cache_dir)
+        if host_facts is not None and decisions is not None and set(decisions) == names:
+            return decisions, host_facts
+        transport.prepare(host)
+        try:
+            returncode, output = transport.run(host, f"import plan\nplan.emit({spec!r})")
+        except Exception as e:
+            return str(e)
+        finally:
+            transport.cleanup(host)
+        for line in output.splitlines():
+            if line.startswith(PLAN_MARKER):
+                found = json.loads(line[len(PLAN_MARKER):])
+                facts.store(host["name"], found["facts"], cache_dir)
+                facts.store(plan_cache_name(host, spec), found["decisions"], cache_dir)
+                return found["decisions"], found["facts"]
+        return output.strip().splitlines()[-1] if output.strip() else f"exit code {returncode}"
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        return dict(zip((host["name"] for host in hosts), pool.map(plan_host, hosts)))
+
+def main():
+    """
+    Shows what a run would do and how long it would take, without changing anything:
+    plan.py --role worker --history run.jsonl              (this node)
+    plan.py --group k8s-workers --history run.jsonl        (every node of a group)
+    """
+    parser = argparse.ArgumentParser(description="List the steps that would run and predict the wall time.")
+    parser.add_argument("--role", choices=list(node.ROLE_DEFAULTS), help="Role of this node, or of the group's nodes")
+    parser.add_argument("--spec", help="JSON node spec for this node")
+    parser.add_argument("--group", help="Plan every host of this inventory group instead of this node")
+    parser.add_argument("--history", action="append", help="Trace file of earlier runs (PROVISION_TRACE output), repeatable")
+    parser.add_argument("--inventory", default=fleet.DEFAULT_INVENTORY)
+    parser.add_argument("--concurrency", type=int, default=fleet.DEFAULT_CONCURRENCY)
+    parser.add_argument("--ttl", type=float, default=facts.DEFAULT_TTL, help="Seconds cached facts and decisions stay valid")
+    parser.add_argument("--refresh", action="store_true", help="Ignore the facts cache")
+    parser.add_argument("--transport", choices=["ssh", "local"], default="ssh")
+    parser.add_argument("--user", default=fleet.DEFAULT_USER)
+    parser.add_argument("--key-file", default=fleet.DEFAULT_KEY_FILE)
+    args = parser.parse_args()
+
+    paths = args.history or [path for path in os.environ.get(HISTORY_ENV, "").split(os.pathsep) if path]
+    history = step_history([path for path in paths if os.path.exists(path)])
+    if not history:
+        print(f"No step history found, every step that runs is assumed to take {UNKNOWN_DURATION:g}s.")
+
+    if not args.group:
+        spec = node.load_spec(args.spec) if args.spec else {}
+        if args.role:
+            spec["role"] = args.role
+        node.apply_spec(spec)
+        print_plan(f"This node ({node.role})", node.STEPS, decide(node.STEPS), history, facts.collect())
+        print("\n* critical path")
+        return
+
+    hosts = fleet.parse_inventory(args.inventory).get(args.group)
+    role = args.role or fleet.GROUP_ROLES.get(args.group)
+    if not hosts or not role:
+        print(f"No hosts or no role for group [{args.group}] in {args.inventory}.")
+        sys.exit(1)
+    if args.transport == "local":
+        transport = fleet.LocalTransport()
+    else:
+        transport = fleet.SshTransport(user=args.user, key_file=args.key_file)
+    walls = []
+    for name, found in gather_plans(hosts, role, transport, args.ttl, args.refresh, args.concurrency).items():
+        if isinstance(found, str):
+            print(f"\n{name}: could not plan: {found}")
+            continue
+        decisions, host_facts = found
+        walls.append(print_plan(name, node.STEPS, decisions, history, host_facts))
+    print(f"\n* critical path\nPredicted wall time for [{args.group}] at {args.concurrency} hosts at a time: "
+          f"{fleet_wall(walls, args.concurrency):.1f}s")
+
+if __name__ == "__main__":
+    main()
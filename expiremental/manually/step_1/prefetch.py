@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import packages
+import tracing
+
+# Configuration
+PREFETCH_DIR = "/var/cache/k8-provisions/prefetch"  # Own archive directory, apt's default one stays unlocked
+LOG_NAME = "download.log"  # apt-get output, kept in the archive directory
+LOG_TAIL = 20  # Lines of the log shown when the download failed
+
+def apt_options(archives=PREFETCH_DIR):
+    """
+    apt-get options that make an install take the .debs from the prefetch directory.
+    """
+    return ["-o", f"Dir::Cache::archives={archives}"]
+
+class Prefetch:
+    """
+    Downloads packages in the background while the node runs its file level steps.
+    --download-only takes no dpkg lock, and the separate archive directory keeps it
+    off the lock of apt's own cache, so other apt calls can run in the meantime.
+    The final install passes apt_options() and only unpacks.
+    """
+
+    def __init__(self, archives=PREFETCH_DIR):
+        self.archives = archives
+        self.process = None
+        self.name = None
+        self.started = None
+
+    def start(self, package_arguments, allow_held=False):
+        """
+        Starts downloading "name" or "name=version" packages with their dependencies.
+        The package index must be refreshed first, apt-get update would race the download.
+        allow_held downloads new versions of held packages, for an upgrade.
+        """
+        package_arguments = [argument for argument in package_arguments if not argument.endswith("_")]
+        if not package_arguments:
+            return
+        os.makedirs(os.path.join(self.archives, "partial"), exist_ok=True)
+        command = ["apt-get", "install", "-y", "-q", "--download-only", *apt_options(self.archives)]
+        if allow_held:
+            command.append("--allow-change-held-packages")
+        command += package_arguments
+        log_file = open(os.path.join(self.archives, LOG_NAME), "w")
+        self.name = "apt-get install --download-only " + " ".join(package_arguments)
+        self.started = (time.time(), time.monotonic())
+        self.process = subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL)
+        log_file.close()
+        print(f"Downloading {len(package_arguments)} package(s) in the background into {self.archives}...")
+
+    def wait(self):
+        """
+        Waits for the download. Returns True when it succeeded; on failure the log tail is
+        printed and the install simply downloads what is missing itself.
+        """
+        if self.process is None:
+            return False
+        code = self.process.wait()
+        self.process = None
+        # Recorded like the commands run_command traces, it overlaps the steps run meanwhile
+        tracing.record(self.name, "command", self.started[0], time.monotonic() - self.started[1], exit_code=code)
+        if code == 0:
+            print("Background download finished.")
+            return True
+        print(f"Background download failed (exit code {code}), the install downloads the packages itself.")
+        with open(os.path.join(self.archives, LOG_NAME)) as log_file:
+            for line in log_file.read().splitlines()[-LOG_TAIL:]:
+                print(f"  {line}")
+        return False
+
+    def cancel(self):
+        """
+        Stops a download that is still running, when the install it was for will not run.
+        """
+        if self.process is None:
+            return
+        self.process.terminate()
+        self.process.wait()
+        self.process = None
+        print("Background download stopped.")
+
+    def apt_options(self):
+        return apt_options(self.archives)
+
+def main():
+    """
+    Downloads packages into the prefetch directory, for the shell scripts:
+    prefetch.py cri-o kubelet=1.30.0-1.1 kubeadm=1.30.0-1.1 &
+    ...
+    apt-get install -y -o Dir::Cache::archives=/var/cache/k8-provisions/prefetch cri-o ...
+    """
+    parser = argparse.ArgumentParser(description="Download packages ahead of their installation.")
+    parser.add_argument("packages", nargs="+", help="name or name=version")
+    parser.add_argument("--archives", default=PREFETCH_DIR)
+    parser.add_argument("--refresh", action="store_true", help="Refresh the package index first if it is due")
+    parser.add_argument("--upgrade", action="store_true", help="Also download new versions of held packages")
+    args = parser.parse_args()
+    if args.refresh and not packages.refresh_index():
+        sys.exit(1)
+    downloads = Prefetch(args.archives)
+    downloads.start(args.packages, allow_held=args.upgrade)
+    if not downloads.wait():
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+import argparse
+import collections
+import os
+import random
+import socket
+import statistics
+import struct
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import desired_state
+import services
+
+# Configuration
+DNS_PORT = 53
+PROBE_TIMEOUT = 1.0  # Seconds to wait for one answer
+PROBE_NAMES = ["registry.k8s.io", "pkgs.k8s.io", "github.com"]  # Names the nodes actually look up, one query each
+MAX_NAMESERVERS = 3  # glibc ignores nameserver lines after the third
+RESOLV_CONF = "/etc/resolv.conf"
+RESOLVED_DROPIN = "/etc/systemd/resolved.conf.d/k8-provisions.conf"  # Upstreams of the local systemd-resolved cache
+STUB_RESOLV_CONF = "/run/systemd/resolve/stub-resolv.conf"  # resolv.conf pointing at the cache on 127.0.0.53
+
+# How a resolver did: answers out of queries and the median latency of the answers
+ResolverResult = collections.namedtuple("ResolverResult", ["address", "answered", "queries", "latency"])
+
+def build_query(name, query_id):
+    """
+    Builds a recursive DNS query for the A record of a name.
+    """
+    labels = b"".join(bytes([len(label)]) + label.encode() for label in name.rstrip(".").split("."))
+    return struct.pack("!HHHHHH", query_id, 0x0100, 1, 0, 0, 0) + labels + b"\0" + struct.pack("!HH", 1, 1)
+
+def answered(data, query_id):
+    """
+    True for a response to our query that resolved the name or authoritatively said it
+    does not exist. SERVFAIL and REFUSED count as failures.
+    """
+    if len(data) < 12:
+        return False
+    response_id, flags = struct.unpack("!HH", data[:4])
+    return response_id == query_id and bool(flags & 0x8000) and flags & 0x000F in (0, 3)
+
+def query(server, name, port=DNS_PORT, timeout=PROBE_TIMEOUT):
+    """
+    Sends one query and returns the round trip in seconds, or None.
+    """
+    query_id = random.randrange(1 << 16)
+    family = socket.AF_INET6 if ":" in server else socket.AF_INET
+    client = socket.socket(family, socket.SOCK_DGRAM)
+    client.settimeout(timeout)
+    try:
+        started = time.monotonic()
+        client.sendto(build_query(name, query_id), (server, port))
+        deadline = started + timeout
+        while True:
+            client.settimeout(max(deadline - time.monotonic(), 0.001))
+            data, sender = client.recvfrom(4096)
+            if sender[0] == server and answered(data, query_id):
+                return time.monotonic() - started
+    except OSError:
+        return None
+    finally:
+        client.close()
+
+def probe(servers, names=PROBE_NAMES, port=DNS_PORT, timeout=PROBE_TIMEOUT):
+    """
+    Sends every query to every resolver at the same time. Returns a ResolverResult per
+    resolver, the most reliable first and the fastest first among equally reliable ones.
+    """
+    servers = list(dict.fromkeys(servers))
+    jobs = [(server, name) for server in servers for name in names]
+    if not jobs:
+        return []
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        latencies = list(pool.map(lambda job: query(job[0], job[1], port, timeout), jobs))
+    results = []
+    for server in servers:
+        times = [latency for (address, _), latency in zip(jobs, latencies) if address == server and latency is not None]
+        results.append(ResolverResult(server, len(times), len(names), statistics.median(times) if times else None))
+    return sorted(results, key=lambda result: (-result.answered / result.queries, result.latency or timeout))
+
+def rank(servers, names=PROBE_NAMES, port=DNS_PORT, timeout=PROBE_TIMEOUT, log=print):
+    """
+    Returns the resolvers that answered, best first. When none answered the configured
+    order is kept, so a node is never left without a nameserver.
+    """
+    results = probe(servers, names, port, timeout)
+    for result in results:
+        latency = f"{result.latency * 1000:7.1f} ms" if result.latency is not None else "      -   "
+        log(f"  {result.address:<20} {latency}  {result.answered}/{result.queries} answered")
+    ranked = [result.address for result in results if result.answered]
+    if not ranked:
+        log("No resolver answered. Keeping the configured order.")
+        return list(dict.fromkeys(servers))
+    return ranked
+
+def order(primary, fallbacks, names=PROBE_NAMES, port=DNS_PORT, timeout=PROBE_TIMEOUT, log=print):
+    """
+    The primary resolver first, then the fallbacks that answered, best first. The primary
+    is not ranked: it is the one that knows the internal names, which the public probe
+    names cannot tell.
+    """
+    fallbacks = [server for server in dict.fromkeys(fallbacks) if server != primary]
+    return [primary] + (rank(fallbacks, names, port, timeout, log) if fallbacks else [])
+
+def resolv_conf(servers, search=None):
+    lines = [f"nameserver {server}" for server in servers[:MAX_NAMESERVERS]]
+    if search:
+        lines.append(f"search {search}")
+    return "\n".join(lines) + "\n"
+
+def configured_nameservers(path=RESOLV_CONF):
+    return [line.split()[1] for line in (desired_state.read_file(path) or "").splitlines()
+            if line.startswith("nameserver") and len(line.split()) > 1]
+
+def write_resolv_conf(servers, path=RESOLV_CONF, search=None):
+    """
+    Writes the nameservers in one atomic replace. resolv.conf is usually a symlink; its target
+    is replaced so that lookups made at the same time never see an empty file.
+    """
+    target = os.path.realpath(path)
+    temp_file = target + ".tmp"
+    with open(temp_file, "w") as resolv_file:
+        resolv_file.write(resolv_conf(servers, search))
+    os.replace(temp_file, target)
+
+def configure_cache(servers):
+    """
+    Makes systemd-resolved cache lookups for the node, forwarding to the given resolvers,
+    and points resolv.conf at its stub listener on 127.0.0.53. kubeadm notices
+    systemd-resolved and hands kubelet the upstream list instead, so pods do not loop.
+    systemd-resolved is restarted right away, before resolv.conf points at it, since the
+    next steps look names up; nothing else queued with services is applied.
+    """
+    os.makedirs(os.path.dirname(RESOLVED_DROPIN), exist_ok=True)
+    with open(RESOLVED_DROPIN, "w") as dropin:
+        dropin.write(resolved_dropin(servers))
+    services.restart_now("systemd-resolved")
+    if os.path.realpath(RESOLV_CONF) != STUB_RESOLV_CONF:
+        os.symlink(STUB_RESOLV_CONF, RESOLV_CONF + ".tmp")
+        os.replace(RESOLV_CONF + ".tmp", RESOLV_CONF)
+
+def resolved_dropin(servers):
+    return f"[Resolve]\nDNS={' '.join(servers)}\nCache=yes\nDNSStubListener=yes\n"
+
+def cache_configured(candidates):
+    """
+    True when systemd-resolved forwards to some of the candidates and resolv.conf uses it.
+    """
+    content = desired_state.read_file(RESOLVED_DROPIN) or ""
+    upstreams = next((line[4:].split() for line in content.splitlines() if line.startswith("DNS=")), [])
+    return bool(upstreams) and set(upstreams) <= set(candidates) and os.path.realpath(RESOLV_CONF) == STUB_RESOLV_CONF
+
+def main():
+    """
+    Prints resolv.conf lines, the first resolver first and the others by how they did:
+    resolvers.py 172.100.55.2 8.8.4.4 --search lab.local
+    """
+    parser = argparse.ArgumentParser(description="Rank DNS resolvers by success rate and latency.")
+    parser.add_argument("servers", nargs="+", help="The node's own resolver, then fallbacks")
+    parser.add_argument("--rank-all", action="store_true", help="Rank the first resolver too")
+    parser.add_argument("--port", type=int, default=DNS_PORT)
+    parser.add_argument("--timeout", type=float, default=PROBE_TIMEOUT)
+    parser.add_argument("--names", default=",".join(PROBE_NAMES), help="Comma separated names to look up")
+    parser.add_argument("--search", help="Search domain to add")
+    args = parser.parse_args()
+    # The ranking goes to stderr so stdout can be redirected into resolv.conf
+    log = lambda line: print(line, file=sys.stderr)
+    if args.rank_all:
+        servers = rank(args.servers, args.names.split(","), args.port, args.timeout, log)
+    else:
+        servers = order(args.servers[0], args.servers[1:], args.names.split(","), args.port, args.timeout, log)
+    sys.stdout.write(resolv_conf(servers, args.search))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+import collections
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import journal
+import tracing
+
+# A provisioning step: the function to run, the names it needs before it can start,
+# the names it provides once it finished, the locks it must hold while running and
+# an optional cheap check that returns True when the node is already in the desired state.
+Step = collections.namedtuple("Step", ["func", "needs", "provides", "locks", "check"], defaults=(None,))
+
+DPKG_LOCK = "dpkg"  # Held by every step that runs apt or dpkg
+
+def step(func, needs=(), provides=(), locks=(), check=None):
+    """
+    Declares a step for run_steps().
+    """
+    return Step(func, tuple(needs), tuple(provides), tuple(locks), check)
+
+def step_name(spec):
+    return spec.func.__name__
+
+def converge(spec):
+    """
+    Runs the step's check and applies the step only when the check fails.
+    The whole step, check included, is recorded as a tracing span.
+    """
+    with tracing.span(step_name(spec), "step", skipped=False) as span:
+        if spec.check and spec.check():
+            print(f"{step_name(spec)}: already in the desired state. Skipping.")
+            span["skipped"] = True
+            return
+        try:
+            spec.func()
+        except SystemExit as e:
+            span["exit_code"] = e.code
+            raise
+
+def converge_named(steps, name):
+    """
+    Converges the step with the given name, used by fleet.py on each node.
+    """
+    converge(next(spec for spec in steps if step_name(spec) == name))
+
+def default_workers():
+    """
+    Number of steps allowed to run at the same time.
+    PROVISION_JOBS=1 runs the steps one after the other.
+    """
+    return int(os.environ.get("PROVISION_JOBS", "0")) or None
+
+def check_graph(steps):
+    """
+    Makes sure every need is provided by some step and that the steps do not wait on each other in a cycle.
+    """
+    provided = {name for spec in steps for name in spec.provides}
+    for spec in steps:
+        missing = set(spec.needs) - provided
+        if missing:
+            raise ValueError(f"Step {step_name(spec)} needs {', '.join(sorted(missing))}, which no step provides.")
+
+    done = set()
+    remaining = list(steps)
+    while remaining:
+        ready = [spec for spec in remaining if set(spec.needs) <= done]
+        if not ready:
+            names = ", ".join(step_name(spec) for spec in remaining)
+            raise ValueError(f"Steps wait on each other and can never run: {names}")
+        for spec in ready:
+            done.update(spec.provides)
+            remaining.remove(spec)
+
+def select_steps(steps, names):
+    """
+    Keeps only the named steps. Needs that none of the kept steps provide are dropped,
+    the caller asked for these steps alone and takes care of their prerequisites.
+    """
+    selected = [spec for spec in steps if step_name(spec) in names]
+    unknown = set(names) - {step_name(spec) for spec in selected}
+    if unknown:
+        raise ValueError(f"Unknown step(s): {', '.join(sorted(unknown))}")
+    provided = {name for spec in selected for name in spec.provides}
+    return [spec._replace(needs=tuple(need for need in spec.needs if need in provided)) for spec in selected]
+
+def step_fingerprints(steps):
+    """
+    Fingerprints every step from its own inputs and the fingerprints of the steps providing
+    what it needs, so a changed step also invalidates the steps that build on it.
+    """
+    providers = {name: spec for spec in steps for name in spec.provides}
+    fingerprints = {}
+    remaining = list(steps)
+    while remaining:
+        for spec in [spec for spec in remaining if all(step_name(providers[need]) in fingerprints for need in spec.needs)]:
+            upstream = {fingerprints[step_name(providers[need])] for need in spec.needs}
+            fingerprints[step_name(spec)] = journal.step_fingerprint(spec.func, upstream)
+            remaining.remove(spec)
+    return fingerprints
+
+def journalled(run, steps, step_journal):
+    """
+    Wraps 'run' so that steps completed in an interrupted run, with unchanged inputs,
+    are skipped and every step that finishes is recorded.
+    """
+    fingerprints = step_fingerprints(steps)
+
+    def run_journalled(spec):
+        name = step_name(spec)
+        step_journal.run(name, fingerprints[name], lambda: run(spec))
+    return run_journalled
+
+def run_steps(steps, max_workers=None, run=None, step_journal=None):
+    """
+    Runs the steps as soon as everything they need has been provided, several at a time.
+    Steps sharing a lock never overlap. When two steps are ready at the same moment the
+    one declared first starts first.
+    'run' is called with each Step and defaults to converge().
+    With a journal.Journal, a re-run after a failure resumes at the first incomplete or
+    changed step; the journal is cleared once every step succeeded.
+    Returns {step name: "ok" | "failed" | "not run"}; after a failure no new step is started.
+    """
+    check_graph(steps)
+    run = run or converge
+    if step_journal:
+        run = journalled(run, steps, step_journal)
+    max_workers = max_workers or default_workers() or len(steps) or 1
+
+    results = {step_name(spec): "not run" for spec in steps}
+    errors = {}
+    provided = set()
+    held = set()
+    pending = list(steps)
+    running = {}
+
+    def call(spec):
+        try:
+            run(spec)
+        except BaseException as e:
+            # SystemExit included, several steps call exit() on errors
+            errors[step_name(spec)] = e
+            raise
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            if not errors:
+                for spec in list(pending):
+                    if len(running) >= max_workers:
+                        break
+                    if set(spec.needs) <= provided and not held & set(spec.locks):
+                        pending.remove(spec)
+                        held.update(spec.locks)
+                        running[pool.submit(call, spec)] = spec
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                spec = running.pop(future)
+                held.difference_update(spec.locks)
+                if future.exception() is None:
+                    provided.update(spec.provides)
+                    results[step_name(spec)] = "ok"
+                else:
+                    results[step_name(spec)] = "failed"
+
+    for name, error in errors.items():
+        print(f"Step {name} failed: {error!r}")
+    if step_journal and set(results.values()) == {"ok"}:
+        step_journal.clear()
+    return results
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import socket
+import stat
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+import discovery
+import ntp_probe
+import resolvers
+
+# Configuration
+BUNDLE_DIR = os.path.dirname(os.path.abspath(__file__))
+DPKG_STATUS_FIXTURE = os.path.join(BUNDLE_DIR, "fixtures", "dpkg-status")
+EXPECTED_PACKAGES = {  # Only the fully installed packages of the fixture
+    "kubelet": {"version": "1.31.4-1.1", "architecture": "amd64"},
+    "libc6": {"version": "2.35-0ubuntu3.8", "architecture": "amd64"},
+    "tzdata": {"version": "2024a-0ubuntu0.22.04", "architecture": "all"},
+}
+PROBE_TIMEOUT = 0.5  # Seconds the probes wait for the loopback responders
+SLOW_DELAY = 0.05  # Extra seconds the slow responders take to answer
+
+def free_udp_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe_socket:
+        probe_socket.bind(("127.0.0.1", 0))
+        return probe_socket.getsockname()[1]
+
+def serve_udp(address, port, answer, delay=0.0):
+    """
+    Answers every datagram sent to address:port with answer(request), after delay seconds,
+    from a daemon thread. Returns the socket; closing it stops the responder.
+    """
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind((address, port))
+
+    def loop():
+        while True:
+            try:
+                request, sender = server.recvfrom(512)
+            except OSError:
+                return
+            time.sleep(delay)
+            try:
+                server.sendto(answer(request), sender)
+            except OSError:
+                return
+
+    threading.Thread(target=loop, daemon=True).start()
+    return server
+
+def ntp_answer(stratum):
+    """
+    A server reply of the given stratum: mode 4, our clock for the receive and transmit times.
+    """
+    def answer(request):
+        now = ntp_probe.to_ntp(time.time())
+        return bytes([0x24, stratum]) + b"\0" * 22 + request[40:48] + now + now
+    return answer
+
+def dns_answer(rcode):
+    """
+    A response to the query with the given rcode: 0 resolved, 2 SERVFAIL.
+    """
+    def answer(request):
+        return request[:2] + struct.pack("!H", 0x8180 | rcode) + request[4:]
+    return answer
+
+def check_dpkg_status():
+    found = discovery.parse_dpkg_status(DPKG_STATUS_FIXTURE)
+    if found != EXPECTED_PACKAGES:
+        return f"parsed {found}"
+
+def check_discovery_rescan():
+    """
+    A binary dropped on PATH and a status file that appears later are both picked up
+    without dpkg having run in between.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        status_file = os.path.join(directory, "status")
+        index = discovery.Discovery(status_file=status_file, path=directory)
+        if index.which("crio") or index.packages():
+            return "found something in an empty directory"
+        binary = os.path.join(directory, "crio")
+        with open(binary, "w"):
+            pass
+        os.chmod(binary, stat.S_IRWXU)
+        if index.which("crio") != binary:
+            return "missed a binary installed without dpkg"
+        with open(DPKG_STATUS_FIXTURE) as fixture, open(status_file, "w") as status:
+            status.write(fixture.read())
+        if index.version("kubelet") != EXPECTED_PACKAGES["kubelet"]["version"]:
+            return "missed a status file that appeared later"
+
+def check_ntp_ranking():
+    """
+    A fast and a slow synchronised server, one at stratum 16 and one that does not answer:
+    the two synchronised ones come back, fastest first. Without any answer the first
+    'count' candidates come back.
+    """
+    port = free_udp_port()
+    responders = [serve_udp("127.0.0.2", port, ntp_answer(2)),
+                  serve_udp("127.0.0.3", port, ntp_answer(3), SLOW_DELAY),
+                  serve_udp("127.0.0.4", port, ntp_answer(16))]
+    try:
+        ranked = ntp_probe.best_servers(["127.0.0.3", "127.0.0.4", "127.0.0.5", "127.0.0.2"], port=port,
+                                        timeout=PROBE_TIMEOUT)
+    finally:
+        for responder in responders:
+            responder.close()
+    if ranked != ["127.0.0.2", "127.0.0.3"]:
+        return f"ranked {ranked}"
+    # Nobody answers: the first 'count' candidates, so ntp.conf still gets servers
+    fallback = ntp_probe.best_servers(["127.0.0.6", "127.0.0.7", "127.0.0.6", "127.0.0.8"], count=2, port=port,
+                                      timeout=PROBE_TIMEOUT)
+    if fallback != ["127.0.0.6", "127.0.0.7"]:
+        return f"fell back to {fallback}"
+
+def check_resolver_ranking():
+    """
+    A slow, a fast, a SERVFAIL and a silent resolver: the two that answered come back,
+    fastest first, and order() keeps the primary first even though it is the slow one.
+    """
+    port = free_udp_port()
+    responders = [serve_udp("127.0.0.2", port, dns_answer(0), SLOW_DELAY),
+                  serve_udp("127.0.0.3", port, dns_answer(0)),
+                  serve_udp("127.0.0.4", port, dns_answer(2))]
+    try:
+        ranked = resolvers.rank(["127.0.0.2", "127.0.0.3", "127.0.0.4", "127.0.0.5"], port=port, timeout=PROBE_TIMEOUT)
+        ordered = resolvers.order("127.0.0.2", ["127.0.0.4", "127.0.0.3"], port=port, timeout=PROBE_TIMEOUT)
+    finally:
+        for responder in responders:
+            responder.close()
+    if ranked != ["127.0.0.3", "127.0.0.2"]:
+        return f"ranked {ranked}"
+    if ordered != ["127.0.0.2", "127.0.0.3"]:
+        return f"ordered {ordered}"
+
+CHECKS = {
+    "dpkg_status": check_dpkg_status,
+    "discovery_rescan": check_discovery_rescan,
+    "ntp_ranking": check_ntp_ranking,
+    "resolver_ranking": check_resolver_ranking,
+}
+
+def main():
+    """
+    Checks the parsers and probes against fixtures and loopback responders, no network or
+    root needed: selftest.py | selftest.py ntp_ranking
+    """
+    parser = argparse.ArgumentParser(description="Check the dpkg parser and the NTP and DNS probes offline.")
+    parser.add_argument("checks", nargs="*", help=f"Checks to run (default: all of {', '.join(CHECKS)})")
+    args = parser.parse_args()
+
+    unknown = set(args.checks) - set(CHECKS)
+    if unknown:
+        print(f"Unknown check(s): {', '.join(sorted(unknown))}")
+        sys.exit(1)
+    failed = []
+    for name in args.checks or list(CHECKS):
+        problem = CHECKS[name]()
+        print(f"{name:<20} {'FAIL: ' + problem if problem else 'ok'}")
+        if problem:
+            failed.append(name)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import fcntl
+import json
+import os
+import sys
+import threading
+
+import packages
+from command import run_command
+
+# Configuration
+PENDING_FILE = os.path.join(packages.STATE_DIR, "services.json")  # Service changes queued and not applied yet
+START_ORDER = ["systemd-resolved", "systemd-timesyncd", "ntp", "containerd", "crio", "kubelet"]  # Dependencies first
+STOPPED_STATES = ["inactive", "failed"]  # `systemctl enable --now` starts a unit in these states
+
+_lock = threading.Lock()
+
+def empty_changes():
+    return {"daemon_reload": False, "enable": [], "restart": [], "reload": []}
+
+@contextlib.contextmanager
+def locked_changes(path=PENDING_FILE):
+    """
+    Yields the queued changes for updating in place and saves them afterwards. Steps queue
+    from threads and, through fleet.py, from one process per step, so both are locked out.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with _lock, open(path + ".lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            with open(path) as pending_file:
+                changes = json.load(pending_file)
+        except (OSError, ValueError):
+            changes = empty_changes()
+        try:
+            yield changes
+        finally:
+            save_changes(changes, path)
+
+def save_changes(changes, path):
+    if changes == empty_changes():
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    with open(path + ".tmp", "w") as pending_file:
+        json.dump(changes, pending_file)
+    os.replace(path + ".tmp", path)
+
+def pending(path=PENDING_FILE):
+    with locked_changes(path) as changes:
+        return dict(changes)
+
+def nothing_pending(path=PENDING_FILE):
+    return not os.path.exists(path) or pending(path) == empty_changes()
+
+def enable(*units, path=PENDING_FILE):
+    """
+    Queues units to be enabled and started.
+    """
+    with locked_changes(path) as changes:
+        changes["enable"] += [unit for unit in units if unit not in changes["enable"]]
+
+def restart(*units, path=PENDING_FILE):
+    """
+    Queues units to be restarted, e.g. after their configuration changed. A restart
+    covers a queued reload of the same unit.
+    """
+    with locked_changes(path) as changes:
+        changes["restart"] += [unit for unit in units if unit not in changes["restart"]]
+        changes["reload"] = [unit for unit in changes["reload"] if unit not in units]
+
+def reload(*units, path=PENDING_FILE):
+    """
+    Queues units to reload their configuration, unless they are restarted anyway.
+    """
+    with locked_changes(path) as changes:
+        changes["reload"] += [unit for unit in units if unit not in changes["reload"] + changes["restart"]]
+
+def daemon_reload(path=PENDING_FILE):
+    """
+    Queues `systemctl daemon-reload`, for unit files or drop-ins that changed.
+    """
+    with locked_changes(path) as changes:
+        changes["daemon_reload"] = True
+
+def restart_now(*units, path=PENDING_FILE):
+    """
+    Restarts units right away, for a step whose successors need the new configuration, and
+    drops their queued restarts and reloads. Other queued changes stay queued.
+    Raises RuntimeError if a restart failed.
+    """
+    with locked_changes(path) as changes:
+        for unit in ordered(units):
+            print(f"Restarting {unit}...")
+            if run_command(["systemctl", "restart", unit]) is None:
+                raise RuntimeError(f"Could not restart {unit}.")
+        changes["restart"] = [unit for unit in changes["restart"] if unit not in units]
+        changes["reload"] = [unit for unit in changes["reload"] if unit not in units]
+
+def ordered(units):
+    """
+    The units in START_ORDER, units not listed there after them in the order they were queued.
+    """
+    return sorted(units, key=lambda unit: START_ORDER.index(unit) if unit in START_ORDER else len(START_ORDER))
+
+def active_states(units):
+    """
+    ActiveState of each unit, from one systemctl call.
+    """
+    if not units:
+        return {}
+    output = run_command(["systemctl", "show", "--property=ActiveState", "--value", *units], ignore_errors=True)
+    return dict(zip(units, [line for line in (output or "").splitlines() if line.strip()]))
+
+def apply(path=PENDING_FILE):
+    """
+    Applies everything queued so far, in as few systemctl calls as possible: one daemon-reload,
+    one `enable --now` for all enabled units, then one restart per unit in START_ORDER and one
+    reload for the rest. A unit that was stopped and is started by the enable already runs its
+    new configuration and is not restarted again.
+    Returns the units started or restarted. Raises RuntimeError if a call failed; what is
+    left stays queued for the next apply.
+    """
+    with locked_changes(path) as changes:
+        if changes == empty_changes():
+            return []
+        if changes["daemon_reload"]:
+            if run_command(["systemctl", "daemon-reload"]) is None:
+                raise RuntimeError("systemctl daemon-reload failed.")
+            changes["daemon_reload"] = False
+
+        # Only a unit that is enabled and restarted or reloaded can skip the second call
+        states = active_states([unit for unit in changes["enable"] if unit in changes["restart"] + changes["reload"]])
+        started = [unit for unit in changes["enable"] if states.get(unit) in STOPPED_STATES]
+        if changes["enable"]:
+            print(f"Enabling and starting {', '.join(ordered(changes['enable']))}...")
+            if run_command(["systemctl", "enable", "--now", *ordered(changes["enable"])]) is None:
+                raise RuntimeError(f"Could not enable {', '.join(changes['enable'])}.")
+            changes["enable"] = []
+
+        restarted = []
+        for unit in ordered(changes["restart"]):
+            if unit in started:
+                print(f"{unit} was started with its new configuration. Skipping the restart.")
+            else:
+                print(f"Restarting {unit}...")
+                if run_command(["systemctl", "restart", unit]) is None:
+                    raise RuntimeError(f"Could not restart {unit}.")
+                restarted.append(unit)
+            changes["restart"].remove(unit)
+
+        reloads = [unit for unit in ordered(changes["reload"]) if unit not in started]
+        if reloads:
+            print(f"Reloading {', '.join(reloads)}...")
+            # try-reload-or-restart leaves stopped units alone
+            if run_command(["systemctl", "try-reload-or-restart", *reloads]) is None:
+                raise RuntimeError(f"Could not reload {', '.join(reloads)}.")
+        changes["reload"] = []
+        return started + [unit for unit in restarted if unit not in started]
+
+def main():
+    """
+    Queues service changes from the shell scripts and applies them once:
+    services.py restart containerd; services.py enable kubelet; ...; services.py apply
+    """
+    parser = argparse.ArgumentParser(description="Collect service restarts, reloads and enables and apply each once.")
+    parser.add_argument("action", choices=["enable", "restart", "reload", "daemon-reload", "apply", "show"])
+    parser.add_argument("units", nargs="*")
+    parser.add_argument("--file", default=PENDING_FILE)
+    args = parser.parse_args()
+
+    if args.action in ("enable", "restart", "reload") and not args.units:
+        parser.error(f"{args.action} needs at least one unit")
+    if args.action == "enable":
+        enable(*args.units, path=args.file)
+    elif args.action == "restart":
+        restart(*args.units, path=args.file)
+    elif args.action == "reload":
+        reload(*args.units, path=args.file)
+    elif args.action == "daemon-reload":
+        daemon_reload(args.file)
+    elif args.action == "show":
+        print(json.dumps(pending(args.file), indent=2))
+    else:
+        try:
+            apply(args.file)
+        except RuntimeError as e:
+            print(e)
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
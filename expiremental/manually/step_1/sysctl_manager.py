@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+
+import desired_state
+
+# Configuration
+PROC_SYS = "/proc/sys"  # Live kernel settings, one file per key
+
+def proc_path(key):
+    """
+    Maps "net.ipv4.ip_forward" to /proc/sys/net/ipv4/ip_forward.
+    """
+    return os.path.join(PROC_SYS, key.replace(".", "/"))
+
+def normalise(value):
+    return " ".join(str(value).split())
+
+def parse_settings(lines):
+    """
+    Parses "key = value" lines into {key: value}, skipping comments and blanks.
+    A key set twice keeps its last value, as sysctl itself does.
+    """
+    settings = {}
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith(("#", ";")) or "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        settings[key.strip().lstrip("-")] = normalise(value)
+    return settings
+
+def setting_line(key, value):
+    return f"{key} = {value}"
+
+def pending_keys(settings):
+    """
+    Returns the keys whose live value differs from the wanted one. Keys the kernel does
+    not know (module not loaded yet) count as pending.
+    """
+    return [key for key, value in settings.items() if desired_state.sysctl_value(key) != normalise(value)]
+
+def apply_live(settings):
+    """
+    Writes only the differing keys straight to /proc/sys.
+    Returns (changed keys, keys the kernel does not have).
+    """
+    changed, unknown = [], []
+    for key in pending_keys(settings):
+        try:
+            with open(proc_path(key), "w") as proc_file:
+                proc_file.write(normalise(settings[key]) + "\n")
+            changed.append(key)
+        except FileNotFoundError:
+            unknown.append(key)
+    return changed, unknown
+
+def render_dropin(content, settings):
+    """
+    Returns the drop-in content with every key of 'settings' present exactly once with its
+    wanted value. Other lines and comments are kept; repeated lines are dropped.
+    """
+    lines, seen_lines, seen_keys = [], set(), set()
+    for line in content.splitlines():
+        parsed = parse_settings([line])
+        key = next(iter(parsed), None)
+        if key in settings:
+            if key in seen_keys:
+                continue
+            line = setting_line(key, settings[key])
+            seen_keys.add(key)
+        elif line.strip() and not line.lstrip().startswith(("#", ";")):
+            if line.strip() in seen_lines:
+                continue
+            seen_lines.add(line.strip())
+        lines.append(line)
+    lines += [setting_line(key, value) for key, value in settings.items() if key not in seen_keys]
+    return "\n".join(lines) + "\n"
+
+def persist(path, settings):
+    """
+    Brings the drop-in file in line with 'settings' in one atomic write.
+    Returns True when the file had to change.
+    """
+    content = desired_state.read_file(path) or ""
+    wanted = render_dropin(content, settings)
+    if wanted == content:
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_file = path + ".tmp"
+    with open(temp_file, "w") as dropin:
+        dropin.write(wanted)
+    os.chmod(temp_file, 0o644)
+    os.replace(temp_file, path)
+    return True
+
+def converged(path, settings):
+    """
+    True when the drop-in holds the settings without duplicates and the kernel already uses them.
+    """
+    content = desired_state.read_file(path)
+    return content is not None and render_dropin(content, settings) == content and not pending_keys(settings)
+
+def converge(path, settings):
+    """
+    Persists the settings and applies the ones that differ, without `sysctl --system`.
+    Returns True when every key is active.
+    """
+    if persist(path, settings):
+        print(f"Updated {path}.")
+    changed, unknown = apply_live(settings)
+    for key in changed:
+        print(f"Set {key} = {settings[key]}")
+    if unknown:
+        print(f"Kernel has no {', '.join(unknown)}; load the module providing it first.")
+    return not unknown
+
+def main():
+    """
+    Converges kernel settings: sysctl_manager.py --file /etc/sysctl.d/k8s.conf net.ipv4.ip_forward=1
+    """
+    parser = argparse.ArgumentParser(description="Persist and apply sysctl settings, touching only what differs.")
+    parser.add_argument("--file", required=True, help="Drop-in file the settings are persisted in")
+    parser.add_argument("settings", nargs="+", metavar="KEY=VALUE")
+    args = parser.parse_args()
+    if os.geteuid() != 0:
+        print("This script must be run as root. Please try again with 'sudo'.")
+        sys.exit(1)
+    if not converge(args.file, parse_settings(args.settings)):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+import argparse
+import atexit
+import contextlib
+import json
+import os
+import socket
+import threading
+import time
+
+# Configuration
+TRACE_ENV = "PROVISION_TRACE"  # Set to a .jsonl path to keep the spans of every run
+EMIT_MARKER = "@@trace@@ "  # Prefix of the line a node prints its spans on for fleet.py
+
+_spans = []
+_lock = threading.Lock()
+
+def record(name, kind, start, duration, **fields):
+    """
+    Records a finished span. 'start' is a time.time() value, 'duration' is in seconds.
+    """
+    span = {"name": name, "kind": kind, "start": start, "duration": duration,
+            "host": socket.gethostname(), "pid": os.getpid(), "thread": threading.get_ident()}
+    span.update(fields)
+    with _lock:
+        _spans.append(span)
+    return span
+
+@contextlib.contextmanager
+def span(name, kind, **fields):
+    """
+    Times the body of a with-block. The yielded dict takes extra fields such as exit_code
+    or output_bytes; an exception leaves 'error' set.
+    """
+    extra = dict(fields)
+    start = time.time()
+    started = time.monotonic()
+    try:
+        yield extra
+    except BaseException as e:
+        extra.setdefault("error", repr(e))
+        raise
+    finally:
+        record(name, kind, start, time.monotonic() - started, **extra)
+
+def add(records):
+    """
+    Adds spans recorded elsewhere, e.g. on a node.
+    """
+    with _lock:
+        _spans.extend(records)
+
+def spans(kind=None):
+    with _lock:
+        return [dict(span) for span in _spans if kind is None or span["kind"] == kind]
+
+def clear():
+    with _lock:
+        _spans.clear()
+
+def write_jsonl(path, records=None):
+    """
+    Appends spans as JSON lines, so several processes of one run can share a file.
+    """
+    records = spans() if records is None else records
+    with open(path, "a") as trace_file:
+        for record_ in records:
+            trace_file.write(json.dumps(record_, sort_keys=True) + "\n")
+
+def read_jsonl(path):
+    with open(path, "r") as trace_file:
+        return [json.loads(line) for line in trace_file if line.strip()]
+
+def chrome_trace(records):
+    """
+    Converts spans to the Chrome trace-event format (chrome://tracing, Perfetto).
+    Each host becomes a process and each thread a track.
+    """
+    hosts = sorted({record_["host"] for record_ in records})
+    events = [{"name": "process_name", "ph": "M", "pid": hosts.index(host), "args": {"name": host}} for host in hosts]
+    for record_ in records:
+        args = {key: value for key, value in record_.items()
+                if key not in ("name", "kind", "start", "duration", "host", "pid", "thread")}
+        events.append({"name": record_["name"], "cat": record_["kind"], "ph": "X",
+                       "ts": int(record_["start"] * 1e6), "dur": int(record_["duration"] * 1e6),
+                       "pid": hosts.index(record_["host"]), "tid": f"{record_['pid']}.{record_['thread']}",
+                       "args": args})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+def write_chrome(path, records=None):
+    with open(path, "w") as trace_file:
+        json.dump(chrome_trace(spans() if records is None else records), trace_file)
+
+def print_summary(records=None, limit=5):
+    """
+    Lists the slowest steps and the slowest commands of a run.
+    """
+    records = spans() if records is None else records
+    for kind, title in (("step", "Slowest steps"), ("command", "Slowest commands")):
+        slowest = sorted((r for r in records if r["kind"] == kind), key=lambda r: r["duration"], reverse=True)[:limit]
+        if not slowest:
+            continue
+        print(f"\n{title}:")
+        for record_ in slowest:
+            status = "" if record_.get("exit_code") in (None, 0) else f"  exit {record_['exit_code']}"
+            status += "  skipped" if record_.get("skipped") else ""
+            print(f"  {record_['duration']:8.2f}s  {record_['host']:<16} {record_['name'][:70]}{status}")
+
+def emit():
+    """
+    Prints this process's spans on one marked line; fleet.py collects them from the output.
+    The spans are handed over, so they are not exported a second time at exit.
+    """
+    print(EMIT_MARKER + json.dumps(spans()), flush=True)
+    clear()
+
+def collect(output):
+    """
+    Splits node output into (output without trace lines, spans found in it).
+    """
+    lines, records = [], []
+    for line in output.splitlines(keepends=True):
+        if line.startswith(EMIT_MARKER):
+            records.extend(json.loads(line[len(EMIT_MARKER):]))
+        else:
+            lines.append(line)
+    return "".join(lines), records
+
+@atexit.register
+def _export_on_exit():
+    path = os.environ.get(TRACE_ENV)
+    if path and _spans:
+        write_jsonl(path)
+
+def main():
+    """
+    summary: list the slowest steps of a trace. chrome: convert a trace for chrome://tracing.
+    """
+    parser = argparse.ArgumentParser(description="Inspect provisioning traces written with PROVISION_TRACE.")
+    parser.add_argument("action", choices=["summary", "chrome"])
+    parser.add_argument("trace", help="JSON lines trace file")
+    parser.add_argument("output", nargs="?", help="Chrome trace file to write")
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+    records = read_jsonl(args.trace)
+    if args.action == "summary":
+        print_summary(records, args.limit)
+    else:
+        write_chrome(args.output or args.trace.rsplit(".", 1)[0] + ".trace.json", records)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import desired_state
+import fleet
+import join
+import packages
+import services
+import waiters
+from command import run_command
+
+# Configuration
+KUBERNETES_PACKAGES = ["kubeadm", "kubelet", "kubectl"]
+DEFAULT_MAX_UNAVAILABLE = 1  # Workers drained at the same time, i.e. the size of a wave
+DRAIN_TIMEOUT = "300s"  # Passed to kubectl drain
+ROLES = ["first-control-plane", "control-plane", "worker"]
+KUBERNETES_SOURCE = "/etc/apt/sources.list.d/kubernetes.list"  # Same file the shell scripts write
+KUBERNETES_KEYRING = "/etc/apt/keyrings/kubernetes-apt-keyring.gpg"
+KUBERNETES_REPOSITORY = "https://pkgs.k8s.io/core:/stable:/{minor}/deb/"  # One repository per minor release
+
+def kubectl(*arguments):
+    return run_command(["kubectl", "--kubeconfig", join.ADMIN_CONF, *arguments])
+
+def kubelet_version(version):
+    """
+    The version a node reports once it runs a package version: 1.31.4-1.1 -> v1.31.4.
+    """
+    return "v" + version.split("-")[0]
+
+def minor_release(version):
+    """
+    The minor release of a package version, which names its repository: 1.31.4-1.1 -> v1.31.
+    """
+    return "v" + ".".join(version.split(".")[:2])
+
+def use_repository(version):
+    """
+    Points apt at the pkgs.k8s.io repository of the version's minor release, with its key,
+    and refreshes the index: the repository of the installed minor does not carry the next one.
+    """
+    url = KUBERNETES_REPOSITORY.format(minor=minor_release(version))
+    source = f"deb [signed-by={KUBERNETES_KEYRING}] {url} /\n"
+    if desired_state.read_file(KUBERNETES_SOURCE) != source:
+        print(f"Switching the Kubernetes repository to {minor_release(version)}...")
+        os.makedirs(os.path.dirname(KUBERNETES_KEYRING), exist_ok=True)
+        with tempfile.NamedTemporaryFile(suffix=".key") as key_file:
+            if run_command(["curl", "-fsSL", "-o", key_file.name, url + "Release.key"]) is None:
+                raise RuntimeError(f"Could not download the key of {url}.")
+            if run_command(["gpg", "--dearmor", "--yes", "-o", KUBERNETES_KEYRING, key_file.name]) is None:
+                raise RuntimeError(f"Could not install the key of {url}.")
+        with open(KUBERNETES_SOURCE + ".tmp", "w") as source_file:
+            source_file.write(source)
+        os.replace(KUBERNETES_SOURCE + ".tmp", KUBERNETES_SOURCE)
+    if not packages.refresh_index(force=True):
+        raise RuntimeError("Could not refresh the package index.")
+
+def node_version(name):
+    return kubectl("get", "node", name, "-o", "jsonpath={.status.nodeInfo.kubeletVersion}")
+
+def installed_version(package="kubelet"):
+    return run_command(["dpkg-query", "-W", "-f=${Version}", package], ignore_errors=True)
+
+def install_versions(names, version):
+    """
+    Moves held packages to a version in one apt transaction and holds them again.
+    """
+    transaction = packages.PackageTransaction()
+    transaction.install(*(f"{name}={version}" for name in names))
+    transaction.hold(*names)
+    if not transaction.commit(allow_held=True):
+        raise RuntimeError(f"Could not install {', '.join(names)} {version}.")
+
+def upgrade_node(version, role):
+    """
+    Runs on the node: kubeadm first, then the control plane components or the node
+    configuration, then kubelet and kubectl. Returns False when the node already runs
+    the version. 'version' is the package version, e.g. 1.31.4-1.1.
+    """
+    if installed_version() == version and installed_version("kubeadm") == version:
+        print(f"Already at {version}. Skipping.")
+        return False
+    use_repository(version)
+    install_versions(["kubeadm"], version)
+    if role == "first-control-plane":
+        command = ["kubeadm", "upgrade", "apply", "-y", kubelet_version(version)]
+    else:
+        command = ["kubeadm", "upgrade", "node"]
+    if run_command(command, stream=True) is None:
+        raise RuntimeError(f"{' '.join(command)} failed.")
+    install_versions(["kubelet", "kubectl"], version)
+    services.daemon_reload()
+    services.restart("kubelet")
+    services.apply()
+    waiters.wait_for_kubelet()
+    return True
+
+def drain(name):
+    if kubectl("cordon", name) is None:
+        raise RuntimeError(f"Could not cordon {name}.")
+    if kubectl("drain", name, "--ignore-daemonsets", "--delete-emptydir-data", f"--timeout={DRAIN_TIMEOUT}") is None:
+        raise RuntimeError(f"Could not drain {name}.")
+
+def uncordon(name):
+    if kubectl("uncordon", name) is None:
+        raise RuntimeError(f"Could not uncordon {name}.")
+
+def upgrade_host(host, version, role, transport):
+    """
+    Cordons and drains a node, upgrades it through the transport and lets workloads back.
+    A node whose kubelet already reports the version is left alone, so a re-run after a
+    partial upgrade drains only the nodes still to do. A node whose upgrade failed stays
+    cordoned for inspection. Returns True when the node was upgraded.
+    """
+    name = join.node_name(host)
+    if node_version(name) == kubelet_version(version):
+        fleet.log(host["name"], f"already at {kubelet_version(version)}, skipped")
+        return False
+    fleet.log(host["name"], "draining ...")
+    drain(name)
+    transport.prepare(host)
+    try:
+        fleet.log(host["name"], f"upgrading to {version} ...")
+        returncode, output = transport.run(host, f"import upgrade\nupgrade.upgrade_node({version!r}, {role!r})")
+    finally:
+        transport.cleanup(host)
+    if returncode != 0:
+        raise RuntimeError(f"Upgrade of {host['name']} failed:\n{output.strip()}")
+    uncordon(name)
+    fleet.log(host["name"], "upgraded")
+    return True
+
+def waves(hosts, max_unavailable):
+    size = max(1, max_unavailable)
+    return [hosts[index:index + size] for index in range(0, len(hosts), size)]
+
+def upgrade_wave(wave, version, role, transport):
+    """
+    Upgrades the nodes of a wave in parallel, then waits until all of them are Ready.
+    """
+    with ThreadPoolExecutor(max_workers=len(wave)) as pool:
+        futures = [pool.submit(upgrade_host, host, version, role, transport) for host in wave]
+        errors = [future.exception() for future in futures if future.exception()]
+    if errors:
+        raise RuntimeError("\n".join(str(error) for error in errors))
+    join.wait_until_ready([join.node_name(host) for host in wave])
+
+def upgrade_cluster(control_planes, workers, version, transport, max_unavailable=DEFAULT_MAX_UNAVAILABLE):
+    """
+    Upgrades the control plane nodes one by one, the first with `kubeadm upgrade apply`,
+    then the workers in waves of max_unavailable. The next wave only starts once the
+    previous one is Ready again, so at most max_unavailable workers are ever out.
+    """
+    for index, host in enumerate(control_planes):
+        upgrade_wave([host], version, "first-control-plane" if index == 0 else "control-plane", transport)
+    worker_waves = waves(workers, max_unavailable)
+    for number, wave in enumerate(worker_waves, 1):
+        print(f"Wave {number}/{len(worker_waves)}: {', '.join(host['name'] for host in wave)}")
+        upgrade_wave(wave, version, "worker", transport)
+
+def main():
+    """
+    Upgrades the cluster from the control plane: upgrade.py 1.31.4-1.1 --max-unavailable 2
+    """
+    parser = argparse.ArgumentParser(description="Upgrade Kubernetes, control plane first, then the workers in waves.")
+    parser.add_argument("version", help="Package version, e.g. 1.31.4-1.1")
+    parser.add_argument("--max-unavailable", type=int, default=DEFAULT_MAX_UNAVAILABLE, help="Workers upgraded at the same time")
+    parser.add_argument("--inventory", default=fleet.DEFAULT_INVENTORY)
+    parser.add_argument("--control-plane-group", default="k8s-master")
+    parser.add_argument("--group", default="k8s-workers")
+    parser.add_argument("--transport", choices=["ssh", "local"], default="ssh")
+    parser.add_argument("--user", default=fleet.DEFAULT_USER)
+    parser.add_argument("--key-file", default=fleet.DEFAULT_KEY_FILE)
+    args = parser.parse_args()
+
+    inventory = fleet.parse_inventory(args.inventory)
+    if args.transport == "local":
+        transport = fleet.LocalTransport()
+    else:
+        transport = fleet.SshTransport(user=args.user, key_file=args.key_file)
+    try:
+        upgrade_cluster(inventory.get(args.control_plane_group, []), inventory.get(args.group, []),
+                        args.version, transport, args.max_unavailable)
+    except (RuntimeError, TimeoutError) as e:
+        print(e)
+        sys.exit(1)
+    print(f"Cluster upgraded to {args.version}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+import argparse
+import ctypes
+import ctypes.util
+import os
+import socket
+import ssl
+import sys
+import time
+import urllib.request
+
+import discovery
+from command import run_command
+from discovery import CONTAINERD_SOCKET, CRIO_SOCKET
+
+# Configuration
+DEFAULT_TIMEOUT = float(os.environ.get("PROVISION_WAIT_TIMEOUT", "120"))  # Seconds before a waiter gives up
+FIRST_DELAY = 0.1  # First pause between two checks, doubled after every miss ...
+MAX_DELAY = 2.0  # ... up to this
+KUBELET_HEALTHZ = "http://127.0.0.1:10248/healthz"
+APISERVER_READYZ = "https://127.0.0.1:6443/readyz"
+TIME_ERROR = 5  # adjtimex() state of a clock that is not synchronised
+
+def wait_for(check, description, timeout=DEFAULT_TIMEOUT, first_delay=FIRST_DELAY, max_delay=MAX_DELAY):
+    """
+    Calls check() until it returns True, backing off exponentially between attempts.
+    Returns the seconds waited; raises TimeoutError once the deadline passes.
+    """
+    started = time.monotonic()
+    deadline = started + timeout
+    delay = first_delay
+    while True:
+        if check():
+            waited = time.monotonic() - started
+            print(f"{description} is ready ({waited:.1f}s).")
+            return waited
+        now = time.monotonic()
+        if now >= deadline:
+            raise TimeoutError(f"{description} is not ready after {timeout:g}s.")
+        time.sleep(min(delay, deadline - now))
+        delay = min(delay * 2, max_delay)
+
+def socket_accepts(socket_path):
+    """
+    True when something accepts connections on the unix socket.
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(1)
+    try:
+        client.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        client.close()
+
+def cri_ready(socket_path):
+    """
+    True when the runtime answers a CRI Version call. The socket is probed first so that
+    crictl only runs once the runtime is listening.
+    """
+    if not socket_accepts(socket_path):
+        return False
+    if not discovery.which("crictl"):
+        return True
+    return run_command(["crictl", "--runtime-endpoint", "unix://" + socket_path, "--timeout", "2s", "version"],
+                       ignore_errors=True) is not None
+
+def http_ok(url):
+    """
+    True when the endpoint answers 200 with body "ok". Certificates are not verified:
+    the endpoints are local and kubeadm's CA may not be trusted yet.
+    """
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    try:
+        with urllib.request.urlopen(url, timeout=2, context=context) as response:
+            return response.status == 200 and response.read().strip() == b"ok"
+    except (OSError, ValueError):
+        return False
+
+def ntp_synchronised():
+    """
+    Asks the kernel through adjtimex() whether the clock is synchronised, as ntpd and
+    chrony report it. No process is spawned.
+    """
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    timex = ctypes.create_string_buffer(512)  # struct timex with modes = 0: read only
+    state = libc.adjtimex(timex)
+    return state not in (-1, TIME_ERROR)
+
+def wait_for_cri(socket_path=None, timeout=DEFAULT_TIMEOUT):
+    """
+    Waits for containerd or CRI-O, whichever socket is given or shows up first.
+    """
+    sockets = [socket_path] if socket_path else [CONTAINERD_SOCKET, CRIO_SOCKET]
+    return wait_for(lambda: any(cri_ready(path) for path in sockets), "Container runtime", timeout)
+
+def wait_for_kubelet(timeout=DEFAULT_TIMEOUT):
+    return wait_for(lambda: http_ok(KUBELET_HEALTHZ), "kubelet", timeout)
+
+def wait_for_apiserver(url=APISERVER_READYZ, timeout=DEFAULT_TIMEOUT):
+    return wait_for(lambda: http_ok(url), "API server", timeout)
+
+def wait_for_ntp_sync(timeout=DEFAULT_TIMEOUT):
+    return wait_for(ntp_synchronised, "NTP synchronisation", timeout)
+
+def main():
+    """
+    Blocks until a dependency is ready, for the shell scripts: waiters.py cri --timeout 60
+    """
+    parser = argparse.ArgumentParser(description="Wait until a node dependency is ready instead of sleeping.")
+    parser.add_argument("what", choices=["cri", "kubelet", "apiserver", "ntp"])
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT)
+    parser.add_argument("--socket", help="CRI socket for 'cri' (default: containerd or CRI-O)")
+    parser.add_argument("--url", default=APISERVER_READYZ, help="readyz URL for 'apiserver'")
+    args = parser.parse_args()
+    try:
+        if args.what == "cri":
+            wait_for_cri(args.socket, args.timeout)
+        elif args.what == "kubelet":
+            wait_for_kubelet(args.timeout)
+        elif args.what == "apiserver":
+            wait_for_apiserver(args.url, args.timeout)
+        else:
+            wait_for_ntp_sync(args.timeout)
+    except TimeoutError as e:
+        print(e)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -22,8 +22,43 @@ KUBERNETES_VERSION="v1.30"
 CRIO_VERSION="v1.30"
 KUBERNETES_INSTALL_VERSION="1.30.0-1.1"
 
-# Set Hostname
 HOSTNAME="k8-controlplane"
+
+STEP_1="$(dirname "$0")/../step_1"
+PREFETCH_DIR="/var/cache/k8-provisions/prefetch"
+
+# Update system packages
+echo "Updating system packages..."
+sudo apt-get update -y
+sudo apt-get upgrade -y
+
+# Install necessary dependencies
+echo "Installing dependencies..."
+sudo apt-get install -y apt-transport-https ca-certificates curl gpg jq software-properties-common
+
+# Add the CRI-O and Kubernetes repositories first, so their packages can download while the node is configured
+echo "Adding the CRI-O and Kubernetes repositories..."
+curl -fsSL https://pkgs.k8s.io/addons:/cri-o:/stable:/$CRIO_VERSION/deb/Release.key | \
+    gpg --dearmor -o /etc/apt/keyrings/cri-o-apt-keyring.gpg
+
+echo "deb [signed-by=/etc/apt/keyrings/cri-o-apt-keyring.gpg] https://pkgs.k8s.io/addons:/cri-o:/stable:/$CRIO_VERSION/deb/ /" | \
+    sudo tee /etc/apt/sources.list.d/cri-o.list
+
+curl -fsSL https://pkgs.k8s.io/core:/stable:/$KUBERNETES_VERSION/deb/Release.key | \
+    gpg --dearmor -o /etc/apt/keyrings/kubernetes-apt-keyring.gpg
+
+echo "deb [signed-by=/etc/apt/keyrings/kubernetes-apt-keyring.gpg] https://pkgs.k8s.io/core:/stable:/$KUBERNETES_VERSION/deb/ /" | \
+    sudo tee /etc/apt/sources.list.d/kubernetes.list
+
+sudo apt-get update -y
+
+# Download the packages in the background; the install below only unpacks them
+echo "Downloading CRI-O, kubelet, kubeadm, and kubectl in the background..."
+sudo python3 "$STEP_1/prefetch.py" --archives "$PREFETCH_DIR" \
+    cri-o kubelet="$KUBERNETES_INSTALL_VERSION" kubectl="$KUBERNETES_INSTALL_VERSION" kubeadm="$KUBERNETES_INSTALL_VERSION" &
+PREFETCH_PID=$!
+
+# Set Hostname
 echo "Setting hostname to '$HOSTNAME'..."
 sudo hostnamectl set-hostname $HOSTNAME
 
@@ -39,14 +74,11 @@ sudo modprobe br_netfilter
 
 # Sysctl params required by setup, params persist across reboots
 echo "Configuring sysctl parameters..."
-cat <<EOF | sudo tee /etc/sysctl.d/k8s.conf
-net.bridge.bridge-nf-call-iptables = 1
-net.bridge.bridge-nf-call-ip6tables = 1
-net.ipv4.ip_forward = 1
-EOF
-
-# Apply sysctl parameters
-sudo sysctl --system
+# Only values that differ are written, no `sysctl --system` reload
+sudo python3 "$STEP_1/sysctl_manager.py" --file /etc/sysctl.d/k8s.conf \
+    net.bridge.bridge-nf-call-iptables=1 \
+    net.bridge.bridge-nf-call-ip6tables=1 \
+    net.ipv4.ip_forward=1
 
 # Disable swap and ensure it remains disabled
 echo "Disabling swap..."
@@ -54,41 +86,24 @@ sudo swapoff -a
 sudo sed -i '/ swap / s/^/#/' /etc/fstab
 (crontab -l 2>/dev/null; echo "@reboot /sbin/swapoff -a") | crontab - || true
 
-# Update system packages
-echo "Updating system packages..."
-sudo apt-get update -y
-sudo apt-get upgrade -y
-
-# Install necessary dependencies
-echo "Installing dependencies..."
-sudo apt-get install -y apt-transport-https ca-certificates curl gpg jq software-properties-common
+# A failed download is not fatal, apt-get install fetches whatever is missing
+if ! wait $PREFETCH_PID; then
+    echo "Background download failed, the install downloads the packages itself."
+fi
 
 # Install CRI-O runtime
 echo "Installing CRI-O runtime..."
-curl -fsSL https://pkgs.k8s.io/addons:/cri-o:/stable:/$CRIO_VERSION/deb/Release.key | \
-    gpg --dearmor -o /etc/apt/keyrings/cri-o-apt-keyring.gpg
-
-echo "deb [signed-by=/etc/apt/keyrings/cri-o-apt-keyring.gpg] https://pkgs.k8s.io/addons:/cri-o:/stable:/$CRIO_VERSION/deb/ /" | \
-    sudo tee /etc/apt/sources.list.d/cri-o.list
-
-sudo apt-get update -y
-sudo apt-get install -y cri-o
-sudo systemctl daemon-reload
-sudo systemctl enable crio --now
-sudo systemctl start crio.service
+sudo apt-get install -y -o Dir::Cache::archives="$PREFETCH_DIR" cri-o
+# Queued, the services are started once kubelet is configured
+sudo python3 "$STEP_1/services.py" daemon-reload
+sudo python3 "$STEP_1/services.py" enable crio
 
 echo "CRI-O runtime installed successfully."
 
 # Install kubelet, kubectl, and kubeadm
 echo "Installing kubelet, kubeadm, and kubectl..."
-curl -fsSL https://pkgs.k8s.io/core:/stable:/$KUBERNETES_VERSION/deb/Release.key | \
-    gpg --dearmor -o /etc/apt/keyrings/kubernetes-apt-keyring.gpg
-
-echo "deb [signed-by=/etc/apt/keyrings/kubernetes-apt-keyring.gpg] https://pkgs.k8s.io/core:/stable:/$KUBERNETES_VERSION/deb/ /" | \
-    sudo tee /etc/apt/sources.list.d/kubernetes.list
-
-sudo apt-get update -y
-sudo apt-get install -y kubelet="$KUBERNETES_INSTALL_VERSION" kubectl="$KUBERNETES_INSTALL_VERSION" kubeadm="$KUBERNETES_INSTALL_VERSION"
+sudo apt-get install -y -o Dir::Cache::archives="$PREFETCH_DIR" \
+    kubelet="$KUBERNETES_INSTALL_VERSION" kubectl="$KUBERNETES_INSTALL_VERSION" kubeadm="$KUBERNETES_INSTALL_VERSION"
 sudo apt-mark hold kubelet kubeadm kubectl
 
 echo "kubelet, kubeadm, and kubectl installed successfully."
@@ -97,8 +112,10 @@ echo "kubelet, kubeadm, and kubectl installed successfully."
 echo "Configuring kubelet with node IP..."
 NODE_IP=$(ip --json addr show ens34 | jq -r '.[0].addr_info[] | select(.family == "inet") | .local')
 echo "KUBELET_EXTRA_ARGS=--node-ip=$NODE_IP" | sudo tee /etc/default/kubelet
-sudo systemctl daemon-reload
-sudo systemctl restart kubelet
+sudo python3 "$STEP_1/services.py" restart kubelet
+
+# One daemon-reload and `systemctl enable --now crio`, then a single kubelet restart
+sudo python3 "$STEP_1/services.py" apply
 
 # Configure DNS
 echo "Configuring DNS to use 172.100.55.2..."
@@ -39,14 +39,11 @@ sudo modprobe br_netfilter
 
 # Sysctl params required by setup, params persist across reboots
 echo "Configuring sysctl parameters..."
-cat <<EOF | sudo tee /etc/sysctl.d/k8s.conf
-net.bridge.bridge-nf-call-iptables = 1
-net.bridge.bridge-nf-call-ip6tables = 1
-net.ipv4.ip_forward = 1
-EOF
-
-# Apply sysctl parameters
-sudo sysctl --system
+# Only values that differ are written, no `sysctl --system` reload
+sudo python3 "$(dirname "$0")/../step_1/sysctl_manager.py" --file /etc/sysctl.d/k8s.conf \
+    net.bridge.bridge-nf-call-iptables=1 \
+    net.bridge.bridge-nf-call-ip6tables=1 \
+    net.ipv4.ip_forward=1
 
 # Disable swap and ensure it remains disabled
 echo "Disabling swap..."
@@ -73,9 +70,9 @@ echo "deb [signed-by=/etc/apt/keyrings/cri-o-apt-keyring.gpg] https://pkgs.k8s.i
 
 sudo apt-get update -y
 sudo apt-get install -y cri-o
-sudo systemctl daemon-reload
-sudo systemctl enable crio --now
-sudo systemctl start crio.service
+# Queued, the services are started once kubelet is configured
+sudo python3 "$(dirname "$0")/../step_1/services.py" daemon-reload
+sudo python3 "$(dirname "$0")/../step_1/services.py" enable crio
 
 echo "CRI-O runtime installed successfully."
 
@@ -97,8 +94,10 @@ echo "kubelet, kubeadm, and kubectl installed successfully."
 echo "Configuring kubelet with node IP..."
 NODE_IP=$(ip --json addr show ens34 | jq -r '.[0].addr_info[] | select(.family == "inet") | .local')
 echo "KUBELET_EXTRA_ARGS=--node-ip=$NODE_IP" | sudo tee /etc/default/kubelet
-sudo systemctl daemon-reload
-sudo systemctl restart kubelet
+sudo python3 "$(dirname "$0")/../step_1/services.py" restart kubelet
+
+# One daemon-reload and `systemctl enable --now crio`, then a single kubelet restart
+sudo python3 "$(dirname "$0")/../step_1/services.py" apply
 
 # Configure DNS
 echo "Configuring DNS to use 172.100.55.2..."
@@ -106,7 +105,8 @@ cat <<EOF | sudo tee /etc/resolv.conf
 nameserver 172.100.55.2
 EOF
 
-# Remove conflicting default routes
+# Remove conflicting default routes. To keep them away on DHCP renewal, declare the adapters
+# with netplan.py instead, e.g. netplan.py ens35:dhcp,no-default-route ens36:dhcp,no-default-route
 echo "Removing conflicting default routes..."
 sudo ip route del default via 192.168.79.1 dev ens35 || true
 sudo ip route del default via 192.168.69.1 dev ens36 || true
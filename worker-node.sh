@@ -3,6 +3,13 @@
 # Exit immediately if a command fails
 set -e
 
+# Where the join token comes from: the URL `join.py serve` prints on the control plane, or a
+# file copied from `join.py write` there. Checked first so a run does not fail only at the join.
+if [ -z "$JOIN_FROM" ]; then
+    echo "Set JOIN_FROM to the URL 'join.py serve' prints on the control plane, or to a 'join.py write' file." >&2
+    exit 1
+fi
+
 
 
 # Clean up any malformed installers
@@ -49,17 +56,18 @@ if [ -f "$RESOLV_FILE" ]; then
     echo "Backup created at ${RESOLV_FILE}.backup"
 fi
 
-# Overwrite resolv.conf with new content
+# Overwrite resolv.conf with new content, the internal resolver first and the fallback after it if it answers
 echo "fixing DNS so that kublet will run without issues"
-cat <<EOF > "$RESOLV_FILE"
-nameserver 172.100.55.2
-nameserver 8.8.4.4
-search albrightlabs.local
-EOF
+NAMESERVERS="$(python3 "$(dirname "$0")/expiremental/manually/step_1/resolvers.py" 172.100.55.2 8.8.4.4 \
+    --search albrightlabs.local)"
+echo "$NAMESERVERS" > "$RESOLV_FILE"
 
 echo "Updated $RESOLV_FILE with new DNS configuration."
-echo "now reloading the dns"
-sudo systemctl restart systemd-resolved
+# Service restarts and enables are queued and applied once, before the runtime is needed;
+# lookups use the resolv.conf written above in the meantime
+SERVICES="$(dirname "$0")/expiremental/manually/step_1/services.py"
+echo "queueing the dns restart"
+sudo python3 "$SERVICES" restart systemd-resolved
 
 
 # Disable swap (Kubernetes requires swap to be off)
@@ -85,12 +93,9 @@ grep '/swap.img' /etc/fstab
 # echo "Verify the setting .... it should equal 1"
 # cat /proc/sys/net/ipv4/ip_forward
 # sysctl params required by setup, params persist across reboots
-cat <<EOF | sudo tee /etc/sysctl.d/k8s.conf
-net.ipv4.ip_forward = 1
-EOF
-
-# Apply sysctl params without reboot
-sudo sysctl --system
+# Applied without reboot: only values that differ are written, no `sysctl --system` reload
+sudo python3 "$(dirname "$0")/expiremental/manually/step_1/sysctl_manager.py" --file /etc/sysctl.d/k8s.conf \
+    net.ipv4.ip_forward=1
 
 # Verify that net.ipv4.ip_forward is set to 1 with
 sysctl net.ipv4.ip_forward
@@ -125,10 +130,9 @@ sed 's/SystemdCgroup = false/SystemdCgroup = true/' | \
 sed 's/sandbox_image = "registry.k8s.io\/pause:3.6"/sandbox_image = "registry.k8s.io\/pause:3.10"/' | \
 sudo tee /etc/containerd/config.toml
 
-# Now restart containerD to ensure it is working
-sudo systemctl restart containerd
-sudo systemctl status containerd
-sudo systemctl enable containerd
+# Restart containerD for its new configuration, together with the other queued services
+sudo python3 "$SERVICES" restart containerd
+sudo python3 "$SERVICES" enable containerd
 
 
 # # This script checks if /etc/crictl.yaml exists. If it doesn't, the script creates the file with the initial content.
@@ -164,10 +168,15 @@ sudo apt-get update
 K8S_VERSION="1.31.4-1.1"  # most stable kubernetes version that works wirh calico 
 sudo apt-get install -y kubelet=$K8S_VERSION kubeadm=$K8S_VERSION kubectl=$K8S_VERSION
 sudo apt-mark hold kubelet kubeadm kubectl
-sudo systemctl enable --now kubelet
+sudo python3 "$SERVICES" enable kubelet
+
+# One `systemctl enable --now containerd kubelet`, then systemd-resolved and containerd restarted once each, in that order
+sudo python3 "$SERVICES" apply
+sudo systemctl status containerd
 
-# We need to restart all services
-sleep 3
+# Wait for the container runtime to answer CRI calls instead of a fixed sleep
+WAITERS="$(dirname "$0")/expiremental/manually/step_1/waiters.py"
+sudo python3 "$WAITERS" cri --socket /run/containerd/containerd.sock
 echo "you should say yes to restarting all services"
 
 
@@ -190,8 +199,8 @@ sudo kubeadm config images pull --kubernetes-version=$K8S_VERS
 # 	--discovery-token-ca-cert-hash sha256:fcf0da56bf564a19b7e4bf02fda824c85b5d301cb7c21e0b90c3eca02214a448 
 
 
-#################################### YOu need to Reboot cause nothing really will work on the next steps #################
-# sudo reboot
+# No reboot needed: after the join, continue as soon as kubelet is up
+# sudo python3 "$WAITERS" kubelet
 
 # # Fixing the kube-system not seeing the needed files
 # sudo kubeadm init phase kubelet-start
@@ -204,9 +213,8 @@ sudo kubeadm config images pull --kubernetes-version=$K8S_VERS
 # sudo systemctl restart kubelet
 
 
-# Join the cluster
-kubeadm join 172.100.55.20:6443 --token pdgak2.ugmiou5yk80y4xmn \
-	--discovery-token-ca-cert-hash sha256:1fae35e1de806cda88758d375bbb6942857ad882e5149651632771abb3acdeeb 
+# Join the cluster with the token the control plane shares (`join.py serve` there, or a copied `join.py write` file)
+sudo python3 "$(dirname "$0")/expiremental/manually/step_1/join.py" join --from "$JOIN_FROM"
 
  
 # Set up kubeconfig for the current user